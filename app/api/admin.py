@@ -0,0 +1,50 @@
+"""管理 API（需要 ADMIN_EMAILS 中的用户）
+
+多 worker 部署时每个请求只会落到其中一个 worker，返回的是该 worker 的数据（响应头 X-Worker-Pid）。
+"""
+
+import asyncio
+import os
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.core.loop_monitor import ProfilerBusyError, loop_monitor, profiler
+from app.models.user import User
+from app.utils.auth import get_admin_user
+
+router = APIRouter(prefix="/admin", tags=["管理"])
+
+
+@router.get("/loop")
+async def get_loop_stats(current_user: User = Depends(get_admin_user)):
+    """当前 worker 的事件循环调度滞后与阻塞次数"""
+    return {"pid": os.getpid(), **loop_monitor.stats()}
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS, description="采样时长（秒）"),
+    interval_ms: float = Query(5, ge=1, le=100, description="采样间隔（毫秒）"),
+    all_threads: bool = Query(False, description="同时采样线程池等其他线程（默认只采样事件循环线程）"),
+    current_user: User = Depends(get_admin_user),
+):
+    """对当前 worker 采样，返回 collapsed 格式的调用栈（可直接交给 flamegraph.pl 或 speedscope）"""
+    # 在事件循环线程中取得线程 ID，采样本身在线程池中进行，不阻塞事件循环
+    thread_id = None if all_threads else threading.get_ident()
+    logger.info("profile_started", user_id=str(current_user.id), seconds=seconds, all_threads=all_threads)
+    try:
+        collapsed = await asyncio.to_thread(profiler.profile, seconds, interval_ms / 1000, thread_id)
+    except ProfilerBusyError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="已有采样正在进行")
+    pid = os.getpid()
+    return PlainTextResponse(
+        collapsed,
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{pid}.collapsed"',
+            "X-Worker-Pid": str(pid),
+        },
+    )
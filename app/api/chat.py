@@ -1,51 +1,136 @@
 """聊天 API"""
 
+import asyncio
+import json
 import uuid
-from uuid import UUID
+from functools import partial
+from typing import Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
+from app.core.config import settings
+from app.core.drain import StreamCutOff, drain
+from app.core.langgraph.export import ExportBusyError
 from app.core.langgraph.graph import agent
+from app.core.langgraph.session_lock import SessionBusyError
 from app.core.logging import logger
+from app.models.idempotency import IdempotencyKey
+from app.models.job import Job
 from app.models.user import User
 from app.schemas.chat import (
     ChatRequest,
     ChatResponse,
     HistoryResponse,
-    SessionItem,
+    PurgeRequest,
+    PurgeResponse,
+    SearchHitItem,
+    SearchResponse,
     SessionsResponse,
 )
 from app.services.database import db
-from app.utils.auth import get_current_user
+from app.services.idempotency import IdempotencyConflictError, idempotency
+from app.services.invalidation import invalidation_bus
+from app.services.jobs import JobContext, JobQueueFullError, job_runner
+from app.utils.auth import get_current_user, get_quota_user
+from app.utils.responses import json_bytes_response
+from app.utils.singleflight import SingleFlight
 
 router = APIRouter(prefix="/chat", tags=["聊天"])
 
+# 会话列表：缓存（创建、删除、清除会话时经 InvalidationBus 在所有 worker 上失效）+ 合并并发查询
+_session_lists = SingleFlight(
+    "session_list",
+    cache=invalidation_bus.cache(
+        "sessions", max_size=settings.SESSION_LIST_CACHE_SIZE, ttl=settings.SESSION_LIST_CACHE_TTL
+    ),
+)
+invalidation_bus.subscribe("sessions", _session_lists.invalidate)
+
 
 @router.get("/sessions", response_model=SessionsResponse)
 async def get_sessions(
     current_user: User = Depends(get_current_user),
+    accept_encoding: Optional[str] = Header(None),
 ):
     """获取用户的所有会话列表"""
     try:
-        sessions = db.get_user_sessions(current_user.id)
-        return SessionsResponse(
-            sessions=[SessionItem(id=str(s.id), title=s.title) for s in sessions]
+        # 在线程池中查询，同一用户的并发请求共享一次查询
+        sessions = await _session_lists.do(
+            str(current_user.id), partial(asyncio.to_thread, db.list_user_sessions, current_user.id)
         )
     except Exception as e:
         logger.error("get_sessions_failed", error=str(e))
         raise HTTPException(status_code=500, detail="获取会话列表失败")
+    # 直接序列化为 bytes，跳过 response_model 的校验和二次序列化
+    body = orjson.dumps({
+        "sessions": [{"id": session_id, "title": title} for session_id, title in sessions]
+    })
+    return json_bytes_response(body, accept_encoding)
+
+
+def _session_busy(session_id: str) -> HTTPException:
+    """会话忙时的 409 响应"""
+    logger.info("chat_session_busy", session_id=session_id)
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="该会话正在处理上一条消息",
+    )
+
+
+def _claim_idempotency_key(
+    key: str,
+    request: ChatRequest,
+    current_user: User,
+    session_id: str,
+) -> Tuple[IdempotencyKey, bool]:
+    """占用幂等键，key 与请求内容不匹配时返回 422"""
+    try:
+        return idempotency.claim(
+            user_id=current_user.id,
+            key=key,
+            request_hash=idempotency.fingerprint(request.message, request.session_id),
+            session_id=session_id,
+        )
+    except IdempotencyConflictError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key 已被用于其他请求",
+        )
+
+
+async def _wait_for_duplicate(key: str, current_user: User) -> IdempotencyKey:
+    """等待首次请求完成，返回其记录"""
+    record = await idempotency.wait_for_result(current_user.id, key)
+    if record is None or record.status != "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="相同 Idempotency-Key 的请求仍在处理中或已失败，请稍后重试",
+        )
+    return record
 
 
-@router.post("", response_model=ChatResponse)
+@router.post("", response_model=ChatResponse, dependencies=[Depends(drain.ensure_accepting)])
 async def chat(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_quota_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
 ):
     """发送消息并获取回复"""
     is_new_session = request.session_id is None
     session_id = request.session_id or str(uuid.uuid4())
 
+    record = None
+    if idempotency_key:
+        record, created = _claim_idempotency_key(
+            idempotency_key, request, current_user, session_id
+        )
+        if not created:
+            record = await _wait_for_duplicate(idempotency_key, current_user)
+            return ChatResponse(message=record.response, session_id=record.session_id)
+
     try:
         # 如果是新会话，先创建会话记录
         if is_new_session:
@@ -68,72 +153,227 @@ async def chat(
             user_id=str(current_user.id),
         )
 
+        if record is not None:
+            idempotency.complete(record, response)
         return ChatResponse(message=response, session_id=session_id)
 
+    except SessionBusyError:
+        if record is not None:
+            idempotency.release(record)
+        raise _session_busy(session_id)
     except Exception as e:
         logger.error("chat_failed", error=str(e))
+        if record is not None:
+            idempotency.release(record)
         raise HTTPException(status_code=500, detail="聊天处理失败")
 
 
-@router.post("/stream")
+def _sse_response(body, session_id: str, background: Optional[BackgroundTask] = None):
+    """构造 SSE 响应"""
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        background=background,
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Session-ID": session_id,
+        },
+    )
+
+
+async def _replay_stream(record: IdempotencyKey):
+    """以 SSE 格式回放已完成的结果"""
+    yield f"data: session_id:{record.session_id}\n\n"
+    yield f"data: {record.response}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@router.post("/stream", dependencies=[Depends(drain.ensure_accepting)])
 async def chat_stream(
     request: ChatRequest,
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_quota_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
 ):
     """流式聊天"""
     is_new_session = request.session_id is None
     session_id = request.session_id or str(uuid.uuid4())
 
-    # 如果是新会话，先创建会话记录
-    if is_new_session:
-        title = request.message[:30] if len(request.message) > 30 else request.message
-        db.create_chat_session(
-            user_id=current_user.id,
-            session_id=session_id,
-            title=title,
+    record = None
+    if idempotency_key:
+        record, created = _claim_idempotency_key(
+            idempotency_key, request, current_user, session_id
         )
+        if not created:
+            # 同一 worker 上仍在生成：订阅进行中的流
+            inflight = idempotency.get_stream(current_user.id, idempotency_key)
+            if inflight is not None:
+                return _sse_response(inflight.subscribe(), record.session_id)
+            record = await _wait_for_duplicate(idempotency_key, current_user)
+            return _sse_response(_replay_stream(record), record.session_id)
+
+    try:
+        # 如果是新会话，先创建会话记录
+        if is_new_session:
+            title = request.message[:30] if len(request.message) > 30 else request.message
+            db.create_chat_session(
+                user_id=current_user.id,
+                session_id=session_id,
+                title=title,
+            )
+        # 在返回流之前获取会话锁，忙时才能返回 409
+        lease = await agent.session_locks.acquire(session_id)
+    except SessionBusyError:
+        if record is not None:
+            idempotency.release(record)
+        raise _session_busy(session_id)
+    except Exception as e:
+        # 释放 key，否则使用同一 Idempotency-Key 的重试会一直等到认领超时
+        logger.error("chat_stream_start_failed", error=str(e))
+        if record is not None:
+            idempotency.release(record)
+        raise HTTPException(status_code=500, detail="聊天处理失败")
+
+    inflight = None
+    if record is not None:
+        inflight = idempotency.open_stream(current_user.id, idempotency_key)
+
+    started = False
 
     async def generate():
-        # 先发送 session_id
-        yield f"data: session_id:{session_id}\n\n"
+        nonlocal started
+        started = True
+        tokens = []
+        finished = False
+
+        def emit(chunk: str) -> str:
+            if inflight is not None:
+                inflight.publish(chunk)
+            return chunk
+
         try:
-            async for token in agent.chat_stream(
+            # 先发送 session_id（放在 try 内：客户端在此处断开也要释放幂等键）
+            yield emit(f"data: session_id:{session_id}\n\n")
+            async for token in drain.guard(agent.chat_stream(
                 message=request.message,
                 session_id=session_id,
                 user_id=str(current_user.id),
-            ):
-                yield f"data: {token}\n\n"
-            yield "data: [DONE]\n\n"
+                lease=lease,
+            )):
+                tokens.append(token)
+                yield emit(f"data: {token}\n\n")
+            yield emit("data: [DONE]\n\n")
+            finished = True
+        except StreamCutOff:
+            yield emit("data: [ERROR] 服务正在重启，请重试\n\n")
         except Exception as e:
             logger.error("stream_failed", error=str(e))
-            yield f"data: [ERROR] {str(e)}\n\n"
+            yield emit(f"data: [ERROR] {str(e)}\n\n")
+        finally:
+            if record is not None:
+                idempotency.close_stream(current_user.id, idempotency_key)
+                # 出错或客户端中途断开都不记录结果，允许重试重新生成
+                if finished:
+                    idempotency.complete(record, "".join(tokens))
+                else:
+                    idempotency.release(record)
 
-    return StreamingResponse(
-        generate(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Session-ID": session_id,
-        },
-    )
+    async def cleanup() -> None:
+        """流未开始就断开时兜底释放会话锁（release 可重复调用）和幂等键"""
+        await lease.release()
+        if record is not None and not started:
+            idempotency.close_stream(current_user.id, idempotency_key)
+            idempotency.release(record)
+
+    return _sse_response(generate(), session_id, background=BackgroundTask(cleanup))
 
 
 @router.get("/history/{session_id}", response_model=HistoryResponse)
 async def get_history(
     session_id: str,
     current_user: User = Depends(get_current_user),
+    accept_encoding: Optional[str] = Header(None),
 ):
     """获取对话历史"""
     try:
-        messages = await agent.get_history(session_id)
-        return HistoryResponse(
-            session_id=session_id,
-            messages=[m.model_dump() for m in messages]
-        )
+        messages = await agent.get_history_rows(session_id)
     except Exception as e:
         logger.error("get_history_failed", error=str(e))
         raise HTTPException(status_code=500, detail="获取历史失败")
+    body = orjson.dumps({"session_id": session_id, "messages": messages})
+    return json_bytes_response(body, accept_encoding)
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200, description="关键词"),
+    limit: int = Query(20, ge=1, le=settings.MESSAGE_SEARCH_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+):
+    """检索当前用户的历史消息，按相关度排序分页返回
+
+    少于 3 个字符的关键词无法使用三元组索引，会退化为该用户范围内的扫描。
+    """
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="关键词不能为空")
+    try:
+        hits, has_more = await agent.message_index.search(str(current_user.id), query, limit, offset)
+    except Exception as e:
+        logger.error("search_messages_failed", error=str(e))
+        raise HTTPException(status_code=500, detail="检索失败")
+    return SearchResponse(
+        query=query,
+        results=[
+            SearchHitItem(
+                session_id=hit.session_id,
+                role=hit.role,
+                snippet=hit.snippet,
+                score=hit.score,
+                created_at=hit.created_at,
+            )
+            for hit in hits
+        ],
+        has_more=has_more,
+    )
+
+
+@router.get("/export", dependencies=[Depends(drain.ensure_accepting)])
+async def export_conversations(
+    memories: bool = Query(False, description="同时导出长期记忆"),
+    current_user: User = Depends(get_current_user),
+):
+    """以 NDJSON 流式导出当前用户的全部会话（逐批读取，内存占用与会话数无关）
+
+    末行为 {"type": "summary", ...}，没有末行说明导出被中断。
+    """
+    lines = agent.exporter.export(str(current_user.id), include_memories=memories)
+    try:
+        # 取首行时占用导出名额，超出上限在开始响应前返回 429
+        first = await anext(lines)
+    except ExportBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="进行中的导出过多，请稍后重试",
+        )
+
+    async def generate():
+        try:
+            yield first
+            async for line in drain.guard(lines):
+                yield line
+        except StreamCutOff:
+            yield orjson.dumps({"type": "error", "detail": "服务正在重启，请重试"}) + b"\n"
+        except Exception as e:
+            logger.error("export_failed", user_id=str(current_user.id), error=str(e))
+            yield orjson.dumps({"type": "error", "detail": "导出失败"}) + b"\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'},
+    )
 
 
 @router.delete("/history/{session_id}")
@@ -141,13 +381,72 @@ async def clear_history(
     session_id: str,
     current_user: User = Depends(get_current_user),
 ):
-    """清除对话历史"""
+    """清除对话历史（检查点与会话记录在同一事务中删除）"""
     try:
-        # 删除 LangGraph 的会话历史
-        await agent.clear_history(session_id)
-        # 删除数据库中的会话记录
-        db.delete_chat_session(UUID(session_id))
-        return {"message": "历史已清除"}
+        purged = await agent.purger.purge([session_id], user_id=str(current_user.id))
     except Exception as e:
         logger.error("clear_history_failed", error=str(e))
-        raise HTTPException(status_code=500, detail="清除历史失败")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="清除历史失败")
+    if not purged:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="会话不存在")
+    return {"message": "历史已清除"}
+
+
+@job_runner.register("purge")
+async def run_purge_job(job: Job, context: JobContext) -> dict:
+    """分块清除会话，每块完成后上报进度"""
+    payload = json.loads(job.payload)
+    user_id = str(job.user_id)
+    purged = await agent.purger.purge_in_chunks(
+        user_id,
+        payload.get("session_ids"),
+        progress=lambda done, total: context.emit("progress", {"purged": done, "total": total}),
+    )
+    if payload.get("memories"):
+        await agent.forget_user_memories(user_id)
+        context.emit("memories_deleted")
+    return {"purged": purged}
+
+
+@router.post("/history/purge", response_model=PurgeResponse)
+async def purge_history(
+    request: PurgeRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+):
+    """批量清除会话
+
+    会话数不超过 PURGE_SYNC_LIMIT 时在一个事务中同步删除；
+    清除全部会话或数量更多时转为后台任务，返回 202 和任务 ID。
+    """
+    if not request.all and not request.session_ids:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="请指定要清除的会话")
+
+    if request.all or len(request.session_ids) > settings.PURGE_SYNC_LIMIT:
+        try:
+            job = await job_runner.submit(
+                user_id=current_user.id,
+                kind="purge",
+                payload={
+                    "session_ids": None if request.all else request.session_ids,
+                    "memories": request.memories,
+                },
+            )
+        except JobQueueFullError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="任务队列已满，请稍后重试",
+                headers={"Retry-After": "5"},
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return PurgeResponse(job_id=str(job.id))
+
+    user_id = str(current_user.id)
+    try:
+        purged = await agent.purger.purge(request.session_ids, user_id=user_id)
+        if request.memories:
+            await agent.forget_user_memories(user_id)
+    except Exception as e:
+        logger.error("purge_history_failed", error=str(e))
+        raise HTTPException(status_code=500, detail="清除历史失败")
+    return PurgeResponse(purged=len(purged))
@@ -0,0 +1,215 @@
+"""WebSocket 聊天接口
+
+一个连接只认证一次，可同时进行多个会话的流式对话。
+
+客户端 → 服务端:
+    {"op": "auth", "token": "..."}                      # 未在 URL 中携带 ?token= 时的第一帧
+    {"op": "chat", "s": "<session_id 或 null>", "id": "<客户端引用>", "m": "消息"}
+    {"op": "cancel", "s": "<session_id>"}
+    {"op": "ping"}
+
+服务端 → 客户端（均带会话 ID "s"）:
+    {"t": "open", "s", "id"}           # 本轮开始，新会话时返回分配的 ID
+    {"t": "tok", "s", "d"}             # 文本片段
+    {"t": "tool", "s", "n", "a"}       # 工具调用
+    {"t": "res", "s", "n", "d"}        # 工具结果
+    {"t": "done", "s"} / {"t": "cancelled", "s"} / {"t": "err", "s", "c", "d"}
+    {"t": "pong"}
+"""
+
+import asyncio
+import uuid
+from typing import Dict, Optional
+
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.drain import StreamCutOff, drain
+from app.core.langgraph.graph import agent
+from app.core.langgraph.session_lock import SessionBusyError
+from app.core.logging import logger
+from app.models.user import User
+from app.services.database import db
+from app.services.usage import QuotaExceededError, usage_ledger
+from app.utils.auth import authenticate_token
+
+router = APIRouter(prefix="/chat", tags=["聊天"])
+
+# 认证失败的关闭码
+WS_UNAUTHORIZED = 4401
+
+
+def _event_frame(session_id: str, event: dict) -> dict:
+    """把 chat_stream 事件转换为紧凑帧"""
+    kind = event["type"]
+    if kind == "token":
+        return {"t": "tok", "s": session_id, "d": event["content"]}
+    if kind == "tool_call":
+        return {"t": "tool", "s": session_id, "n": event["name"], "a": event["args"]}
+    return {"t": "res", "s": session_id, "n": event["name"], "d": event["content"]}
+
+
+class ChatConnection:
+    """单个 WebSocket 连接上的多路会话"""
+
+    def __init__(self, websocket: WebSocket, user: User):
+        self.websocket = websocket
+        self.user = user
+        # 有界发送队列：客户端读得慢时生成方在 put 处等待
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.turns: Dict[str, asyncio.Task] = {}
+
+    async def send(self, frame: dict) -> None:
+        await self.outbox.put(orjson.dumps(frame).decode())
+
+    async def sender(self) -> None:
+        """唯一的发送者，按顺序写出帧"""
+        while True:
+            frame = await self.outbox.get()
+            await asyncio.wait_for(self.websocket.send_text(frame), settings.WS_SEND_TIMEOUT)
+
+    async def receiver(self) -> None:
+        """读取客户端指令"""
+        while True:
+            raw = await self.websocket.receive_text()
+            try:
+                data = orjson.loads(raw)
+                op = data["op"]
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                await self.send({"t": "err", "s": None, "c": 400, "d": "无效的消息格式"})
+                continue
+
+            if op == "chat":
+                await self.start_turn(data)
+            elif op == "cancel":
+                task = self.turns.get(data.get("s"))
+                if task is not None:
+                    task.cancel()
+            elif op == "ping":
+                await self.send({"t": "pong"})
+            else:
+                await self.send({"t": "err", "s": None, "c": 400, "d": f"未知操作: {op}"})
+
+    async def start_turn(self, data: dict) -> None:
+        message = data.get("m")
+        session_id = data.get("s")
+        if not message:
+            await self.send({"t": "err", "s": session_id, "c": 400, "d": "消息不能为空"})
+            return
+        if session_id in self.turns:
+            await self.send({"t": "err", "s": session_id, "c": 409, "d": "该会话正在处理上一条消息"})
+            return
+        if drain.draining:
+            await self.send({"t": "err", "s": session_id, "c": 503, "d": "服务正在重启，请稍后重试"})
+            return
+        if len(self.turns) >= settings.WS_MAX_SESSIONS:
+            await self.send({"t": "err", "s": session_id, "c": 429, "d": "同时进行的会话过多"})
+            return
+        try:
+            # 用户首次出现时会查询数据库
+            await asyncio.to_thread(usage_ledger.check, self.user.id)
+        except QuotaExceededError as e:
+            await self.send({"t": "err", "s": session_id, "c": 429, "d": e.detail})
+            return
+
+        if session_id is None:
+            new_session_id = str(uuid.uuid4())
+            try:
+                await asyncio.to_thread(
+                    db.create_chat_session,
+                    user_id=self.user.id,
+                    session_id=new_session_id,
+                    title=message[:30],
+                )
+            except Exception as e:
+                # 只让这一轮失败，不影响同一连接上的其他会话
+                logger.error("ws_create_session_failed", user_id=str(self.user.id), error=str(e))
+                await self.send({"t": "err", "s": None, "id": data.get("id"), "c": 500, "d": "创建会话失败"})
+                return
+            session_id = new_session_id
+
+        self.turns[session_id] = asyncio.create_task(
+            self.run_turn(session_id, message, data.get("id"))
+        )
+
+    async def run_turn(self, session_id: str, message: str, ref: Optional[str]) -> None:
+        lease = None
+        try:
+            await self.send({"t": "open", "s": session_id, "id": ref})
+            lease = await agent.session_locks.acquire(session_id)
+            async for event in drain.guard(agent.chat_stream(
+                message=message,
+                session_id=session_id,
+                user_id=str(self.user.id),
+                lease=lease,
+                events=True,
+            )):
+                await self.send(_event_frame(session_id, event))
+            await self.send({"t": "done", "s": session_id})
+        except StreamCutOff:
+            await self.send({"t": "err", "s": session_id, "c": 503, "d": "服务正在重启，请重试"})
+        except asyncio.CancelledError:
+            logger.info("ws_turn_cancelled", session_id=session_id, user_id=str(self.user.id))
+            try:
+                self.outbox.put_nowait(orjson.dumps({"t": "cancelled", "s": session_id}).decode())
+            except asyncio.QueueFull:
+                pass
+            raise
+        except SessionBusyError:
+            await self.send({"t": "err", "s": session_id, "c": 409, "d": "该会话正在处理上一条消息"})
+        except Exception as e:
+            logger.error("ws_turn_failed", session_id=session_id, error=str(e))
+            await self.send({"t": "err", "s": session_id, "c": 500, "d": str(e)})
+        finally:
+            if lease is not None:
+                await lease.release()
+            self.turns.pop(session_id, None)
+
+    async def close(self) -> None:
+        """取消所有进行中的会话"""
+        tasks = list(self.turns.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _authenticate(websocket: WebSocket, token: Optional[str]) -> Optional[User]:
+    """使用 URL 中的 token，或等待第一帧 auth 消息"""
+    if token is None:
+        try:
+            raw = await asyncio.wait_for(websocket.receive_text(), settings.WS_AUTH_TIMEOUT)
+            data = orjson.loads(raw)
+            if data.get("op") == "auth":
+                token = data.get("token")
+        except (asyncio.TimeoutError, orjson.JSONDecodeError, AttributeError):
+            return None
+    return authenticate_token(token) if token else None
+
+
+@router.websocket("/ws")
+async def chat_ws(websocket: WebSocket, token: Optional[str] = None):
+    """WebSocket 多路流式聊天"""
+    await websocket.accept()
+    user = await _authenticate(websocket, token)
+    if user is None:
+        await websocket.close(code=WS_UNAUTHORIZED, reason="无效的认证令牌")
+        return
+
+    connection = ChatConnection(websocket, user)
+    logger.info("ws_connected", user_id=str(user.id))
+    sender = asyncio.create_task(connection.sender())
+    receiver = asyncio.create_task(connection.receiver())
+    try:
+        # 任一方向结束（断开、发送超时）即关闭连接
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                logger.warning("ws_connection_closed", user_id=str(user.id), error=repr(error))
+    finally:
+        sender.cancel()
+        receiver.cancel()
+        await connection.close()
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+        logger.info("ws_disconnected", user_id=str(user.id))
@@ -0,0 +1,134 @@
+"""后台任务 API
+
+长时间的工具调用链不受负载均衡器请求超时限制：提交后立即返回任务 ID，
+之后轮询状态或订阅事件流获取结果。
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from app.core.drain import drain
+from app.core.langgraph.graph import agent
+from app.core.logging import logger
+from app.models.job import Job
+from app.models.user import User
+from app.schemas.chat import ChatRequest
+from app.schemas.job import JobStatusResponse, JobSubmitResponse
+from app.services.database import db
+from app.services.jobs import JobContext, JobQueueFullError, job_runner
+from app.utils.auth import get_current_user, get_quota_user
+
+router = APIRouter(prefix="/jobs", tags=["任务"])
+
+
+@job_runner.register("chat")
+async def run_chat_job(job: Job, context: JobContext) -> dict:
+    """执行一轮对话：文本片段作为 delta 事件，工具调用和结果原样上报"""
+    payload = json.loads(job.payload)
+    tokens = []
+    async for event in agent.chat_stream(
+        message=payload["message"],
+        session_id=job.session_id,
+        user_id=str(job.user_id),
+        events=True,
+    ):
+        if event["type"] == "token":
+            tokens.append(event["content"])
+            context.emit("delta", event["content"])
+        else:
+            context.emit(event["type"], {k: v for k, v in event.items() if k != "type"})
+    return {"message": "".join(tokens), "session_id": job.session_id}
+
+
+async def _get_own_job(job_id: UUID, current_user: User) -> Job:
+    job = await job_runner.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="任务不存在或已过期")
+    return job
+
+
+@router.post(
+    "/chat",
+    response_model=JobSubmitResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(drain.ensure_accepting)],
+)
+async def submit_chat_job(
+    request: ChatRequest,
+    current_user: User = Depends(get_quota_user),
+):
+    """提交一轮对话作为后台任务"""
+    session_id = request.session_id or str(uuid.uuid4())
+    if request.session_id is None:
+        title = request.message[:30] if len(request.message) > 30 else request.message
+        await asyncio.to_thread(
+            db.create_chat_session,
+            user_id=current_user.id,
+            session_id=session_id,
+            title=title,
+        )
+
+    try:
+        job = await job_runner.submit(
+            user_id=current_user.id,
+            kind="chat",
+            payload={"message": request.message},
+            session_id=session_id,
+        )
+    except JobQueueFullError:
+        logger.warning("job_queue_full", user_id=str(current_user.id))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="任务队列已满，请稍后重试",
+            headers={"Retry-After": "5"},
+        )
+    return JobSubmitResponse(job_id=str(job.id), status=job.status, session_id=session_id)
+
+
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+):
+    """查询任务状态和结果"""
+    job = await _get_own_job(job_id, current_user)
+    return JobStatusResponse(
+        job_id=str(job.id),
+        kind=job.kind,
+        status=job.status,
+        session_id=job.session_id,
+        result=json.loads(job.result) if job.result is not None else None,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: UUID,
+    current_user: User = Depends(get_current_user),
+    last_event_id: Optional[int] = Header(None, alias="Last-Event-ID"),
+):
+    """以 SSE 订阅任务事件，断线后可通过 Last-Event-ID 续传"""
+    await _get_own_job(job_id, current_user)
+
+    async def generate():
+        async for event in job_runner.events(job_id, after_seq=last_event_id or 0):
+            yield f"id: {event.seq}\nevent: {event.type}\ndata: {event.data}\n\n"
+        job = await asyncio.to_thread(db.get_job, job_id)
+        final = {"status": job.status, "error": job.error} if job else {"status": "expired"}
+        yield f"event: end\ndata: {json.dumps(final, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    )
@@ -0,0 +1,20 @@
+"""用量 API"""
+
+from fastapi import APIRouter, Depends
+
+from app.models.user import User
+from app.schemas.usage import UsagePeriod, UsageResponse
+from app.services.usage import usage_ledger
+from app.utils.auth import get_current_user
+
+router = APIRouter(prefix="/usage", tags=["用量"])
+
+
+@router.get("", response_model=UsageResponse)
+def get_usage(current_user: User = Depends(get_current_user)):
+    """获取当前用户的 token 用量与配额（其他 worker 的用量最多滞后两个刷写周期）"""
+    day_used, month_used = usage_ledger.usage(current_user.id)
+    return UsageResponse(
+        daily=UsagePeriod(used=day_used, limit=usage_ledger.daily_limit or None),
+        monthly=UsagePeriod(used=month_used, limit=usage_ledger.monthly_limit or None),
+    )
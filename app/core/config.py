@@ -2,6 +2,7 @@ import os
 from enum import Enum
 from pathlib import Path
 from typing import List
+from urllib.parse import quote_plus
 
 from dotenv import load_dotenv
 
@@ -89,12 +90,48 @@ class Settings:
         self.POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
         self.POSTGRES_POOL_SIZE = int(os.getenv("POSTGRES_POOL_SIZE", "10"))
         self.POSTGRES_MAX_OVERFLOW = int(os.getenv("POSTGRES_MAX_OVERFLOW", "5"))
+        # 只读副本（可选，postgresql:// DSN）：纯读取在副本可用时走副本
+        self.POSTGRES_REPLICA_URL = os.getenv("POSTGRES_REPLICA_URL", "")
+        # 复制延迟超过该值（秒）时回退主库
+        self.REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+        self.REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+        # 写入后多少秒内相关用户 / 会话固定读主库
+        self.REPLICA_PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
 
         # Ollama 配置
         self.OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        # 多个 Ollama 后端（逗号分隔），未设置时只使用 OLLAMA_BASE_URL
+        self.OLLAMA_BASE_URLS = parse_list_from_env("OLLAMA_BASE_URLS", [self.OLLAMA_BASE_URL])
+        self.OLLAMA_HEALTH_CHECK_INTERVAL = float(os.getenv("OLLAMA_HEALTH_CHECK_INTERVAL", "10"))
+        # 连续失败多少次后摘除后端
+        self.OLLAMA_MAX_FAILURES = int(os.getenv("OLLAMA_MAX_FAILURES", "2"))
+        # 会话固定的后端比最空闲后端多出这么多进行中请求时，改走最空闲后端
+        self.OLLAMA_AFFINITY_MAX_SKEW = int(os.getenv("OLLAMA_AFFINITY_MAX_SKEW", "4"))
         self.DEFAULT_LLM_MODEL = os.getenv("DEFAULT_LLM_MODEL", "qwen:7b")
         self.DEFAULT_LLM_TEMPERATURE = float(os.getenv("DEFAULT_LLM_TEMPERATURE", "0.7"))
         self.MAX_TOKENS = int(os.getenv("MAX_TOKENS", "4096"))
+        # 模型梯队（逗号分隔，从小到大），多于一个时按轮次难度路由
+        self.LLM_MODEL_TIERS = parse_list_from_env("LLM_MODEL_TIERS", [self.DEFAULT_LLM_MODEL])
+        # 路由置信度低于该值时升一档
+        self.LLM_ROUTER_MIN_CONFIDENCE = float(os.getenv("LLM_ROUTER_MIN_CONFIDENCE", "0.5"))
+
+        # 计算工具：精度模式 float / decimal / fraction
+        self.CALCULATOR_MODE = os.getenv("CALCULATOR_MODE", "float").lower()
+        self.CALCULATOR_PRECISION = int(os.getenv("CALCULATOR_PRECISION", "28"))
+        self.CALCULATOR_TIMEOUT = float(os.getenv("CALCULATOR_TIMEOUT", "1.0"))
+        self.CALCULATOR_WORKERS = int(os.getenv("CALCULATOR_WORKERS", "2"))
+        self.CALCULATOR_CACHE_SIZE = int(os.getenv("CALCULATOR_CACHE_SIZE", "1024"))
+        self.CALCULATOR_MAX_LENGTH = int(os.getenv("CALCULATOR_MAX_LENGTH", "256"))
+        self.CALCULATOR_MAX_OPERATIONS = int(os.getenv("CALCULATOR_MAX_OPERATIONS", "64"))
+        self.CALCULATOR_MAX_EXPONENT = int(os.getenv("CALCULATOR_MAX_EXPONENT", "1000"))
+        self.CALCULATOR_MAX_DIGITS = int(os.getenv("CALCULATOR_MAX_DIGITS", "1000"))
+
+        # 工具执行
+        self.TOOL_DEFAULT_TIMEOUT = float(os.getenv("TOOL_DEFAULT_TIMEOUT", "10"))
+        self.TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", "300"))
+        self.TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "1024"))
+        self.TOOL_HTTP_TIMEOUT = float(os.getenv("TOOL_HTTP_TIMEOUT", "10"))
+        self.TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "100"))
 
         # 长期记忆
         self.LONG_TERM_MEMORY_MODEL = os.getenv("LONG_TERM_MEMORY_MODEL", "qwen:7b")
@@ -104,25 +141,189 @@ class Settings:
         self.LONG_TERM_MEMORY_COLLECTION_NAME = os.getenv(
             "LONG_TERM_MEMORY_COLLECTION_NAME", "longterm_memory"
         )
+        # 嵌入请求微批：最多等待 EMBEDDING_BATCH_WAIT_MS 毫秒或凑满 EMBEDDING_BATCH_SIZE 条
+        self.EMBEDDING_BATCH_ENABLED = os.getenv(
+            "EMBEDDING_BATCH_ENABLED", "true"
+        ).lower() in ("true", "1", "yes")
+        self.EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        self.EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+        # 记忆提取过滤：off 不过滤；gate 逐轮过滤；batch 过滤后在会话结束时合并提取
+        self.MEMORY_GATE_MODE = os.getenv("MEMORY_GATE_MODE", "gate").lower()
+        self.MEMORY_GATE_THRESHOLD = float(os.getenv("MEMORY_GATE_THRESHOLD", "0.5"))
+        self.MEMORY_GATE_MIN_CHARS = int(os.getenv("MEMORY_GATE_MIN_CHARS", "4"))
+        # 自定义分类器，格式 "package.module:function"
+        self.MEMORY_GATE_CLASSIFIER = os.getenv("MEMORY_GATE_CLASSIFIER", "")
+        # 会话空闲多久视为结束（秒）
+        self.MEMORY_BATCH_IDLE_SECONDS = float(os.getenv("MEMORY_BATCH_IDLE_SECONDS", "600"))
+        self.MEMORY_BATCH_MAX_TURNS = int(os.getenv("MEMORY_BATCH_MAX_TURNS", "20"))
+
+        # 长期记忆检索参数
+        self.MEMORY_SEARCH_TOP_K = int(os.getenv("MEMORY_SEARCH_TOP_K", "5"))
+        self.MEMORY_SEARCH_THRESHOLD = float(os.getenv("MEMORY_SEARCH_THRESHOLD", "0.3"))
+        self.MEMORY_SEARCH_POOL_SIZE = int(os.getenv("MEMORY_SEARCH_POOL_SIZE", "5"))
+        self.MEMORY_HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "40"))
+        # pgvector 0.8+ 的过滤迭代扫描（off / relaxed_order / strict_order），默认不设置；
+        # 数据库中的 pgvector 低于 0.8 时忽略
+        self.MEMORY_HNSW_ITERATIVE_SCAN = os.getenv("MEMORY_HNSW_ITERATIVE_SCAN", "")
+        self.MEMORY_IVFFLAT_PROBES = int(os.getenv("MEMORY_IVFFLAT_PROBES", "10"))
+
+        # 长期记忆索引与维护
+        self.MEMORY_INDEX_TYPE = os.getenv("MEMORY_INDEX_TYPE", "hnsw").lower()
+        self.MEMORY_HNSW_M = int(os.getenv("MEMORY_HNSW_M", "16"))
+        self.MEMORY_HNSW_EF_CONSTRUCTION = int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", "64"))
+        # 0 表示按行数自动计算
+        self.MEMORY_IVFFLAT_LISTS = int(os.getenv("MEMORY_IVFFLAT_LISTS", "0"))
+        # 余弦距离低于该值的同一用户记忆视为重复
+        self.MEMORY_DEDUP_DISTANCE = float(os.getenv("MEMORY_DEDUP_DISTANCE", "0.05"))
+        # 维护周期（秒），0 表示不启动
+        self.MEMORY_MAINTENANCE_INTERVAL = float(os.getenv("MEMORY_MAINTENANCE_INTERVAL", "3600"))
 
         # JWT
         self.JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "change-me-in-production")
         self.JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
         self.JWT_ACCESS_TOKEN_EXPIRE_DAYS = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_DAYS", "30"))
 
+        # Token 用量记账与配额（0 表示不限制），按 UTC 自然日 / 自然月计算
+        self.USAGE_ENABLED = os.getenv("USAGE_ENABLED", "true").lower() in ("true", "1", "yes")
+        self.USAGE_DAILY_TOKEN_LIMIT = int(os.getenv("USAGE_DAILY_TOKEN_LIMIT", "0"))
+        self.USAGE_MONTHLY_TOKEN_LIMIT = int(os.getenv("USAGE_MONTHLY_TOKEN_LIMIT", "0"))
+        # 用量批量写入周期（秒），也是各 worker 之间配额同步的周期
+        self.USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+
+        # 响应压缩：超过 RESPONSE_COMPRESS_MIN_BYTES 的历史/会话列表响应按 Accept-Encoding 压缩
+        # （brotli 需要安装 brotli 包，否则使用 gzip）
+        self.RESPONSE_COMPRESSION = os.getenv(
+            "RESPONSE_COMPRESSION", "true"
+        ).lower() in ("true", "1", "yes")
+        self.RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "4096"))
+        self.RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "5"))
+        self.RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+        # 跨 worker 缓存失效（Postgres LISTEN/NOTIFY）
+        self.INVALIDATION_ENABLED = os.getenv(
+            "INVALIDATION_ENABLED", "true"
+        ).lower() in ("true", "1", "yes")
+        self.INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "cache_invalidation")
+        # 监听断开期间缓存条目的存活时间（秒）
+        self.INVALIDATION_FALLBACK_TTL = float(os.getenv("INVALIDATION_FALLBACK_TTL", "5"))
+        # 用户记录与会话列表缓存（TTL 为兜底，正常情况下由失效事件清除）
+        self.USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+        self.USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+        self.SESSION_LIST_CACHE_SIZE = int(os.getenv("SESSION_LIST_CACHE_SIZE", "4096"))
+        self.SESSION_LIST_CACHE_TTL = float(os.getenv("SESSION_LIST_CACHE_TTL", "300"))
+
+        # 并发请求合并：历史与记忆检索结果的复用时间（秒，0 表示只合并并发请求，不复用结果）
+        self.SINGLE_FLIGHT_TTL = float(os.getenv("SINGLE_FLIGHT_TTL", "0"))
+        self.SINGLE_FLIGHT_CACHE_SIZE = int(os.getenv("SINGLE_FLIGHT_CACHE_SIZE", "1024"))
+
+        # 对话导出：每批读取的会话数、并发读取检查点数，以及每个 worker 同时进行的导出数上限
+        self.EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "50"))
+        self.EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+        self.EXPORT_MAX_ACTIVE = int(os.getenv("EXPORT_MAX_ACTIVE", "2"))
+
+        # 排空：SIGTERM 后进行中的流最多再运行 DRAIN_TIMEOUT 秒；
+        # 进入排空后等待 DRAIN_NOT_READY_DELAY 秒再停止接收连接（前面有负载均衡器时设置）
+        self.DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+        self.DRAIN_NOT_READY_DELAY = float(os.getenv("DRAIN_NOT_READY_DELAY", "0"))
+        # 关闭阶段写入后台记忆、检索索引等的最长时间
+        self.DRAIN_FLUSH_TIMEOUT = float(os.getenv("DRAIN_FLUSH_TIMEOUT", "15"))
+
+        # WebSocket 聊天
+        self.WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+        # 单个连接上同时进行的会话数
+        self.WS_MAX_SESSIONS = int(os.getenv("WS_MAX_SESSIONS", "8"))
+        # 发送队列满时暂停生成；客户端超过 WS_SEND_TIMEOUT 秒不读取则断开
+        self.WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+        self.WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "30"))
+
         # 日志
         self.LOG_DIR = Path(os.getenv("LOG_DIR", "logs"))
         self.LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
         self.LOG_FORMAT = os.getenv("LOG_FORMAT", "console")
+        # 生产模式：JSON 日志经有界队列交给后台线程批量写入 LOG_DIR 下的滚动文件
+        self.LOG_ASYNC = os.getenv("LOG_ASYNC", "false").lower() in ("true", "1", "yes")
+        self.LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        self.LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+        self.LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+        self.LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(100 * 1024 * 1024)))
+        self.LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", "10"))
+        # 高频事件采样率，格式 "event=rate,..."，如 "chat_node_completed=0.01"
+        self.LOG_SAMPLE_RATES = {
+            event: float(rate)
+            for event, _, rate in (
+                item.partition("=") for item in parse_list_from_env("LOG_SAMPLE_RATES")
+            )
+            if rate
+        }
 
         # Checkpoint 表名
         self.CHECKPOINT_TABLES = ["checkpoint_blobs", "checkpoint_writes", "checkpoints"]
+        # 会话清除：超过 PURGE_SYNC_LIMIT 个会话时转为后台任务，按 PURGE_CHUNK_SIZE 分块删除
+        self.PURGE_SYNC_LIMIT = int(os.getenv("PURGE_SYNC_LIMIT", "100"))
+        self.PURGE_CHUNK_SIZE = int(os.getenv("PURGE_CHUNK_SIZE", "200"))
+        self.PURGE_CHUNK_PAUSE = float(os.getenv("PURGE_CHUNK_PAUSE", "0.1"))
+        self.PURGE_LOCK_TIMEOUT = float(os.getenv("PURGE_LOCK_TIMEOUT", "5"))
+        # 消息检索：每轮结束后把新消息写入 message_index（pg_trgm 索引）
+        self.MESSAGE_INDEX_ENABLED = os.getenv(
+            "MESSAGE_INDEX_ENABLED", "true"
+        ).lower() in ("true", "1", "yes")
+        self.MESSAGE_SEARCH_MAX_LIMIT = int(os.getenv("MESSAGE_SEARCH_MAX_LIMIT", "50"))
+
+        # Checkpoint 缓存与持久化模式
+        self.CHECKPOINT_CACHE_ENABLED = os.getenv(
+            "CHECKPOINT_CACHE_ENABLED", "false"
+        ).lower() in ("true", "1", "yes")
+        self.CHECKPOINT_CACHE_SIZE = int(os.getenv("CHECKPOINT_CACHE_SIZE", "256"))
+        # async: 每个 superstep 异步写入；sync: 每个 superstep 同步写入；exit: 仅在轮次结束时写入
+        self.CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "async").lower()
+
+        # 会话轮次互斥
+        # queue: 排队等待；reject: 返回 409；join: 复用进行中轮次的结果
+        self.SESSION_LOCK_MODE = os.getenv("SESSION_LOCK_MODE", "queue").lower()
+        self.SESSION_LOCK_TIMEOUT = float(os.getenv("SESSION_LOCK_TIMEOUT", "120"))
+        # 是否使用 Postgres advisory lock 做跨 worker 互斥
+        self.SESSION_LOCK_DISTRIBUTED = os.getenv(
+            "SESSION_LOCK_DISTRIBUTED", "true"
+        ).lower() in ("true", "1", "yes")
+        self.SESSION_LOCK_POOL_SIZE = int(os.getenv("SESSION_LOCK_POOL_SIZE", "10"))
+
+        # 幂等键（秒）
+        self.IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+        # pending 状态的最长保留时间，超过后视为首次请求已崩溃，可被接管
+        self.IDEMPOTENCY_PENDING_TTL = float(os.getenv("IDEMPOTENCY_PENDING_TTL", "300"))
+        # 重复请求等待首次请求完成的最长时间
+        self.IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "60"))
+
+        # 后台任务
+        self.JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+        # 本 worker 排队任务上限，超出时提交返回 503
+        self.JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+        self.JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "900"))
+        # 任务结束后结果保留时间（秒）
+        self.JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+        # 事件批量写入间隔（秒），文本片段在间隔内合并
+        self.JOB_EVENT_FLUSH_INTERVAL = float(os.getenv("JOB_EVENT_FLUSH_INTERVAL", "0.5"))
+        # 心跳间隔（秒），超过 4 个间隔未更新的任务视为所在进程已退出
+        self.JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+
+        # 事件循环阻塞监控：心跳间隔（秒），超过阈值时记录事件循环线程的调用栈
+        self.LOOP_MONITOR_ENABLED = os.getenv(
+            "LOOP_MONITOR_ENABLED", "true"
+        ).lower() in ("true", "1", "yes")
+        self.LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.LOOP_MONITOR_THRESHOLD_MS = float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "200"))
+        self.LOOP_MONITOR_STACK_LIMIT = int(os.getenv("LOOP_MONITOR_STACK_LIMIT", "30"))
+
+        # 管理员（逗号分隔的邮箱），可访问 /admin 接口
+        self.ADMIN_EMAILS = [email.lower() for email in parse_list_from_env("ADMIN_EMAILS", [])]
+        # 采样分析的最长时间（秒）
+        self.PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
 
     @property
     def database_url(self) -> str:
         """获取数据库连接 URL"""
         return (
-            f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
+            f"postgresql://{quote_plus(self.POSTGRES_USER)}:{quote_plus(self.POSTGRES_PASSWORD)}"
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
 
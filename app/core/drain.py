@@ -0,0 +1,134 @@
+"""滚动发布时的排空
+
+收到 SIGTERM 后进入排空模式：
+- /ready 返回 503，新的对话轮次（聊天、流式聊天、后台任务、WebSocket）返回 503
+- DRAIN_NOT_READY_DELAY 秒后再交给 uvicorn 停止接收连接（给负载均衡器时间摘除本实例）
+- 进行中的流最多再运行 DRAIN_TIMEOUT 秒，超时后在下一个片段处截断，并计入 cut_off
+- lifespan 关闭阶段等待流结束，再写入后台记忆与用量、关闭所有连接池（见 app.main）
+"""
+
+import asyncio
+import signal
+import time
+from typing import AsyncGenerator, AsyncIterator, Optional, TypeVar
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.logging import logger
+
+T = TypeVar("T")
+
+
+class StreamCutOff(Exception):
+    """排空超时，流被截断"""
+
+
+class DrainController:
+    """跟踪进行中的流并控制排空"""
+
+    def __init__(self, timeout: float = 30.0, not_ready_delay: float = 0.0):
+        self.timeout = timeout
+        self.not_ready_delay = not_ready_delay
+        self.draining = False
+        self.active = 0
+        self.completed = 0
+        self.cut_off = 0
+        self._deadline: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    # ============ 排空 ============
+
+    def begin(self, reason: str = "shutdown") -> None:
+        """进入排空模式（可重复调用）"""
+        if self.draining:
+            return
+        self.draining = True
+        self._started_at = time.monotonic()
+        self._deadline = self._started_at + self.timeout
+        logger.info("drain_started", reason=reason, active_streams=self.active, timeout_s=self.timeout)
+
+    def remaining(self) -> float:
+        """距排空期限的剩余秒数"""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    async def wait(self) -> None:
+        """等待进行中的流结束（最多到期限后再等 1 秒）"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=self.remaining() + 1.0)
+        except asyncio.TimeoutError:
+            logger.warning("drain_wait_timeout", active_streams=self.active)
+
+    def ensure_accepting(self) -> None:
+        """排空时拒绝新的对话轮次（依赖注入）"""
+        if self.draining:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务正在重启，请稍后重试",
+                headers={"Retry-After": "5"},
+            )
+
+    def summary(self) -> dict:
+        return {
+            "completed_streams": self.completed,
+            "cut_off_streams": self.cut_off,
+            # wait 超时后仍未结束的流（随后会被 uvicorn 取消）
+            "unfinished_streams": self.active,
+            "duration_s": round(time.monotonic() - self._started_at, 1) if self._started_at else 0.0,
+        }
+
+    # ============ 流跟踪 ============
+
+    async def guard(self, stream: AsyncIterator[T]) -> AsyncGenerator[T, None]:
+        """包装一个流：排空期限过后在下一个片段处抛出 StreamCutOff，并关闭原始流"""
+        self.active += 1
+        self._idle.clear()
+        finished = False
+        try:
+            async for item in stream:
+                if self._deadline is not None and time.monotonic() > self._deadline:
+                    raise StreamCutOff()
+                yield item
+            finished = True
+        finally:
+            self.active -= 1
+            if finished:
+                self.completed += 1
+            elif self.draining:
+                # 截断、取消或连接被 uvicorn 关闭
+                self.cut_off += 1
+            if self.active == 0:
+                self._idle.set()
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    # ============ 信号 ============
+
+    def install_signal_handler(self) -> None:
+        """在 uvicorn 的 SIGTERM 处理之前进入排空模式
+
+        uvicorn 在 lifespan 启动前安装信号处理，这里包装它：先排空，
+        not_ready_delay 秒后再调用原处理函数停止接收连接。
+        """
+        previous = signal.getsignal(signal.SIGTERM)
+        if not callable(previous):
+            return
+        loop = asyncio.get_running_loop()
+
+        def handle(sig, frame):
+            self.begin(reason="sigterm")
+            if self.not_ready_delay > 0:
+                loop.call_soon_threadsafe(loop.call_later, self.not_ready_delay, previous, sig, frame)
+            else:
+                previous(sig, frame)
+
+        signal.signal(signal.SIGTERM, handle)
+
+
+# 创建全局实例
+drain = DrainController(timeout=settings.DRAIN_TIMEOUT, not_ready_delay=settings.DRAIN_NOT_READY_DELAY)
@@ -0,0 +1,202 @@
+"""带热点线程缓存的 Checkpoint 保存器"""
+
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Optional, Sequence
+
+import psycopg
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    copy_checkpoint,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
+
+from app.core.logging import logger
+from app.services.replica import ReplicaRouter
+from app.utils.cache import LRUCache
+
+# 当前轮次的 checkpoint 查询计数（由 Agent 在每轮开始时设置）
+checkpoint_query_counter: ContextVar[Optional[Counter]] = ContextVar(
+    "checkpoint_query_counter", default=None
+)
+
+# 只读路径（如历史接口）设置为 True，此时读取可以走只读副本；对话轮次始终读主库
+checkpoint_read_only: ContextVar[bool] = ContextVar("checkpoint_read_only", default=False)
+
+# 只查询最新 checkpoint_id，用于校验缓存是否仍然有效
+SELECT_LATEST_ID_SQL = """
+SELECT checkpoint_id FROM checkpoints
+WHERE thread_id = %s AND checkpoint_ns = %s
+ORDER BY checkpoint_id DESC LIMIT 1
+"""
+
+
+def _count(kind: str) -> None:
+    """记录一次 checkpoint 查询"""
+    counter = checkpoint_query_counter.get()
+    if counter is not None:
+        counter[kind] += 1
+
+
+class CachedPostgresSaver(AsyncPostgresSaver):
+    """在 AsyncPostgresSaver 前加一层最近活跃线程的 LRU 缓存
+
+    读取最新状态时先查一次最新 checkpoint_id（只走索引，不读 blob），
+    与缓存中的 id 一致才直接返回缓存，因此其他 worker 写入后缓存会自动失效。
+    """
+
+    def __init__(
+        self,
+        *args,
+        cache_size: int = 256,
+        replica: Optional[AsyncPostgresSaver] = None,
+        router: Optional[ReplicaRouter] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._thread_cache: LRUCache[CheckpointTuple] = LRUCache(max_size=cache_size)
+        # 只读副本上的保存器（只用于读取）
+        self._replica = replica
+        self._router = router
+
+    def invalidate(self, thread_id: str) -> None:
+        """删除某个线程的缓存状态"""
+        self._thread_cache.pop((str(thread_id), ""))
+
+    async def aget_tuple_uncached(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """直接读取 checkpoint，不查也不写缓存（用于导出等一次性的批量读取）"""
+        _count("get_tuple")
+        return await super().aget_tuple(config)
+
+    async def _get_latest_checkpoint_id(
+        self, thread_id: str, checkpoint_ns: str, saver: Optional[AsyncPostgresSaver] = None
+    ) -> Optional[str]:
+        """查询线程最新的 checkpoint_id（saver 为副本时在副本上查询）"""
+        _count("latest_id")
+        async with (saver or self)._cursor() as cur:
+            await cur.execute(SELECT_LATEST_ID_SQL, (thread_id, checkpoint_ns))
+            row = await cur.fetchone()
+        return row["checkpoint_id"] if row else None
+
+    @staticmethod
+    def _copy(cached: CheckpointTuple) -> CheckpointTuple:
+        """Pregel 会原地修改 channel_versions / versions_seen，缓存中的条目只交出副本"""
+        return cached._replace(checkpoint=copy_checkpoint(cached.checkpoint))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """获取 checkpoint，缓存命中且 id 一致时跳过完整加载"""
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        cached = self._thread_cache.get(key)
+
+        if (
+            self._replica is not None
+            and checkpoint_read_only.get()
+            and self._router.use_replica(thread_id)
+        ):
+            try:
+                return await self._aget_tuple_replica(config, thread_id, checkpoint_ns, cached)
+            except psycopg.OperationalError as e:
+                self._router.mark_unhealthy(str(e))
+
+        if cached is not None:
+            cached_id = cached.config["configurable"]["checkpoint_id"]
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id is None:
+                checkpoint_id = await self._get_latest_checkpoint_id(
+                    thread_id, checkpoint_ns
+                )
+            if checkpoint_id == cached_id:
+                logger.debug("checkpoint_cache_hit", thread_id=thread_id)
+                return self._copy(cached)
+
+        _count("get_tuple")
+        result = await super().aget_tuple(config)
+        if result is not None and get_checkpoint_id(config) is None:
+            self._thread_cache.set(key, self._copy(result))
+        return result
+
+    async def _aget_tuple_replica(
+        self,
+        config: RunnableConfig,
+        thread_id: str,
+        checkpoint_ns: str,
+        cached: Optional[CheckpointTuple],
+    ) -> Optional[CheckpointTuple]:
+        """在副本上读取；副本最新 id 与缓存一致时直接返回缓存，副本的结果不写入缓存"""
+        if cached is not None and get_checkpoint_id(config) is None:
+            latest_id = await self._get_latest_checkpoint_id(thread_id, checkpoint_ns, self._replica)
+            if latest_id == cached.config["configurable"]["checkpoint_id"]:
+                return self._copy(cached)
+        _count("replica_get_tuple")
+        return await self._replica.aget_tuple(config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """保存 checkpoint，并把刚写入的状态放入缓存"""
+        _count("put")
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+
+        configurable = next_config["configurable"]
+        parent_id = config["configurable"].get("checkpoint_id")
+        self._thread_cache.set(
+            (str(configurable["thread_id"]), configurable["checkpoint_ns"]),
+            CheckpointTuple(
+                config=next_config,
+                checkpoint=copy_checkpoint(checkpoint),
+                metadata=get_serializable_checkpoint_metadata(config, metadata),
+                parent_config=(
+                    {
+                        "configurable": {
+                            "thread_id": configurable["thread_id"],
+                            "checkpoint_ns": configurable["checkpoint_ns"],
+                            "checkpoint_id": parent_id,
+                        }
+                    }
+                    if parent_id
+                    else None
+                ),
+                pending_writes=[],
+            ),
+        )
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """保存中间写入；写入挂在缓存的 checkpoint 上时让缓存失效"""
+        _count("put_writes")
+        await super().aput_writes(config, writes, task_id, task_path)
+
+        key = (
+            str(config["configurable"]["thread_id"]),
+            config["configurable"].get("checkpoint_ns", ""),
+        )
+        cached = self._thread_cache.get(key)
+        if (
+            cached is not None
+            and cached.config["configurable"]["checkpoint_id"]
+            == config["configurable"].get("checkpoint_id")
+        ):
+            self._thread_cache.pop(key)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """删除线程时同步清理缓存"""
+        await super().adelete_thread(thread_id)
+        self.invalidate(thread_id)
@@ -0,0 +1,232 @@
+"""导出用户的全部对话（NDJSON）
+
+- 按 (created_at, id) 键集分页读取 session 表，每批最多 batch_size 个会话；
+  每批单独借用一次连接，读完即归还，读取检查点和写出期间不占用连接、不持有事务
+- 每批并发读取各 thread 最新的检查点（最多 concurrency 个），不经过也不写入检查点缓存
+- 每个会话一行，读完一批就写出，内存占用只取决于批大小，与账号的会话数无关
+- 每个 worker 同时进行的导出最多 max_active 个，避免导出占满共享的检查点连接池
+- 可选导出长期记忆（同样按 id 键集分页读取向量集合，不包含向量）
+
+每行一个 JSON 对象，type 为：
+  export   首行：user_id、导出时间
+  session  一个会话：id、title、created_at、messages
+  memory   一条长期记忆：id、memory、created_at、updated_at
+  summary  末行：各类条数（没有末行说明导出被中断）
+
+运行: python -m app.core.langgraph.export <用户邮箱或 ID> [-o 输出文件] [--memories]
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncGenerator, Awaitable, BinaryIO, Callable, List, Optional
+
+import orjson
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from psycopg import errors, sql
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.logging import logger
+
+# {after} 为空（第一批）或从上一批最后一行之后继续的键集条件
+SESSIONS_SQL = """
+SELECT id::text, title, created_at FROM "session"
+WHERE user_id = %s::uuid {after}
+ORDER BY created_at, id
+LIMIT %s
+"""
+SESSIONS_AFTER = "AND (created_at, id) > (%s, %s::uuid)"
+
+MEMORIES_SQL = """
+SELECT id::text, payload->>'data', payload->>'created_at', payload->>'updated_at' FROM {table}
+WHERE payload->>'user_id' = %s {after}
+ORDER BY id
+LIMIT %s
+"""
+MEMORIES_AFTER = "AND id > %s"
+
+
+class ExportBusyError(Exception):
+    """本 worker 上进行中的导出已达上限"""
+
+
+def _line(obj: dict) -> bytes:
+    return orjson.dumps(obj) + b"\n"
+
+
+def _message_row(msg: BaseMessage) -> Optional[dict]:
+    """消息转为导出格式；不含内容的助手消息只保留工具调用"""
+    if isinstance(msg, HumanMessage):
+        return {"role": "user", "content": msg.content}
+    if isinstance(msg, AIMessage):
+        row = {"role": "assistant", "content": msg.content}
+        if msg.tool_calls:
+            row["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in msg.tool_calls]
+        elif not msg.content:
+            return None
+        return row
+    if isinstance(msg, ToolMessage):
+        return {"role": "tool", "name": msg.name, "content": msg.content}
+    return None
+
+
+class ConversationExporter:
+    """按用户流式导出会话与长期记忆"""
+
+    def __init__(
+        self,
+        pool_factory: Callable[[], Awaitable[AsyncConnectionPool]],
+        load_messages: Callable[[str], Awaitable[List[BaseMessage]]],
+        memory_table: str,
+        batch_size: int = 50,
+        concurrency: int = 4,
+        max_active: int = 2,
+    ):
+        self._pool_factory = pool_factory
+        self._load_messages = load_messages
+        self.memory_table = memory_table
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_active = max_active
+        self.active = 0
+
+    async def _fetch(self, pool: AsyncConnectionPool, query: sql.Composed, params: tuple) -> list:
+        """借用一次连接读取一批，返回前归还连接"""
+        async with pool.connection() as conn:
+            cursor = await conn.execute(query, params)
+            return await cursor.fetchall()
+
+    async def _sessions(self, pool: AsyncConnectionPool, user_id: str) -> AsyncGenerator[list, None]:
+        """逐批返回 (id, title, created_at, messages)"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def load(session_id: str) -> List[BaseMessage]:
+            async with semaphore:
+                return await self._load_messages(session_id)
+
+        first = sql.SQL(SESSIONS_SQL).format(after=sql.SQL(""))
+        following = sql.SQL(SESSIONS_SQL).format(after=sql.SQL(SESSIONS_AFTER))
+        rows = await self._fetch(pool, first, (user_id, self.batch_size))
+        while rows:
+            histories = await asyncio.gather(*(load(row[0]) for row in rows))
+            yield [(*row, messages) for row, messages in zip(rows, histories)]
+            if len(rows) < self.batch_size:
+                break
+            session_id, _, created_at = rows[-1]
+            rows = await self._fetch(pool, following, (user_id, created_at, session_id, self.batch_size))
+
+    async def _memories(self, pool: AsyncConnectionPool, user_id: str) -> AsyncGenerator[list, None]:
+        table = sql.Identifier(self.memory_table)
+        first = sql.SQL(MEMORIES_SQL).format(table=table, after=sql.SQL(""))
+        following = sql.SQL(MEMORIES_SQL).format(table=table, after=sql.SQL(MEMORIES_AFTER))
+        try:
+            rows = await self._fetch(pool, first, (user_id, self.batch_size))
+        except errors.UndefinedTable:
+            # 长期记忆从未初始化过
+            return
+        while rows:
+            yield rows
+            if len(rows) < self.batch_size:
+                break
+            rows = await self._fetch(pool, following, (user_id, rows[-1][0], self.batch_size))
+
+    async def export(self, user_id: str, include_memories: bool = False) -> AsyncGenerator[bytes, None]:
+        """逐行生成 NDJSON
+
+        生成首行前占用一个导出名额，生成器结束或关闭时释放。
+
+        Raises:
+            ExportBusyError: 本 worker 进行中的导出已达 max_active（在取首行时抛出）
+        """
+        if self.active >= self.max_active:
+            raise ExportBusyError()
+        self.active += 1
+        try:
+            async for line in self._export(user_id, include_memories):
+                yield line
+        finally:
+            self.active -= 1
+
+    async def _export(self, user_id: str, include_memories: bool) -> AsyncGenerator[bytes, None]:
+        start = time.perf_counter()
+        counts = {"sessions": 0, "messages": 0, "memories": 0}
+        yield _line({
+            "type": "export",
+            "user_id": user_id,
+            "exported_at": datetime.now(timezone.utc),
+        })
+
+        pool = await self._pool_factory()
+        async for batch in self._sessions(pool, user_id):
+            for session_id, title, created_at, messages in batch:
+                rows = [row for row in map(_message_row, messages) if row is not None]
+                counts["sessions"] += 1
+                counts["messages"] += len(rows)
+                yield _line({
+                    "type": "session",
+                    "id": session_id,
+                    "title": title,
+                    "created_at": created_at,
+                    "messages": rows,
+                })
+
+        if include_memories:
+            async for batch in self._memories(pool, user_id):
+                for memory_id, memory, created_at, updated_at in batch:
+                    counts["memories"] += 1
+                    yield _line({
+                        "type": "memory",
+                        "id": memory_id,
+                        "memory": memory,
+                        "created_at": created_at,
+                        "updated_at": updated_at,
+                    })
+
+        yield _line({"type": "summary", **counts})
+        logger.info(
+            "conversations_exported",
+            user_id=user_id,
+            duration_s=round(time.perf_counter() - start, 1),
+            **counts,
+        )
+
+
+async def _export_cli(args: argparse.Namespace, out: BinaryIO) -> None:
+    from app.core.langgraph.graph import agent
+    from app.services.database import db
+
+    try:
+        user_id = uuid.UUID(args.user)
+    except ValueError:
+        user = db.get_user_by_email(args.user)
+        if user is None:
+            sys.exit(f"用户不存在: {args.user}")
+        user_id = user.id
+
+    try:
+        async for line in agent.exporter.export(str(user_id), include_memories=args.memories):
+            out.write(line)
+    finally:
+        await agent.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="导出用户的全部对话（NDJSON）")
+    parser.add_argument("user", help="用户邮箱或 ID")
+    parser.add_argument("-o", "--output", help="输出文件（默认标准输出）")
+    parser.add_argument("--memories", action="store_true", help="同时导出长期记忆")
+    args = parser.parse_args()
+
+    # 在进入事件循环之前打开输出文件
+    if args.output is None:
+        asyncio.run(_export_cli(args, sys.stdout.buffer))
+        return
+    with open(args.output, "wb") as out:
+        asyncio.run(_export_cli(args, out))
+
+
+if __name__ == "__main__":
+    main()
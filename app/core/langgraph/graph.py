@@ -1,10 +1,12 @@
 """LangGraph Agent 工作流"""
 
 import asyncio
-from typing import AsyncGenerator, Optional, List
-from urllib.parse import quote_plus
+from collections import Counter
+from typing import AsyncGenerator, Optional, List, Set, Union
+from uuid import UUID
 
 from langchain_core.messages import (
+    BaseMessage,
     SystemMessage,
     HumanMessage,
     AIMessage,
@@ -18,13 +20,31 @@ from psycopg_pool import AsyncConnectionPool
 
 from app.core.config import settings
 from app.core.logging import logger
-from app.core.langgraph.tools import tools
+from app.core.langgraph.memory_gate import MemoryGate, load_classifier
+from app.core.langgraph.model_router import ModelRouter
+from app.core.langgraph.checkpoint import (
+    CachedPostgresSaver,
+    checkpoint_query_counter,
+    checkpoint_read_only,
+)
+from app.core.langgraph.export import ConversationExporter
+from app.core.langgraph.message_index import MessageIndexer
+from app.core.langgraph.purge import SessionPurger
+from app.core.langgraph.session_lock import SessionLease, SessionLockManager
+from app.core.langgraph.tool_registry import tool_registry
 from app.schemas import GraphState, Message
+from app.services.embedding import BatchingEmbedder, EmbeddingBatcher
+from app.services.invalidation import invalidation_bus
 from app.services.llm import llm_service
+from app.services.memory_index import memory_index
+from app.services.replica import replica_router
+from app.utils.cache import LRUCache
+from app.utils.singleflight import SingleFlight
 
 from mem0 import AsyncMemory
 
 # 系统提示词
+# 保持逐字节不变：Ollama 按前缀复用 KV 缓存，首条消息变化会导致整段历史重新 prefill
 SYSTEM_PROMPT = """你是一个智能助手。请根据用户的问题提供有帮助的回答。
 
 ## 规则
@@ -32,39 +52,116 @@ SYSTEM_PROMPT = """你是一个智能助手。请根据用户的问题提供有
 2. 回答要简洁准确
 3. 如果需要，可以使用工具获取信息
 4. 如果不确定，诚实地说不知道
+5. 系统消息中的"用户相关记忆"仅供参考
+"""
 
-## 用户相关记忆
+# 每轮检索到的记忆作为单独的系统消息，放在最新一条用户消息之后
+MEMORY_PROMPT = """## 用户相关记忆
 {long_term_memory}
 """
 
 
+def build_prompt_messages(messages: List[BaseMessage], long_term_memory: str = "") -> List[BaseMessage]:
+    """构建发送给 LLM 的消息列表
+
+    布局为 [静态系统提示词, 历史消息..., 最新用户消息, 记忆, 本轮工具调用...]，
+    每轮变化的记忆放在尾部，前面的历史前缀在轮次之间保持不变。
+    """
+    prompt: List[BaseMessage] = [SystemMessage(content=SYSTEM_PROMPT)]
+    if not long_term_memory:
+        return prompt + list(messages)
+
+    last_human = max(
+        (i for i, message in enumerate(messages) if isinstance(message, HumanMessage)),
+        default=len(messages) - 1,
+    )
+    memory = SystemMessage(content=MEMORY_PROMPT.format(long_term_memory=long_term_memory))
+    return prompt + list(messages[: last_human + 1]) + [memory] + list(messages[last_human + 1:])
+
+
 class LangGraphAgent:
     """LangGraph Agent 类"""
 
     def __init__(self):
         self._connection_pool: Optional[AsyncConnectionPool] = None
         self._graph: Optional[CompiledStateGraph] = None
+        self._ephemeral_graph: Optional[CompiledStateGraph] = None
+        self._checkpointer: Optional[CachedPostgresSaver] = None
+        self._lock_pool: Optional[AsyncConnectionPool] = None
+        self._replica_pool: Optional[AsyncConnectionPool] = None
         self._memory: Optional[AsyncMemory] = None
+        self._embedding_batcher: Optional[EmbeddingBatcher] = None
+        # 轮次结束后在后台运行的任务（保存记忆），关闭前等待
+        self._background: Set[asyncio.Task] = set()
+
+        # 合并相同的并发读取（同一会话的历史、同一用户的相同记忆检索）
+        self.history_flight: SingleFlight[List[dict]] = SingleFlight("history", cache=self._flight_cache())
+        self.memory_search_flight: SingleFlight[dict] = SingleFlight(
+            "memory_search", cache=self._flight_cache()
+        )
+
+        # 长期记忆提取过滤
+        self.memory_gate = MemoryGate(
+            extractor=self._add_memory,
+            mode=settings.MEMORY_GATE_MODE,
+            threshold=settings.MEMORY_GATE_THRESHOLD,
+            min_chars=settings.MEMORY_GATE_MIN_CHARS,
+            batch_idle_seconds=settings.MEMORY_BATCH_IDLE_SECONDS,
+            batch_max_turns=settings.MEMORY_BATCH_MAX_TURNS,
+            classifier=load_classifier(settings.MEMORY_GATE_CLASSIFIER),
+        )
+
+        # 会话轮次互斥
+        self.session_locks = SessionLockManager(
+            pool_factory=self._get_lock_pool if settings.SESSION_LOCK_DISTRIBUTED else None,
+            mode=settings.SESSION_LOCK_MODE,
+            timeout=settings.SESSION_LOCK_TIMEOUT,
+        )
+
+        # 会话清除
+        self.purger = SessionPurger(
+            self._get_connection_pool,
+            tables=settings.CHECKPOINT_TABLES,
+            chunk_size=settings.PURGE_CHUNK_SIZE,
+            chunk_pause=settings.PURGE_CHUNK_PAUSE,
+            lock_timeout=settings.PURGE_LOCK_TIMEOUT,
+            on_purged=self._threads_purged,
+        )
+        # 其他 worker 清除会话后清理本进程的缓存
+        invalidation_bus.subscribe("thread", self._on_threads_invalidated)
+        # 任一 worker 上的对话轮次结束后丢弃该会话合并 / 复用中的历史
+        invalidation_bus.subscribe("turn", self.history_flight.invalidate)
+
+        # 消息检索索引
+        self.message_index = MessageIndexer(self._get_connection_pool, self._get_thread_messages)
+
+        # 对话导出
+        self.exporter = ConversationExporter(
+            self._get_connection_pool,
+            self._export_thread_messages,
+            memory_table=settings.LONG_TERM_MEMORY_COLLECTION_NAME,
+            batch_size=settings.EXPORT_BATCH_SIZE,
+            concurrency=settings.EXPORT_CONCURRENCY,
+            max_active=settings.EXPORT_MAX_ACTIVE,
+        )
 
-        # 绑定工具到 LLM
+        # 按轮次难度选择模型
+        self.model_router = ModelRouter(
+            settings.LLM_MODEL_TIERS,
+            min_confidence=settings.LLM_ROUTER_MIN_CONFIDENCE,
+        )
+
+        # 工具在首次创建图时加载并绑定到 LLM
         self.llm_service = llm_service
-        self.llm_service.bind_tools(tools)
-        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.tool_registry = tool_registry
 
         logger.info("langgraph_agent_initialized")
 
     async def _get_connection_pool(self) -> AsyncConnectionPool:
         """获取数据库连接池"""
         if self._connection_pool is None:
-            connection_url = (
-                f"postgresql://{quote_plus(settings.POSTGRES_USER)}:"
-                f"{quote_plus(settings.POSTGRES_PASSWORD)}@"
-                f"{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/"
-                f"{settings.POSTGRES_DB}"
-            )
-
             self._connection_pool = AsyncConnectionPool(
-                connection_url,
+                settings.database_url,
                 open=False,
                 max_size=settings.POSTGRES_POOL_SIZE,
                 kwargs={
@@ -77,18 +174,56 @@ class LangGraphAgent:
 
         return self._connection_pool
 
+    async def _get_lock_pool(self) -> AsyncConnectionPool:
+        """获取会话锁专用连接池（advisory lock 需要在整轮对话期间占用连接）"""
+        if self._lock_pool is None:
+            self._lock_pool = AsyncConnectionPool(
+                settings.database_url,
+                open=False,
+                max_size=settings.SESSION_LOCK_POOL_SIZE,
+                kwargs={
+                    "autocommit": True,
+                    "connect_timeout": 10,
+                },
+            )
+            await self._lock_pool.open()
+            logger.info("session_lock_pool_created")
+
+        return self._lock_pool
+
+    async def _get_replica_pool(self) -> AsyncConnectionPool:
+        """获取只读副本连接池（只用于读取检查点）"""
+        if self._replica_pool is None:
+            self._replica_pool = AsyncConnectionPool(
+                settings.POSTGRES_REPLICA_URL,
+                open=False,
+                max_size=settings.POSTGRES_POOL_SIZE,
+                kwargs={
+                    "autocommit": True,
+                    "connect_timeout": 5,
+                },
+            )
+            await self._replica_pool.open()
+            logger.info("langgraph_replica_pool_created")
+
+        return self._replica_pool
+
     async def _chat_node(self, state: GraphState, config: RunnableConfig) -> Command:
         """聊天节点 - 调用 LLM 生成回复"""
-        # 构建系统提示词
-        system_prompt = SYSTEM_PROMPT.format(
-            long_term_memory=state.long_term_memory or "暂无记忆"
-        )
-
         # 构建消息列表
-        messages = [SystemMessage(content=system_prompt)] + list(state.messages)
-
-        # 调用 LLM
-        response = await self.llm_service.call(messages)
+        messages = build_prompt_messages(state.messages, state.long_term_memory)
+
+        # 调用 LLM（按路由选择模型，失败时升级）
+        thread_id = config["configurable"].get("thread_id")
+        user_id = (config.get("metadata") or {}).get("user_id")
+        user_id = UUID(str(user_id)) if user_id else None
+        response = await self.model_router.call(
+            state.messages,
+            lambda model, stream: self.llm_service.call(
+                messages, model=model, thread_id=thread_id, user_id=user_id, stream=stream
+            ),
+            session_id=thread_id,
+        )
 
         logger.debug(
             "chat_node_completed",
@@ -102,40 +237,29 @@ class LangGraphAgent:
             return Command(update={"messages": [response]}, goto=END)
 
     async def _tool_node(self, state: GraphState) -> Command:
-        """工具节点 - 执行工具调用"""
-        outputs = []
-        last_message = state.messages[-1]
-
-        for tool_call in last_message.tool_calls:
-            tool_name = tool_call["name"]
-            tool_args = tool_call["args"]
-
-            logger.info("executing_tool", tool=tool_name, args=tool_args)
-
-            # 执行工具
-            tool = self.tools_by_name.get(tool_name)
-            if tool:
-                result = await tool.ainvoke(tool_args)
-            else:
-                result = f"未知工具: {tool_name}"
-
-            outputs.append(
-                ToolMessage(
-                    content=str(result),
-                    name=tool_name,
-                    tool_call_id=tool_call["id"],
-                )
-            )
+        """工具节点 - 并发执行本轮的工具调用"""
+        tool_calls = state.messages[-1].tool_calls
+
+        for tool_call in tool_calls:
+            logger.info("executing_tool", tool=tool_call["name"], args=tool_call["args"])
+
+        results = await asyncio.gather(
+            *(self.tool_registry.invoke(call["name"], call["args"]) for call in tool_calls)
+        )
+        outputs = [
+            ToolMessage(content=result, name=call["name"], tool_call_id=call["id"])
+            for call, result in zip(tool_calls, results)
+        ]
 
         # 返回聊天节点继续处理
         return Command(update={"messages": outputs}, goto="chat")
 
-    async def create_graph(self) -> CompiledStateGraph:
-        """创建并编译 LangGraph"""
-        if self._graph is not None:
-            return self._graph
+    def _build_graph(self) -> StateGraph:
+        """构建图（加载工具并绑定到 LLM）"""
+        tools = self.tool_registry.tools
+        self.llm_service.bind_tools(tools)
+        self.model_router.tool_names = set(self.tool_registry.names)
 
-        # 构建图
         graph_builder = StateGraph(GraphState)
 
         # 添加节点
@@ -145,11 +269,29 @@ class LangGraphAgent:
         # 设置入口和出口
         graph_builder.set_entry_point("chat")
         graph_builder.set_finish_point("chat")
+        return graph_builder
+
+    async def create_graph(self) -> CompiledStateGraph:
+        """创建并编译 LangGraph"""
+        if self._graph is not None:
+            return self._graph
+
+        graph_builder = self._build_graph()
 
         # 创建检查点保存器（用于持久化对话状态）
         connection_pool = await self._get_connection_pool()
-        checkpointer = AsyncPostgresSaver(connection_pool)
+        replica = None
+        if replica_router.enabled:
+            # 副本只读，不执行 setup
+            replica = AsyncPostgresSaver(await self._get_replica_pool())
+        checkpointer = CachedPostgresSaver(
+            connection_pool,
+            cache_size=settings.CHECKPOINT_CACHE_SIZE if settings.CHECKPOINT_CACHE_ENABLED else 0,
+            replica=replica,
+            router=replica_router,
+        )
         await checkpointer.setup()
+        self._checkpointer = checkpointer
 
         # 编译图
         self._graph = graph_builder.compile(
@@ -160,6 +302,15 @@ class LangGraphAgent:
         logger.info("langgraph_compiled")
         return self._graph
 
+    def create_ephemeral_graph(self) -> CompiledStateGraph:
+        """不带检查点的图：对话状态只存在于单次调用中，不读写数据库"""
+        if self._ephemeral_graph is None:
+            self._ephemeral_graph = self._build_graph().compile(
+                name=f"{settings.PROJECT_NAME} Agent (ephemeral)",
+            )
+            logger.info("langgraph_ephemeral_compiled")
+        return self._ephemeral_graph
+
     async def _get_memory(self) -> AsyncMemory:
         """获取长期记忆实例"""
         if self._memory is None:
@@ -169,11 +320,12 @@ class LangGraphAgent:
                         "provider": "pgvector",
                         "config": {
                             "collection_name": settings.LONG_TERM_MEMORY_COLLECTION_NAME,
-                            "dbname": settings.POSTGRES_DB,
-                            "user": settings.POSTGRES_USER,
-                            "password": settings.POSTGRES_PASSWORD,
-                            "host": settings.POSTGRES_HOST,
-                            "port": settings.POSTGRES_PORT,
+                            # 连接池会为每个连接设置 ef_search 等检索参数
+                            "connection_pool": memory_index.get_search_pool(),
+                            # 向量索引只由 MemoryIndexManager 并发创建 / 重建；
+                            # mem0 自己建索引是阻塞写入的 CREATE INDEX
+                            "hnsw": False,
+                            "diskann": False,
                         },
                     },
                     "llm": {
@@ -192,14 +344,40 @@ class LangGraphAgent:
                     },
                 }
             )
+            if settings.EMBEDDING_BATCH_ENABLED:
+                # 用微批嵌入器替换 mem0 默认的逐条请求嵌入器
+                self._embedding_batcher = EmbeddingBatcher(
+                    base_url=settings.OLLAMA_BASE_URL,
+                    model=settings.LONG_TERM_MEMORY_EMBEDDER_MODEL,
+                    max_batch_size=settings.EMBEDDING_BATCH_SIZE,
+                    max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+                )
+                self._memory.embedding_model = BatchingEmbedder(
+                    self._embedding_batcher, asyncio.get_running_loop()
+                )
             logger.info("long_term_memory_initialized")
         return self._memory
 
+    @staticmethod
+    def _flight_cache() -> Optional[LRUCache]:
+        """SINGLE_FLIGHT_TTL > 0 时在该时间内复用结果"""
+        if settings.SINGLE_FLIGHT_TTL <= 0:
+            return None
+        return LRUCache(max_size=settings.SINGLE_FLIGHT_CACHE_SIZE, ttl=settings.SINGLE_FLIGHT_TTL)
+
     async def get_relevant_memories(self, user_id: str, query: str) -> str:
         """检索相关记忆"""
         try:
             memory = await self._get_memory()
-            results = await memory.search(user_id=user_id, query=query)
+            results = await self.memory_search_flight.do(
+                (user_id, query),
+                lambda: memory.search(
+                    user_id=user_id,
+                    query=query,
+                    top_k=settings.MEMORY_SEARCH_TOP_K,
+                    threshold=settings.MEMORY_SEARCH_THRESHOLD,
+                ),
+            )
 
             if not results.get("results"):
                 return ""
@@ -210,8 +388,17 @@ class LangGraphAgent:
             logger.error("memory_search_failed", error=str(e))
             return ""
 
-    async def save_memory(self, user_id: str, messages: list) -> None:
-        """保存对话到长期记忆"""
+    async def save_memory(
+        self, user_id: str, messages: list, session_id: Optional[str] = None
+    ) -> None:
+        """保存对话到长期记忆（先经过 MemoryGate 过滤）"""
+        try:
+            await self.memory_gate.submit(user_id, session_id, messages)
+        except Exception as e:
+            logger.error("memory_save_failed", error=str(e))
+
+    async def _add_memory(self, user_id: str, messages: list) -> None:
+        """调用 mem0 提取并写入长期记忆"""
         try:
             memory = await self._get_memory()
             await memory.add(messages, user_id=user_id)
@@ -219,14 +406,45 @@ class LangGraphAgent:
         except Exception as e:
             logger.error("memory_save_failed", error=str(e))
 
+    def _spawn(self, coro) -> None:
+        """在后台运行，关闭前由 drain 等待"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
     async def chat(
         self,
         message: str,
         session_id: str,
         user_id: Optional[str] = None,
+        ephemeral: bool = False,
     ) -> str:
-        """发送消息并获取回复（带长期记忆）"""
-        graph = await self.create_graph()
+        """发送消息并获取回复（带长期记忆）
+
+        同一会话的并发轮次按 SESSION_LOCK_MODE 排队、拒绝或复用结果。
+
+        Args:
+            ephemeral: 为 True 时不读写检查点（无历史、不持久化），也不需要会话锁
+
+        Raises:
+            SessionBusyError: 会话正在处理其他轮次且无法等待
+        """
+        if ephemeral:
+            return await self._chat_turn(message, session_id, user_id, ephemeral=True)
+        return await self.session_locks.run(
+            session_id,
+            lambda: self._chat_turn(message, session_id, user_id),
+        )
+
+    async def _chat_turn(
+        self,
+        message: str,
+        session_id: str,
+        user_id: Optional[str] = None,
+        ephemeral: bool = False,
+    ) -> str:
+        """执行一轮对话（调用方需持有会话锁）"""
+        graph = self.create_ephemeral_graph() if ephemeral else await self.create_graph()
 
         # 获取相关记忆
         long_term_memory = ""
@@ -244,7 +462,22 @@ class LangGraphAgent:
         }
 
         # 执行图
-        result = await graph.ainvoke(input_state, config)
+        counter = Counter()
+        token = checkpoint_query_counter.set(counter)
+        try:
+            # 没有检查点时 durability 无意义
+            durability = None if ephemeral else settings.CHECKPOINT_DURABILITY
+            result = await graph.ainvoke(input_state, config, durability=durability)
+        finally:
+            checkpoint_query_counter.reset(token)
+            # 轮次写入新状态后所有 worker 不再复用之前读到的历史，并在短时间内从主库读取
+            await invalidation_bus.publish_async("turn", session_id)
+        logger.info(
+            "checkpoint_queries_per_turn",
+            session_id=session_id,
+            total=sum(counter.values()),
+            **counter,
+        )
 
         # 提取回复
         response_content = ""
@@ -253,13 +486,16 @@ class LangGraphAgent:
                 response_content = msg.content
                 break
 
+        if user_id and not ephemeral:
+            self._index_turn(session_id, user_id)
+
         # 异步保存记忆
         if user_id and response_content:
-            asyncio.create_task(
+            self._spawn(
                 self.save_memory(user_id, [
                     {"role": "user", "content": message},
                     {"role": "assistant", "content": response_content},
-                ])
+                ], session_id=session_id)
             )
 
         return response_content or "抱歉，我无法生成回复。"
@@ -270,8 +506,51 @@ class LangGraphAgent:
         session_id: str,
         user_id: Optional[str] = None,
         long_term_memory: str = "",
-    ) -> AsyncGenerator[str, None]:
-        """流式对话"""
+        lease: Optional[SessionLease] = None,
+        events: bool = False,
+    ) -> AsyncGenerator[Union[str, dict], None]:
+        """流式对话
+
+        Args:
+            lease: 调用方预先获取的会话锁；为空时在此处排队获取。
+                无论哪种方式，流结束时都会释放。
+            events: 为 True 时产出结构化事件而不是纯文本：
+                {"type": "token", "content"} / {"type": "tool_call", "name", "args"} /
+                {"type": "tool_result", "name", "content"}
+        """
+        if lease is None:
+            lease = await self.session_locks.acquire(session_id)
+
+        try:
+            async for item in self._stream_turn(
+                message, session_id, user_id, long_term_memory, events
+            ):
+                yield item
+        finally:
+            await lease.release()
+
+    @staticmethod
+    def _to_events(chunk) -> List[dict]:
+        """把 messages 流中的消息块转换为事件"""
+        if isinstance(chunk, ToolMessage):
+            return [{"type": "tool_result", "name": chunk.name, "content": str(chunk.content)}]
+        result = []
+        if chunk.content:
+            result.append({"type": "token", "content": chunk.content})
+        for call in getattr(chunk, "tool_calls", None) or []:
+            if call.get("name"):
+                result.append({"type": "tool_call", "name": call["name"], "args": call.get("args", {})})
+        return result
+
+    async def _stream_turn(
+        self,
+        message: str,
+        session_id: str,
+        user_id: Optional[str],
+        long_term_memory: str,
+        events: bool = False,
+    ) -> AsyncGenerator[Union[str, dict], None]:
+        """执行一轮流式对话（调用方需持有会话锁）"""
         graph = await self.create_graph()
 
         config = {
@@ -284,46 +563,115 @@ class LangGraphAgent:
             "long_term_memory": long_term_memory,
         }
 
-        async for token, metadata in graph.astream(
-            input_state,
-            config,
-            stream_mode="messages",
-        ):
-            if hasattr(token, "content") and token.content:
-                yield token.content
+        counter = Counter()
+        counter_token = checkpoint_query_counter.set(counter)
+        try:
+            async for token, metadata in graph.astream(
+                input_state,
+                config,
+                stream_mode="messages",
+                durability=settings.CHECKPOINT_DURABILITY,
+            ):
+                if events:
+                    for event in self._to_events(token):
+                        yield event
+                elif hasattr(token, "content") and token.content:
+                    yield token.content
+        finally:
+            checkpoint_query_counter.reset(counter_token)
+            await invalidation_bus.publish_async("turn", session_id)
+
+        logger.info(
+            "checkpoint_queries_per_turn",
+            session_id=session_id,
+            total=sum(counter.values()),
+            **counter,
+        )
+        if user_id:
+            self._index_turn(session_id, user_id)
+
+    def _index_turn(self, session_id: str, user_id: str) -> None:
+        """轮次结束后在后台把新消息写入检索索引"""
+        if settings.MESSAGE_INDEX_ENABLED:
+            self.message_index.schedule(session_id, user_id)
 
     async def get_history(self, session_id: str) -> List[Message]:
         """获取对话历史"""
+        return [Message(**row) for row in await self.get_history_rows(session_id)]
+
+    async def _get_thread_messages(self, session_id: str) -> List[BaseMessage]:
+        """读取 thread 当前状态中的全部消息"""
         graph = await self.create_graph()
+        state = await graph.aget_state({"configurable": {"thread_id": session_id}})
+        if not state.values:
+            return []
+        return state.values.get("messages", [])
 
-        from asgiref.sync import sync_to_async
-        state = await sync_to_async(graph.get_state)(
-            config={"configurable": {"thread_id": session_id}}
+    async def _export_thread_messages(self, session_id: str) -> List[BaseMessage]:
+        """读取 thread 最新检查点中的消息（不经过检查点缓存，避免批量导出挤掉热点线程）"""
+        await self.create_graph()
+        checkpoint = await self._checkpointer.aget_tuple_uncached(
+            {"configurable": {"thread_id": session_id, "checkpoint_ns": ""}}
         )
-
-        if not state.values:
+        if checkpoint is None:
             return []
+        return checkpoint.checkpoint["channel_values"].get("messages", [])
 
-        messages = []
-        for msg in state.values.get("messages", []):
+    async def get_history_rows(self, session_id: str) -> List[dict]:
+        """获取对话历史（{"role", "content"} 字典，可直接序列化）
+
+        同一会话的并发请求共享一次读取，返回的列表不要修改。
+        """
+        return await self.history_flight.do(session_id, lambda: self._load_history_rows(session_id))
+
+    async def _load_history_rows(self, session_id: str) -> List[dict]:
+        # 纯读取，可以走只读副本（轮次刚结束的会话会固定读主库）
+        token = checkpoint_read_only.set(True)
+        try:
+            messages = await self._get_thread_messages(session_id)
+        finally:
+            checkpoint_read_only.reset(token)
+        rows = []
+        for msg in messages:
             if isinstance(msg, HumanMessage):
-                messages.append(Message(role="user", content=msg.content))
+                rows.append({"role": "user", "content": msg.content})
             elif isinstance(msg, AIMessage) and msg.content:
-                messages.append(Message(role="assistant", content=msg.content))
-
-        return messages
+                rows.append({"role": "assistant", "content": msg.content})
+        return rows
 
     async def clear_history(self, session_id: str) -> None:
-        """清除对话历史"""
-        conn_pool = await self._get_connection_pool()
-        async with conn_pool.connection() as conn:
-            for table in settings.CHECKPOINT_TABLES:
-                await conn.execute(
-                    f"DELETE FROM {table} WHERE thread_id = %s",
-                    (session_id,)
-                )
+        """清除对话历史（检查点与会话记录在同一事务中删除）"""
+        await self.purger.purge([session_id])
         logger.info("chat_history_cleared", session_id=session_id)
 
+    def _forget_threads(self, thread_ids: List[str]) -> None:
+        """thread 被删除后清理本进程内的缓存"""
+        for thread_id in thread_ids:
+            if self._checkpointer is not None:
+                self._checkpointer.invalidate(thread_id)
+            self.memory_gate.discard_session(thread_id)
+        self.history_flight.invalidate(thread_ids)
+
+    def _threads_purged(self, thread_ids: List[str], user_id: Optional[str]) -> None:
+        """会话清除后通知所有 worker（本进程在 publish 中同步失效）"""
+        invalidation_bus.publish("thread", *thread_ids)
+        if user_id:
+            invalidation_bus.publish("sessions", user_id)
+        else:
+            # 不知道属于哪些用户时清空会话列表缓存
+            invalidation_bus.publish("sessions")
+
+    def _on_threads_invalidated(self, thread_ids: Optional[List[str]]) -> None:
+        # 检查点缓存每次读取都会校验最新 checkpoint_id，事件丢失时不会返回已删除的状态
+        if thread_ids:
+            self._forget_threads(thread_ids)
+
+    async def forget_user_memories(self, user_id: str) -> None:
+        """删除用户的全部长期记忆"""
+        memory = await self._get_memory()
+        await memory.delete_all(user_id=user_id)
+        logger.info("user_memories_deleted", user_id=user_id)
+
     async def get_sessions(self, user_id: str) -> List[dict]:
         """获取用户的所有会话列表"""
         conn_pool = await self._get_connection_pool()
@@ -367,6 +715,24 @@ class LangGraphAgent:
         except Exception:
             return None
 
+    async def drain(self) -> None:
+        """写入后台工作：等待保存记忆的任务，提取 MemoryGate 缓存的会话，等待检索索引"""
+        if self._background:
+            await asyncio.gather(*self._background, return_exceptions=True)
+        await self.memory_gate.flush_all()
+        await self.message_index.close()
+
+    async def close(self) -> None:
+        """关闭检查点、会话锁、只读副本连接池与嵌入批处理客户端（先等待进行中的索引任务）"""
+        await self.message_index.close()
+        if self._embedding_batcher is not None:
+            await self._embedding_batcher.aclose()
+        for pool in (self._connection_pool, self._lock_pool, self._replica_pool):
+            if pool is not None:
+                await pool.close()
+        self._connection_pool = self._lock_pool = self._replica_pool = None
+        self._graph = None
+
 
 # 创建全局 Agent 实例
 agent = LangGraphAgent()
\ No newline at end of file
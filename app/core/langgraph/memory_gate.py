@@ -0,0 +1,226 @@
+"""长期记忆提取前的过滤门
+
+mem0 的 add 会对每轮对话调用一次 LLM 提取用户事实。
+MemoryGate 先用本地启发式规则（或注入的模型）判断这一轮是否值得提取，
+问候、致谢、纯计算/查时间这类不含用户信息的轮次直接跳过；
+batch 模式下还会把同一会话的有效轮次攒起来，在会话结束时合并为一次提取。
+"""
+
+import asyncio
+import importlib
+import re
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.logging import logger
+
+# 寒暄 / 致谢等无信息量的消息
+SMALLTALK = {
+    "你好", "您好", "嗨", "哈喽", "在吗", "在么", "谢谢", "多谢", "感谢", "谢啦",
+    "好的", "好", "嗯", "嗯嗯", "哦", "ok", "okay", "行", "可以", "收到", "明白",
+    "再见", "拜拜", "晚安", "早上好", "晚上好", "hi", "hello", "hey", "thanks",
+    "thank you", "bye", "good night",
+}
+
+# 用户自述事实的特征
+FACT_PATTERNS = [
+    re.compile(
+        r"我(平时|一般|每天|经常|一直|最近|现在|目前|今年|明年|去年)?"
+        r"(是|叫|姓|在|住|的|有|喜欢|不喜欢|爱|讨厌|打算|计划|正在|习惯|养了|学|做)"
+    ),
+    re.compile(r"(我们|我家|我老婆|我老公|我女朋友|我男朋友|我孩子|我儿子|我女儿|我妈|我爸)"),
+    re.compile(r"\b(i am|i'm|i have|i like|i love|i hate|i live|i work|my)\b", re.IGNORECASE),
+]
+
+# 明确要求记住
+REMEMBER_PATTERN = re.compile(r"(记住|记下|别忘了|remember)", re.IGNORECASE)
+
+# 纯计算或查时间
+ARITHMETIC_PATTERN = re.compile(r"^[\d\s+\-*/().=?？xX×÷%^]+$")
+TOOL_QUERY_PATTERN = re.compile(
+    r"(几点|现在时间|当前时间|今天几号|今天星期|日期|计算|算一下|等于多少|what time|calculate)",
+    re.IGNORECASE,
+)
+
+PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+
+# 外部分类器：返回该轮包含用户事实的概率，返回 None 时回退到启发式规则
+Classifier = Callable[[str, str], Optional[float]]
+Extractor = Callable[[str, List[dict]], Awaitable[None]]
+
+
+@dataclass
+class GateDecision:
+    """过滤结果"""
+    extract: bool
+    reason: str
+    score: float
+
+
+def load_classifier(path: str) -> Optional[Classifier]:
+    """按 "package.module:function" 加载分类器"""
+    if not path:
+        return None
+    module_name, _, attr = path.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class MemoryGate:
+    """决定哪些对话轮次需要送去 mem0 提取"""
+
+    def __init__(
+        self,
+        extractor: Extractor,
+        mode: str = "gate",
+        threshold: float = 0.5,
+        min_chars: int = 4,
+        batch_idle_seconds: float = 600,
+        batch_max_turns: int = 20,
+        classifier: Optional[Classifier] = None,
+    ):
+        """
+        Args:
+            extractor: 实际执行提取的协程函数 (user_id, messages)
+            mode: off 不过滤；gate 逐轮过滤；batch 过滤后按会话合并提取
+        """
+        self._extractor = extractor
+        self.mode = mode
+        self.threshold = threshold
+        self.min_chars = min_chars
+        self.batch_idle_seconds = batch_idle_seconds
+        self.batch_max_turns = batch_max_turns
+        self._classifier = classifier
+
+        # batch 模式下按会话缓存的轮次
+        self._buffers: Dict[str, Tuple[str, List[dict]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: set = set()
+
+        # 统计
+        self.turns = 0
+        self.extractions = 0
+
+    def set_classifier(self, classifier: Optional[Classifier]) -> None:
+        """注入模型分类器"""
+        self._classifier = classifier
+
+    def classify(self, user_text: str, assistant_text: str = "") -> GateDecision:
+        """判断一轮对话是否值得提取长期记忆"""
+        if self._classifier is not None:
+            try:
+                score = self._classifier(user_text, assistant_text)
+            except Exception as e:
+                logger.warning("memory_gate_classifier_failed", error=str(e))
+                score = None
+            if score is not None:
+                return GateDecision(score >= self.threshold, "classifier", score)
+
+        text = user_text.strip()
+        normalized = PUNCTUATION.sub("", text).lower()
+
+        if REMEMBER_PATTERN.search(text):
+            return GateDecision(True, "remember_request", 1.0)
+        if not normalized or text.lower().strip("!！。.~～ ") in SMALLTALK or normalized in SMALLTALK:
+            return GateDecision(False, "smalltalk", 0.0)
+        if ARITHMETIC_PATTERN.match(text):
+            return GateDecision(False, "arithmetic", 0.0)
+        if len(normalized) < self.min_chars:
+            return GateDecision(False, "too_short", 0.0)
+
+        score = 0.0
+        if any(pattern.search(text) for pattern in FACT_PATTERNS):
+            score += 0.6
+        if TOOL_QUERY_PATTERN.search(text):
+            score -= 0.3
+        if len(normalized) >= 20:
+            score += 0.1
+        if text.endswith(("?", "？", "吗", "呢")):
+            score -= 0.1
+        score = max(0.0, min(1.0, score))
+
+        if score >= self.threshold:
+            return GateDecision(True, "user_facts", score)
+        return GateDecision(False, "no_user_facts", score)
+
+    async def submit(self, user_id: str, session_id: Optional[str], messages: List[dict]) -> None:
+        """提交一轮对话"""
+        self.turns += 1
+        if self.mode == "off":
+            await self._extract(user_id, messages)
+            return
+
+        user_text = " ".join(m["content"] for m in messages if m["role"] == "user")
+        assistant_text = " ".join(m["content"] for m in messages if m["role"] == "assistant")
+        decision = self.classify(user_text, assistant_text)
+        logger.info(
+            "memory_gate_decision",
+            user_id=user_id,
+            session_id=session_id,
+            extract=decision.extract,
+            reason=decision.reason,
+            score=round(decision.score, 2),
+        )
+        if not decision.extract:
+            return
+
+        if self.mode != "batch" or session_id is None:
+            await self._extract(user_id, messages)
+            return
+
+        _, buffered = self._buffers.setdefault(session_id, (user_id, []))
+        buffered.extend(messages)
+        if len(buffered) >= self.batch_max_turns * 2:
+            await self.flush_session(session_id)
+        else:
+            self._schedule_flush(session_id)
+
+    def _schedule_flush(self, session_id: str) -> None:
+        """会话空闲一段时间后视为结束并提取"""
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        def fire():
+            self._timers.pop(session_id, None)
+            task = asyncio.create_task(self.flush_session(session_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        self._timers[session_id] = asyncio.get_running_loop().call_later(
+            self.batch_idle_seconds, fire
+        )
+
+    async def flush_session(self, session_id: str) -> None:
+        """把会话缓存的轮次合并为一次提取"""
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        item = self._buffers.pop(session_id, None)
+        if item is None:
+            return
+        user_id, messages = item
+        logger.info(
+            "memory_gate_batch_flushed",
+            user_id=user_id,
+            session_id=session_id,
+            message_count=len(messages),
+        )
+        await self._extract(user_id, messages)
+
+    async def flush_all(self) -> None:
+        """提取所有缓存的会话（用于关闭前）"""
+        for session_id in list(self._buffers):
+            await self.flush_session(session_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def discard_session(self, session_id: str) -> None:
+        """丢弃会话缓存（会话被删除时）"""
+        timer = self._timers.pop(session_id, None)
+        if timer is not None:
+            timer.cancel()
+        self._buffers.pop(session_id, None)
+
+    async def _extract(self, user_id: str, messages: List[dict]) -> None:
+        self.extractions += 1
+        await self._extractor(user_id, messages)
@@ -0,0 +1,251 @@
+"""对话消息检索
+
+- 每轮对话结束后把该 thread 中尚未索引的用户消息和助手回复写入 message_index 表
+- content 上有 pg_trgm GIN 索引，ILIKE '%关键词%' 不需要分词即可走索引，适合中文
+- 结果按 word_similarity 排序、分页，返回会话 ID 和命中位置附近的片段；
+  数据库没有 pg_trgm 扩展时退化为不走索引的 ILIKE 扫描，按时间倒序
+- backfill 为已有的检查点补建索引（可重复执行，已索引的消息会跳过）
+
+运行回填: python -m app.core.langgraph.message_index
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.logging import logger
+
+# 片段长度（字符）及命中位置之前保留的字符数
+SNIPPET_LENGTH = 120
+SNIPPET_BEFORE = 40
+
+SEARCH_SQL = """
+SELECT session_id, role, seq, created_at,
+       word_similarity(%(q)s, content) AS score,
+       substr(content, greatest(1, strpos(lower(content), lower(%(q)s)) - %(before)s), %(length)s)
+FROM message_index
+WHERE user_id = %(user_id)s AND content ILIKE %(pattern)s
+ORDER BY score DESC, created_at DESC
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+# 没有 pg_trgm 时不能用 word_similarity，只按时间排序
+SEARCH_SQL_PLAIN = """
+SELECT session_id, role, seq, created_at,
+       0.0 AS score,
+       substr(content, greatest(1, strpos(lower(content), lower(%(q)s)) - %(before)s), %(length)s)
+FROM message_index
+WHERE user_id = %(user_id)s AND content ILIKE %(pattern)s
+ORDER BY created_at DESC
+LIMIT %(limit)s OFFSET %(offset)s
+"""
+
+
+@dataclass
+class SearchHit:
+    """一条命中的消息"""
+    session_id: str
+    role: str
+    seq: int
+    created_at: datetime
+    score: float
+    snippet: str
+
+
+def _like_pattern(query: str) -> str:
+    """转义 LIKE 通配符"""
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _indexable(messages: List[BaseMessage], start: int) -> List[Tuple[int, str, str]]:
+    """从第 start 条开始，需要索引的 (seq, role, content)"""
+    rows = []
+    for seq in range(start, len(messages)):
+        msg = messages[seq]
+        if isinstance(msg, HumanMessage):
+            role = "user"
+        elif isinstance(msg, AIMessage) and msg.content:
+            role = "assistant"
+        else:
+            continue
+        if isinstance(msg.content, str) and msg.content.strip():
+            rows.append((seq, role, msg.content))
+    return rows
+
+
+class MessageIndexer:
+    """维护 message_index 表并提供检索"""
+
+    def __init__(
+        self,
+        pool_factory: Callable[[], Awaitable[AsyncConnectionPool]],
+        load_messages: Callable[[str], Awaitable[List[BaseMessage]]],
+    ):
+        self._pool_factory = pool_factory
+        self._load_messages = load_messages
+        # 正在索引的会话；期间又有新轮次时记入 _dirty，当前任务结束后再跑一次
+        self._running: Set[str] = set()
+        self._dirty: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._trgm: Optional[bool] = None
+
+    # ============ 写入 ============
+
+    def schedule(self, session_id: str, user_id: str) -> None:
+        """轮次结束后调用，在后台索引新消息"""
+        if session_id in self._running:
+            self._dirty.add(session_id)
+            return
+        self._running.add(session_id)
+        task = asyncio.create_task(self._index_loop(session_id, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _index_loop(self, session_id: str, user_id: str) -> None:
+        try:
+            while True:
+                self._dirty.discard(session_id)
+                try:
+                    await self.index_thread(session_id, user_id)
+                except Exception as e:
+                    logger.error("message_index_failed", session_id=session_id, error=str(e))
+                if session_id not in self._dirty:
+                    return
+        finally:
+            self._running.discard(session_id)
+
+    async def index_thread(self, session_id: str, user_id: str) -> int:
+        """索引 thread 中尚未索引的消息，返回新增条数"""
+        pool = await self._pool_factory()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                "SELECT max(seq) FROM message_index WHERE session_id = %s", (session_id,)
+            )
+            last_seq = (await cursor.fetchone())[0]
+
+        messages = await self._load_messages(session_id)
+        rows = _indexable(messages, 0 if last_seq is None else last_seq + 1)
+        if not rows:
+            return 0
+
+        async with pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.executemany(
+                    """
+                    INSERT INTO message_index (id, user_id, session_id, seq, role, content, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, now())
+                    ON CONFLICT (session_id, seq) DO NOTHING
+                    """,
+                    [(uuid.uuid4(), user_id, session_id, seq, role, content)
+                     for seq, role, content in rows],
+                )
+        return len(rows)
+
+    async def backfill(self, concurrency: int = 4, progress_every: int = 500) -> Dict[str, int]:
+        """为已有检查点补建索引"""
+        start = time.perf_counter()
+        pool = await self._pool_factory()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                """
+                SELECT DISTINCT ON (c.thread_id) c.thread_id,
+                       COALESCE(c.metadata->>'user_id', s.user_id::text)
+                FROM checkpoints c
+                LEFT JOIN "session" s ON s.id::text = c.thread_id
+                WHERE c.checkpoint_ns = ''
+                """
+            )
+            threads = [row for row in await cursor.fetchall() if row[1]]
+
+        stats = {"threads": len(threads), "done": 0, "messages": 0, "failed": 0}
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in threads:
+            queue.put_nowait(item)
+
+        async def worker():
+            while not queue.empty():
+                thread_id, user_id = queue.get_nowait()
+                try:
+                    stats["messages"] += await self.index_thread(thread_id, user_id)
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.error("message_backfill_failed", session_id=thread_id, error=str(e))
+                stats["done"] += 1
+                if stats["done"] % progress_every == 0:
+                    logger.info("message_backfill_progress", **stats)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        logger.info(
+            "message_backfill_completed",
+            duration_s=round(time.perf_counter() - start, 1),
+            **stats,
+        )
+        return stats
+
+    # ============ 检索 ============
+
+    async def _has_trgm(self, conn: AsyncConnection) -> bool:
+        """数据库是否装有 pg_trgm（结果按进程缓存）"""
+        if self._trgm is None:
+            cursor = await conn.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            self._trgm = await cursor.fetchone() is not None
+            if not self._trgm:
+                logger.warning("message_search_trgm_unavailable")
+        return self._trgm
+
+    async def search(
+        self,
+        user_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Tuple[List[SearchHit], bool]:
+        """检索用户的消息
+
+        Returns:
+            (命中列表, 是否还有下一页)
+        """
+        pool = await self._pool_factory()
+        async with pool.connection() as conn:
+            cursor = await conn.execute(
+                SEARCH_SQL if await self._has_trgm(conn) else SEARCH_SQL_PLAIN,
+                {
+                    "q": query,
+                    "pattern": _like_pattern(query),
+                    "user_id": user_id,
+                    "before": SNIPPET_BEFORE,
+                    "length": SNIPPET_LENGTH,
+                    # 多取一条判断是否还有下一页
+                    "limit": limit + 1,
+                    "offset": offset,
+                },
+            )
+            rows = await cursor.fetchall()
+        hits = [SearchHit(str(r[0]), r[1], r[2], r[3], float(r[4]), r[5]) for r in rows[:limit]]
+        return hits, len(rows) > limit
+
+    async def close(self) -> None:
+        """等待进行中的索引任务"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def _backfill() -> None:
+    from app.core.langgraph.graph import agent
+
+    try:
+        await agent.message_index.backfill()
+    finally:
+        await agent.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_backfill())
@@ -0,0 +1,205 @@
+"""按轮次难度选择模型
+
+用本地特征（消息长度、历史深度、是否像工具类问题等）给本轮打一个复杂度分，
+从配置的模型梯队（从小到大）中选择一档；置信度低、小模型调用失败或工具调用解析失败时升级到更大的模型。
+可能被升级的档位不流式输出（回复被接受后作为整条消息输出），避免客户端先收到小模型的半截回复。
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from app.core.langgraph.memory_gate import ARITHMETIC_PATTERN, SMALLTALK, TOOL_QUERY_PATTERN
+from app.core.logging import logger
+
+# 需要推理 / 生成较长内容的请求
+HARD_PATTERN = re.compile(
+    r"(为什么|原理|分析|比较|对比|设计|方案|推导|证明|解释|总结|翻译|改写|写一|代码|程序|函数|"
+    r"报错|调试|优化|架构|步骤|计划|why|explain|analy[sz]e|compare|design|code|debug|write)",
+    re.IGNORECASE,
+)
+CODE_PATTERN = re.compile(r"(```|def |class |import |SELECT |function |=>|\{\s*\")")
+
+# 模型把工具调用写进了正文（没有被解析成 tool_calls）
+RAW_TOOL_CALL_PATTERN = re.compile(r"(<tool_call>|\"(name|function)\"\s*:\s*\"\w+\"\s*,\s*\"(arguments|parameters)\")")
+
+
+@dataclass
+class RouteDecision:
+    """路由结果"""
+    tier: int
+    model: str
+    reason: str
+    score: float
+    confidence: float
+
+
+class ModelRouter:
+    """模型梯队路由"""
+
+    def __init__(
+        self,
+        tiers: Sequence[str],
+        min_confidence: float = 0.5,
+        tool_names: Sequence[str] = (),
+    ):
+        """
+        Args:
+            tiers: 模型列表，从小到大
+            min_confidence: 置信度低于该值时直接升一档
+            tool_names: 已绑定的工具名，用于校验工具调用
+        """
+        if not tiers:
+            raise ValueError("至少需要一个模型")
+        self.tiers = list(tiers)
+        self.min_confidence = min_confidence
+        self.tool_names = set(tool_names)
+
+        # 统计：每档调用次数 / 总耗时 / 升级次数
+        self.calls: Dict[str, int] = {model: 0 for model in self.tiers}
+        self.latency: Dict[str, float] = {model: 0.0 for model in self.tiers}
+        self.escalations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.tiers) > 1
+
+    def score(self, messages: Sequence[BaseMessage]) -> tuple[float, str]:
+        """本轮复杂度 0~1 及主要原因"""
+        humans = [m for m in messages if isinstance(m, HumanMessage)]
+        text = str(humans[-1].content).strip() if humans else ""
+        lowered = text.lower().strip("!！。.~～?？ ")
+
+        if not text or lowered in SMALLTALK:
+            return 0.0, "smalltalk"
+        if ARITHMETIC_PATTERN.match(text):
+            return 0.05, "arithmetic"
+
+        score = 0.15
+        reason = "short"
+        if TOOL_QUERY_PATTERN.search(text) and len(text) <= 40:
+            # 查时间 / 简单计算：小模型调用工具即可
+            return 0.1, "simple_tool"
+        if len(text) > 80:
+            score += 0.2
+            reason = "long"
+        if len(text) > 300:
+            score += 0.2
+        if HARD_PATTERN.search(text):
+            score += 0.35
+            reason = "reasoning"
+        if CODE_PATTERN.search(text):
+            score += 0.3
+            reason = "code"
+        if len(humans) > 6:
+            # 深历史需要更强的上下文理解
+            score += 0.1
+        if text.count("？") + text.count("?") > 1:
+            score += 0.1
+        return min(1.0, score), reason
+
+    def route(self, messages: Sequence[BaseMessage]) -> RouteDecision:
+        """选择本轮使用的模型"""
+        if not self.enabled:
+            return RouteDecision(0, self.tiers[0], "single_tier", 0.0, 1.0)
+
+        score, reason = self.score(messages)
+        count = len(self.tiers)
+        tier = min(count - 1, int(score * count))
+
+        # 离上一档的边界越远，越有把握当前档位够用
+        confidence = 1.0
+        if tier < count - 1:
+            width = 1 / count
+            confidence = min(1.0, ((tier + 1) * width - score) / (width / 2))
+        if confidence < self.min_confidence:
+            tier += 1
+            reason = "low_confidence"
+        return RouteDecision(tier, self.tiers[tier], reason, score, confidence)
+
+    def invalid_tool_call(self, response: BaseMessage) -> Optional[str]:
+        """检查工具调用是否解析失败，返回失败原因"""
+        if getattr(response, "invalid_tool_calls", None):
+            return "invalid_tool_calls"
+        tool_calls = getattr(response, "tool_calls", None) or []
+        if self.tool_names and any(call["name"] not in self.tool_names for call in tool_calls):
+            return "unknown_tool"
+        if not tool_calls and RAW_TOOL_CALL_PATTERN.search(str(response.content)):
+            return "unparsed_tool_call"
+        return None
+
+    async def call(
+        self,
+        messages: Sequence[BaseMessage],
+        invoke: Callable[[str, bool], Awaitable[BaseMessage]],
+        session_id: Optional[str] = None,
+    ) -> BaseMessage:
+        """按路由结果调用模型，失败时逐档升级
+
+        Args:
+            messages: 本轮的对话消息（用于路由）
+            invoke: invoke(model, stream)，用指定模型执行调用的协程函数；
+                stream 为 False 时不能把 token 流式输出给客户端
+        """
+        decision = self.route(messages)
+        logger.info(
+            "model_routed",
+            session_id=session_id,
+            model=decision.model,
+            tier=decision.tier,
+            reason=decision.reason,
+            score=round(decision.score, 2),
+            confidence=round(decision.confidence, 2),
+        )
+
+        tier = decision.tier
+        while True:
+            model = self.tiers[tier]
+            final = tier == len(self.tiers) - 1
+            start = time.perf_counter()
+            try:
+                response = await invoke(model, final)
+                failure = None if final else self.invalid_tool_call(response)
+            except Exception as e:
+                if final:
+                    raise
+                response, failure = None, f"error: {e}"
+            elapsed = time.perf_counter() - start
+
+            self.calls[model] += 1
+            self.latency[model] += elapsed
+            logger.info(
+                "model_tier_latency",
+                session_id=session_id,
+                model=model,
+                tier=tier,
+                duration_ms=round(elapsed * 1000, 1),
+                escalated_from=decision.model if tier != decision.tier else None,
+            )
+            if failure is None:
+                return response
+
+            self.escalations += 1
+            logger.warning(
+                "model_escalated",
+                session_id=session_id,
+                model=model,
+                next_model=self.tiers[tier + 1],
+                reason=failure,
+            )
+            tier += 1
+
+    def stats(self) -> List[dict]:
+        """每档的调用次数与平均耗时"""
+        return [
+            {
+                "model": model,
+                "calls": self.calls[model],
+                "avg_ms": round(self.latency[model] / self.calls[model] * 1000, 1)
+                if self.calls[model] else 0.0,
+            }
+            for model in self.tiers
+        ]
@@ -0,0 +1,168 @@
+"""会话清除
+
+- 一次清除一个或多个 thread：检查点各表、消息检索索引与 session 记录在同一个事务中用 thread_id = ANY(...) 删除
+- 指定用户时只删除属于该用户的 thread（session 记录或检查点 metadata 中的 user_id）
+- 大批量清除按块执行，每块一个短事务并设置 lock_timeout，块之间短暂停顿，避免长时间占用热点表
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional, Sequence
+from uuid import UUID
+
+from psycopg import AsyncConnection
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.logging import logger
+
+
+def _uuids(thread_ids: Sequence[str]) -> List[UUID]:
+    """session 表的主键是 UUID，忽略无法解析的 thread_id"""
+    result = []
+    for thread_id in thread_ids:
+        try:
+            result.append(UUID(thread_id))
+        except ValueError:
+            continue
+    return result
+
+
+class SessionPurger:
+    """按 thread_id 批量删除对话状态与会话记录"""
+
+    def __init__(
+        self,
+        pool_factory: Callable[[], Awaitable[AsyncConnectionPool]],
+        tables: Sequence[str],
+        chunk_size: int = 200,
+        chunk_pause: float = 0.1,
+        lock_timeout: float = 5.0,
+        on_purged: Optional[Callable[[List[str], Optional[str]], None]] = None,
+    ):
+        self._pool_factory = pool_factory
+        self.tables = list(tables)
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.lock_timeout = lock_timeout
+        self._on_purged = on_purged
+
+    async def _owned_threads(
+        self,
+        conn: AsyncConnection,
+        user_id: str,
+        thread_ids: Optional[Sequence[str]] = None,
+    ) -> List[str]:
+        """筛选属于用户的 thread；thread_ids 为空时返回用户的全部 thread"""
+        if thread_ids is None:
+            cursor = await conn.execute(
+                """
+                SELECT id::text FROM "session" WHERE user_id = %s::uuid
+                UNION
+                SELECT DISTINCT thread_id FROM checkpoints WHERE metadata->>'user_id' = %s
+                """,
+                (user_id, user_id),
+            )
+        else:
+            cursor = await conn.execute(
+                """
+                SELECT id::text FROM "session" WHERE id = ANY(%s) AND user_id = %s::uuid
+                UNION
+                SELECT DISTINCT thread_id FROM checkpoints
+                WHERE thread_id = ANY(%s) AND metadata->>'user_id' = %s
+                """,
+                (_uuids(thread_ids), user_id, list(thread_ids), user_id),
+            )
+        return [row[0] for row in await cursor.fetchall()]
+
+    async def _delete(self, conn: AsyncConnection, thread_ids: List[str]) -> None:
+        """在一个事务中删除一组 thread"""
+        async with conn.transaction():
+            # 拿不到行锁时尽快失败，而不是排在热点写入后面
+            await conn.execute(f"SET LOCAL lock_timeout = '{int(self.lock_timeout * 1000)}ms'")
+            for table in self.tables:
+                await conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ANY(%s)",
+                    (thread_ids,),
+                )
+            await conn.execute(
+                "DELETE FROM message_index WHERE session_id = ANY(%s)",
+                (thread_ids,),
+            )
+            await conn.execute(
+                'DELETE FROM "session" WHERE id = ANY(%s)',
+                (_uuids(thread_ids),),
+            )
+
+    def _purged(self, thread_ids: List[str], user_id: Optional[str]) -> None:
+        if thread_ids and self._on_purged is not None:
+            self._on_purged(thread_ids, user_id)
+
+    async def purge(self, thread_ids: Sequence[str], user_id: Optional[str] = None) -> List[str]:
+        """在一个事务中删除给定的 thread
+
+        Args:
+            user_id: 指定时只删除属于该用户的 thread
+
+        Returns:
+            实际删除的 thread_id
+        """
+        start = time.perf_counter()
+        pool = await self._pool_factory()
+        async with pool.connection() as conn:
+            if user_id is not None:
+                targets = await self._owned_threads(conn, user_id, thread_ids)
+            else:
+                targets = list(dict.fromkeys(thread_ids))
+            if targets:
+                await self._delete(conn, targets)
+
+        self._purged(targets, user_id)
+        logger.info(
+            "sessions_purged",
+            user_id=user_id,
+            requested=len(thread_ids),
+            purged=len(targets),
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        return targets
+
+    async def purge_in_chunks(
+        self,
+        user_id: str,
+        thread_ids: Optional[Sequence[str]] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> int:
+        """分块删除用户的 thread（thread_ids 为空时删除全部），每块一个事务
+
+        Args:
+            progress: 每块完成后回调 (已删除数, 总数)
+
+        Returns:
+            删除的 thread 数
+        """
+        start = time.perf_counter()
+        pool = await self._pool_factory()
+        async with pool.connection() as conn:
+            targets = await self._owned_threads(conn, user_id, thread_ids)
+
+        purged = 0
+        for offset in range(0, len(targets), self.chunk_size):
+            chunk = targets[offset:offset + self.chunk_size]
+            # 每块单独借用连接，块之间不占用连接池
+            async with pool.connection() as conn:
+                await self._delete(conn, chunk)
+            self._purged(chunk, user_id)
+            purged += len(chunk)
+            if progress is not None:
+                progress(purged, len(targets))
+            if purged < len(targets):
+                await asyncio.sleep(self.chunk_pause)
+
+        logger.info(
+            "sessions_purged_in_chunks",
+            user_id=user_id,
+            purged=purged,
+            chunks=-(-purged // self.chunk_size),
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        return purged
@@ -0,0 +1,199 @@
+"""会话级轮次互斥
+
+同一 worker 内用 asyncio.Lock 排队，跨 worker 用 Postgres advisory lock，
+保证同一个 thread_id 同一时间只有一轮对话在执行。
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+from psycopg_pool import AsyncConnectionPool
+
+from app.core.logging import logger
+
+T = TypeVar("T")
+
+# advisory lock 的命名空间（两参数形式的第一个 key），避免与其他用途冲突
+ADVISORY_LOCK_CLASS = 0x4148
+
+LOCK_MODES = ("queue", "reject", "join")
+
+
+class SessionBusyError(Exception):
+    """会话正在处理另一轮对话"""
+
+    def __init__(self, session_id: str):
+        super().__init__(f"会话 {session_id} 正在处理中")
+        self.session_id = session_id
+
+
+class _LocalEntry:
+    """进程内的锁条目"""
+
+    __slots__ = ("lock", "refs", "inflight")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+        self.inflight: Optional[asyncio.Future] = None
+
+
+class SessionLease:
+    """已获取的会话锁，轮次结束后必须 release"""
+
+    def __init__(self, manager: "SessionLockManager", session_id: str, entry: _LocalEntry):
+        self._manager = manager
+        self.session_id = session_id
+        self.entry = entry
+        self._conn_ctx = None
+        self._conn = None
+        self._released = False
+
+    async def release(self) -> None:
+        """释放 advisory lock 和进程内锁"""
+        if self._released:
+            return
+        self._released = True
+        try:
+            if self._conn is not None:
+                await self._conn.execute(
+                    "SELECT pg_advisory_unlock(%s, hashtext(%s))",
+                    (ADVISORY_LOCK_CLASS, self.session_id),
+                )
+        except Exception as e:
+            # session 级 advisory lock 只在连接断开时才会释放，归还到池中的连接会一直持有它：
+            # 关闭连接，连接池收回时会丢弃已关闭的连接
+            logger.warning("session_advisory_unlock_failed", session_id=self.session_id, error=str(e))
+            try:
+                await self._conn.close()
+            except Exception:
+                pass
+        finally:
+            if self._conn_ctx is not None:
+                await self._conn_ctx.__aexit__(None, None, None)
+            self.entry.lock.release()
+            self._manager._unref(self.session_id, self.entry)
+
+
+class SessionLockManager:
+    """按 thread_id 管理轮次互斥"""
+
+    def __init__(
+        self,
+        pool_factory: Optional[Callable[[], Awaitable[AsyncConnectionPool]]] = None,
+        mode: str = "queue",
+        timeout: float = 120.0,
+    ):
+        if mode not in LOCK_MODES:
+            raise ValueError(f"未知的会话锁模式: {mode}")
+        self._pool_factory = pool_factory
+        self.mode = mode
+        self.timeout = timeout
+        self._entries: Dict[str, _LocalEntry] = {}
+
+    def _ref(self, session_id: str) -> _LocalEntry:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._entries[session_id] = _LocalEntry()
+        entry.refs += 1
+        return entry
+
+    def _unref(self, session_id: str, entry: _LocalEntry) -> None:
+        """没有持有者和等待者时从锁表中移除"""
+        entry.refs -= 1
+        if entry.refs <= 0 and self._entries.get(session_id) is entry:
+            del self._entries[session_id]
+
+    def is_busy(self, session_id: str) -> bool:
+        """当前 worker 上该会话是否有进行中的轮次"""
+        entry = self._entries.get(session_id)
+        return entry is not None and entry.lock.locked()
+
+    async def acquire(self, session_id: str, mode: Optional[str] = None) -> SessionLease:
+        """获取会话锁
+
+        Args:
+            session_id: 会话 ID（即 thread_id）
+            mode: queue 排队等待，reject 立即失败；join 在此处等同于 queue
+
+        Raises:
+            SessionBusyError: reject 模式下会话忙，或排队超时
+        """
+        mode = mode or self.mode
+        deadline = time.monotonic() + self.timeout
+        entry = self._ref(session_id)
+        try:
+            if mode == "reject" and entry.lock.locked():
+                raise SessionBusyError(session_id)
+            try:
+                await asyncio.wait_for(entry.lock.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise SessionBusyError(session_id)
+        except BaseException:
+            self._unref(session_id, entry)
+            raise
+
+        lease = SessionLease(self, session_id, entry)
+        if self._pool_factory is None:
+            return lease
+
+        try:
+            await self._acquire_advisory(lease, mode, deadline)
+        except BaseException:
+            await lease.release()
+            raise
+        return lease
+
+    async def _acquire_advisory(self, lease: SessionLease, mode: str, deadline: float) -> None:
+        """在专用连接上获取跨 worker 的 advisory lock"""
+        pool = await self._pool_factory()
+        lease._conn_ctx = pool.connection()
+        lease._conn = await lease._conn_ctx.__aenter__()
+
+        delay = 0.05
+        while True:
+            cursor = await lease._conn.execute(
+                "SELECT pg_try_advisory_lock(%s, hashtext(%s))",
+                (ADVISORY_LOCK_CLASS, lease.session_id),
+            )
+            row = await cursor.fetchone()
+            if row[0]:
+                return
+            if mode == "reject" or time.monotonic() + delay > deadline:
+                # 未拿到锁，不需要 unlock
+                lease._conn = None
+                raise SessionBusyError(lease.session_id)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def run(self, session_id: str, turn: Callable[[], Awaitable[T]]) -> T:
+        """在会话锁内执行一轮对话
+
+        join 模式下，如果本 worker 上已有进行中的轮次，直接等待并返回它的结果；
+        跨 worker 无法共享结果，退化为排队。
+        """
+        if self.mode == "join":
+            entry = self._entries.get(session_id)
+            if entry is not None and entry.inflight is not None:
+                logger.info("session_turn_joined", session_id=session_id)
+                return await asyncio.shield(entry.inflight)
+
+        lease = await self.acquire(session_id)
+        future = asyncio.get_running_loop().create_future()
+        # 没有加入者时避免 "exception was never retrieved" 警告
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        lease.entry.inflight = future
+        try:
+            result = await turn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            lease.entry.inflight = None
+            await lease.release()
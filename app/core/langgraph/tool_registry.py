@@ -0,0 +1,247 @@
+"""工具注册表
+
+- 工具通过 register 装饰器声明超时、是否可缓存及缓存 TTL；同步函数自动放到线程池执行
+- 可缓存工具共享一个结果缓存，键为工具名 + 规范化后的参数；并发的相同调用只执行一次
+- 需要调用 HTTP 接口的工具通过 get_http_client() 共享一个连接池，随应用 lifespan 关闭
+- 内置工具和通过 "agenthub.tools" entry point 发布的工具在首次使用时才导入
+"""
+
+import asyncio
+import importlib
+import json
+import time
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langchain_core.tools import BaseTool, tool
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.utils.cache import LRUCache
+
+ENTRY_POINT_GROUP = "agenthub.tools"
+BUILTIN_MODULES = ("app.core.langgraph.tools",)
+
+
+@dataclass
+class ToolSpec:
+    """工具及其执行选项"""
+    tool: BaseTool
+    timeout: float
+    cacheable: bool
+    ttl: float
+
+    @property
+    def name(self) -> str:
+        return self.tool.name
+
+    @property
+    def is_async(self) -> bool:
+        return getattr(self.tool, "coroutine", None) is not None
+
+
+class ToolRegistry:
+    """工具注册表"""
+
+    def __init__(
+        self,
+        default_timeout: float = 10.0,
+        default_ttl: float = 300.0,
+        cache_size: int = 1024,
+    ):
+        self.default_timeout = default_timeout
+        self.default_ttl = default_ttl
+        self._specs: Dict[str, ToolSpec] = {}
+        self._cache: LRUCache[str] = LRUCache(max_size=cache_size)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._loaded = False
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    # ============ 注册 ============
+
+    def register(
+        self,
+        func: Optional[Callable] = None,
+        *,
+        timeout: Optional[float] = None,
+        cacheable: bool = False,
+        ttl: Optional[float] = None,
+    ):
+        """注册工具（可作为装饰器使用）
+
+        Args:
+            func: 工具函数（async 或同步），docstring 作为工具描述；也可以直接传 BaseTool
+            timeout: 单次执行超时（秒）
+            cacheable: 结果只取决于参数时设为 True
+            ttl: 缓存有效期（秒），0 表示不缓存结果，只合并相同参数的并发调用
+        """
+
+        def decorator(target):
+            base_tool = target if isinstance(target, BaseTool) else tool(target)
+            if base_tool.name in self._specs:
+                logger.warning("tool_overridden", tool=base_tool.name)
+            self._specs[base_tool.name] = ToolSpec(
+                tool=base_tool,
+                timeout=self.default_timeout if timeout is None else timeout,
+                cacheable=cacheable,
+                ttl=self.default_ttl if ttl is None else ttl,
+            )
+            return base_tool
+
+        return decorator(func) if func is not None else decorator
+
+    def load(self) -> None:
+        """导入内置工具模块和 entry point 工具（只执行一次）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        start = time.perf_counter()
+
+        for module_name in BUILTIN_MODULES:
+            importlib.import_module(module_name)
+
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            try:
+                self._register_loaded(entry_point.load())
+            except Exception as e:
+                logger.error("tool_entry_point_failed", entry_point=entry_point.name, error=str(e))
+
+        logger.info(
+            "tools_loaded",
+            tools=list(self._specs),
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+
+    def _register_loaded(self, target: Any) -> None:
+        """entry point 可以指向模块（导入时自行注册）、工具对象或工具列表"""
+        if isinstance(target, ModuleType):
+            return
+        if isinstance(target, (list, tuple)):
+            for item in target:
+                self._register_loaded(item)
+            return
+        if isinstance(target, BaseTool):
+            if target.name not in self._specs:
+                self.register(target)
+            return
+        if callable(target):
+            self.register(target)
+
+    # ============ 查询 ============
+
+    @property
+    def tools(self) -> List[BaseTool]:
+        """所有工具（用于绑定到 LLM）"""
+        self.load()
+        return [spec.tool for spec in self._specs.values()]
+
+    @property
+    def names(self) -> List[str]:
+        self.load()
+        return list(self._specs)
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        self.load()
+        return self._specs.get(name)
+
+    # ============ 执行 ============
+
+    @staticmethod
+    def cache_key(name: str, args: dict) -> str:
+        """规范化参数作为缓存键"""
+        return name + ":" + json.dumps(
+            args, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+        )
+
+    async def invoke(self, name: str, args: dict) -> str:
+        """执行工具，错误和超时以文本形式返回给模型"""
+        spec = self.get(name)
+        if spec is None:
+            return f"未知工具: {name}"
+
+        if not spec.cacheable:
+            return await self._execute(spec, args)
+
+        key = self.cache_key(name, args)
+        cached = self._cache.get(key)
+        if cached is not None:
+            logger.debug("tool_cache_hit", tool=name)
+            return cached
+
+        # 相同参数的并发调用等待同一次执行
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result, ok = await self._execute(spec, args, with_status=True)
+            if ok and spec.ttl > 0:
+                self._cache.set(key, result, ttl=spec.ttl)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _execute(self, spec: ToolSpec, args: dict, with_status: bool = False):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = str(await asyncio.wait_for(spec.tool.ainvoke(args), spec.timeout))
+            ok = True
+        except asyncio.TimeoutError:
+            result = f"工具执行超时（{spec.timeout} 秒）: {spec.name}"
+        except Exception as e:
+            result = f"工具执行失败: {spec.name}: {e}"
+        logger.info(
+            "tool_executed",
+            tool=spec.name,
+            ok=ok,
+            is_async=spec.is_async,
+            duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        )
+        return (result, ok) if with_status else result
+
+    # ============ 共享 HTTP 客户端 ============
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """工具共享的 HTTP 连接池"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = httpx.AsyncClient(
+                timeout=settings.TOOL_HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.TOOL_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.TOOL_HTTP_MAX_CONNECTIONS // 5 or 1,
+                ),
+            )
+        return self._http_client
+
+    async def aclose(self) -> None:
+        """关闭共享 HTTP 客户端"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+# 创建全局实例
+tool_registry = ToolRegistry(
+    default_timeout=settings.TOOL_DEFAULT_TIMEOUT,
+    default_ttl=settings.TOOL_CACHE_TTL,
+    cache_size=settings.TOOL_CACHE_SIZE,
+)
+register_tool = tool_registry.register
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """供 HTTP 类工具使用的共享客户端"""
+    return tool_registry.http_client
@@ -1,38 +1,38 @@
-"""Agent 工具定义"""
+"""Agent 内置工具
+
+新工具用 register_tool 注册；独立发布的工具包可以通过 "agenthub.tools" entry point 接入，
+例如在其 pyproject.toml 中声明:
+
+    [project.entry-points."agenthub.tools"]
+    weather = "agenthub_weather.tools"
+"""
 
 from datetime import datetime
-from langchain_core.tools import tool
+
+from app.core.langgraph.tool_registry import register_tool
+from app.services.calculator import POOL_STARTUP_TIMEOUT, CalculatorError, calculator
 
 
-@tool
-def get_current_time() -> str:
+@register_tool(timeout=1)
+async def get_current_time() -> str:
     """获取当前时间。当用户询问现在几点或需要知道当前时间时使用。"""
     return datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")
 
 
-@tool
-def calculate(expression: str) -> str:
+# 计算服务自带结果缓存和超时，这里不再重复；
+# 超时后进程池会重建，工具超时要覆盖重建等待 + 一次求值，否则会先于计算服务自己的超时提示触发
+@register_tool(timeout=POOL_STARTUP_TIMEOUT + calculator.timeout + 1)
+async def calculate(expression: str) -> str:
     """计算数学表达式。
 
     Args:
-        expression: 数学表达式，如 "2 + 2" 或 "10 * 5"
+        expression: 数学表达式，如 "2 + 2" 或 "10 * 5"，乘方用 **
 
     Returns:
         计算结果
     """
     try:
-        # 安全地计算表达式（只允许数字和运算符）
-        allowed_chars = set("0123456789+-*/().  ")
-        if not set(expression).issubset(allowed_chars):
-            return "错误：表达式包含不允许的字符"
-        result = eval(expression)
+        result = await calculator.calculate(expression)
         return f"{expression} = {result}"
-    except Exception as e:
+    except CalculatorError as e:
         return f"计算错误: {str(e)}"
-
-
-# 工具列表
-tools = [
-    get_current_time,
-    calculate,
-]
\ No newline at end of file
@@ -1,50 +1,303 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
 
+import orjson
 import structlog
 
 from app.core.config import settings
 
 
+class RotatingFileWriter:
+    """按大小滚动的日志文件（只在写线程中使用）"""
+
+    def __init__(self, path: Path, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        # 首次写入时才创建文件（不写日志的子进程不会留下空文件）
+        self._file = None
+        self._size = 0
+
+    def write(self, data: bytes) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        if self.max_bytes and self._size + len(data) > self.max_bytes and self._size:
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = self.path.with_name(f"{self.path.name}.{i}")
+            if source.exists():
+                source.replace(self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backup_count:
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+class QueueLogWriter:
+    """后台线程批量写日志
+
+    调用方只做一次 put_nowait，队列满时丢弃并计数，不会阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_size: int = 10000,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        max_bytes: int = 100 * 1024 * 1024,
+        backup_count: int = 10,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=max_size)
+        self._file = RotatingFileWriter(path, max_bytes, backup_count)
+        self._closed = False
+
+        # 统计
+        self.written = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, record: bytes) -> None:
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch: List[bytes] = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = b""
+            stop = item is None
+            if item:
+                batch.append(item)
+            # 把队列中已有的记录一次取完（最多 batch_size 条）
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            self._report_dropped(batch)
+            if batch:
+                self._file.write(b"".join(batch))
+                self._file.flush()
+                self.written += len(batch)
+            if stop:
+                self._file.close()
+                return
+
+    def _report_dropped(self, batch: List[bytes]) -> None:
+        """把新增的丢弃数作为一条日志写入"""
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            batch.append(orjson.dumps({
+                "event": "log_records_dropped",
+                "count": dropped - self._reported_dropped,
+                "total": dropped,
+                "level": "warning",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            }) + b"\n")
+            self._reported_dropped = dropped
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def close(self, timeout: float = 5.0) -> None:
+        """写完队列中的记录后停止"""
+        if self._closed:
+            return
+        self._closed = True
+        while True:
+            try:
+                self._queue.put(None, timeout=timeout)
+                break
+            except queue.Full:
+                continue
+        self._thread.join(timeout)
+
+
+class QueueLogger:
+    """structlog 的 logger：把渲染好的记录放入写队列"""
+
+    def __init__(self, writer: QueueLogWriter):
+        self._writer = writer
+
+    def msg(self, message: bytes) -> None:
+        self._writer.put(message + b"\n")
+
+    log = debug = info = warn = warning = error = err = critical = exception = fatal = msg
+
+
+class QueueLoggerFactory:
+    def __init__(self, writer: QueueLogWriter):
+        self._logger = QueueLogger(writer)
+
+    def __call__(self, *args) -> QueueLogger:
+        return self._logger
+
+
+class QueueLogHandler(logging.Handler):
+    """把标准库日志（uvicorn、httpx 等）写入同一个队列"""
+
+    def __init__(self, writer: QueueLogWriter):
+        super().__init__()
+        self._writer = writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            event = {
+                "event": record.getMessage(),
+                "logger": record.name,
+                "level": record.levelname.lower(),
+                "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            }
+            if record.exc_info:
+                event["exception"] = logging.Formatter().formatException(record.exc_info)
+            self._writer.put(orjson.dumps(event, default=str) + b"\n")
+        except Exception:
+            self.handleError(record)
+
+
+class EventSampler:
+    """按事件名采样：rate=0.01 表示每 100 条保留 1 条"""
+
+    def __init__(self, rates: Dict[str, float]):
+        self.intervals = {
+            event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()
+        }
+        self._counts: Dict[str, int] = {}
+
+    def __call__(self, logger, method_name: str, event_dict: dict) -> dict:
+        interval = self.intervals.get(event_dict.get("event"))
+        if interval is None:
+            return event_dict
+        if interval == 0:
+            raise structlog.DropEvent
+        event = event_dict["event"]
+        count = self._counts.get(event, 0)
+        self._counts[event] = count + 1
+        if count % interval:
+            raise structlog.DropEvent
+        event_dict["sample_rate"] = 1 / interval
+        return event_dict
+
+
+def _orjson_dumps(event_dict: dict, **kwargs) -> bytes:
+    return orjson.dumps(event_dict, default=kwargs.get("default", str))
+
+
+log_writer: Optional[QueueLogWriter] = None
+
+
+def get_log_stats() -> Dict[str, int]:
+    """异步日志写入统计（未启用时为空）"""
+    return log_writer.stats() if log_writer is not None else {}
+
+
 def setup_logging():
     """配置结构化日志"""
+    global log_writer
     log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
 
     # 确保日志目录存在
     settings.LOG_DIR.mkdir(parents=True, exist_ok=True)
 
-    # 根据格式选择渲染器
-    if settings.LOG_FORMAT == "json":
-        renderer = structlog.processors.JSONRenderer()
+    processors = [structlog.contextvars.merge_contextvars]
+    if settings.LOG_SAMPLE_RATES:
+        processors.append(EventSampler(settings.LOG_SAMPLE_RATES))
+    processors += [
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso"),
+        structlog.processors.StackInfoRenderer(),
+        structlog.processors.format_exc_info,
+    ]
+
+    if settings.LOG_ASYNC:
+        # 多 worker 时每个进程写自己的文件，避免滚动时互相覆盖
+        log_writer = QueueLogWriter(
+            settings.LOG_DIR / f"app-{os.getpid()}.log",
+            max_size=settings.LOG_QUEUE_SIZE,
+            batch_size=settings.LOG_BATCH_SIZE,
+            flush_interval=settings.LOG_FLUSH_INTERVAL,
+            max_bytes=settings.LOG_FILE_MAX_BYTES,
+            backup_count=settings.LOG_FILE_BACKUP_COUNT,
+        )
+        atexit.register(log_writer.close)
+        processors.append(structlog.processors.JSONRenderer(serializer=_orjson_dumps))
+        logger_factory = QueueLoggerFactory(log_writer)
     else:
-        renderer = structlog.dev.ConsoleRenderer(colors=True)
+        # 根据格式选择渲染器
+        if settings.LOG_FORMAT == "json":
+            processors.append(structlog.processors.JSONRenderer())
+        else:
+            processors.append(structlog.dev.ConsoleRenderer(colors=True))
+        logger_factory = structlog.PrintLoggerFactory()
 
     # 配置 structlog
     structlog.configure(
-        processors=[
-            structlog.contextvars.merge_contextvars,
-            structlog.processors.add_log_level,
-            structlog.processors.TimeStamper(fmt="iso"),
-            structlog.processors.StackInfoRenderer(),
-            structlog.processors.format_exc_info,
-            renderer,
-        ],
+        processors=processors,
         wrapper_class=structlog.make_filtering_bound_logger(log_level),
         context_class=dict,
-        logger_factory=structlog.PrintLoggerFactory(),
+        logger_factory=logger_factory,
         cache_logger_on_first_use=True,
     )
 
     # 配置标准库日志
-    logging.basicConfig(
-        format="%(message)s",
-        stream=sys.stdout,
-        level=log_level,
-    )
+    if log_writer is not None:
+        handler = QueueLogHandler(log_writer)
+        logging.basicConfig(handlers=[handler], level=log_level, force=True)
+        # uvicorn 自带的 handler 直接写 stdout，统一改走队列
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = [handler]
+            uvicorn_logger.propagate = False
+    else:
+        logging.basicConfig(
+            format="%(message)s",
+            stream=sys.stdout,
+            level=log_level,
+        )
 
 
 # 初始化日志
 setup_logging()
 
 # 创建全局 logger
-logger = structlog.get_logger()
\ No newline at end of file
+logger = structlog.get_logger()
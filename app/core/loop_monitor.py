@@ -0,0 +1,163 @@
+"""事件循环阻塞监控与采样分析
+
+LoopMonitor：
+- 事件循环中的心跳协程每 interval 秒醒来一次，记录实际延迟（调度滞后）
+- 看门狗线程发现心跳超过 threshold 没有更新时，抓取事件循环线程当前的调用栈并记录
+  event_loop_blocked 日志（每次阻塞只记录一次）；阻塞结束后心跳记录 event_loop_lag（总时长）
+- 空闲时每个 interval 只有一次协程唤醒和一次线程唤醒
+
+SamplingProfiler：按固定间隔采样线程调用栈，输出 flamegraph.pl / speedscope 可读的 collapsed 格式
+（每行 "线程;外层函数;...;内层函数 次数"），只在请求时运行，同一时间只允许一个。
+
+asyncio 的 debug 模式也能报告慢回调，但开销太大不适合在生产中常开。
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from typing import Deque, Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# 只显示项目内的相对路径与 site-packages 之后的路径
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) + os.sep
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_ROOT):
+        return path[len(_ROOT):]
+    marker = path.rfind("site-packages" + os.sep)
+    if marker >= 0:
+        return path[marker + len("site-packages") + 1:]
+    return path
+
+
+class LoopMonitor:
+    """事件循环阻塞监控"""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.2, enabled: bool = True):
+        self.interval = interval
+        self.threshold = threshold
+        self.enabled = enabled
+        self.loop_thread_id: Optional[int] = None
+        self.stalls = 0
+        # 最近的调度滞后（毫秒）
+        self.lags_ms: Deque[float] = deque(maxlen=1000)
+        self._last_tick = 0.0
+        self._tick = 0
+        self._reported_tick = -1
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - start - self.interval
+            self._last_tick = now
+            self._tick += 1
+            self.lags_ms.append(lag * 1000)
+            if lag > self.threshold:
+                logger.warning("event_loop_lag", lag_ms=round(lag * 1000, 1))
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            tick = self._tick
+            blocked = time.monotonic() - self._last_tick - self.interval
+            if blocked <= self.threshold or tick == self._reported_tick:
+                continue
+            self._reported_tick = tick
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=settings.LOOP_MONITOR_STACK_LIMIT)) if frame else ""
+            logger.warning("event_loop_blocked", blocked_ms=round(blocked * 1000, 1), stack=stack)
+
+    def stats(self) -> dict:
+        lags = sorted(self.lags_ms)
+        return {
+            "stalls": self.stalls,
+            "lag_p50_ms": round(statistics.median(lags), 2) if lags else None,
+            "lag_p99_ms": round(lags[int(len(lags) * 0.99)], 2) if lags else None,
+            "lag_max_ms": round(lags[-1], 2) if lags else None,
+        }
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        if not self.enabled or self._task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._thread.join(timeout=1)
+        self._task = self._thread = None
+
+
+class ProfilerBusyError(Exception):
+    """已有采样在进行"""
+
+
+class SamplingProfiler:
+    """线程调用栈采样"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _collapse(thread_name: str, frame) -> str:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(name.replace(";", ":") for name in reversed(stack))
+
+    def profile(self, seconds: float, interval: float, thread_id: Optional[int] = None) -> str:
+        """阻塞地采样 seconds 秒（在线程中调用）；thread_id 为空时采样除自身外的所有线程"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError()
+        try:
+            own = threading.get_ident()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            counts: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own or (thread_id is not None and ident != thread_id):
+                        continue
+                    counts[self._collapse(names.get(ident, str(ident)), frame)] += 1
+                samples += 1
+                time.sleep(interval)
+        finally:
+            self._lock.release()
+        logger.info("profile_completed", seconds=seconds, samples=samples, stacks=len(counts))
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+# 创建全局实例
+loop_monitor = LoopMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    threshold=settings.LOOP_MONITOR_THRESHOLD_MS / 1000,
+    enabled=settings.LOOP_MONITOR_ENABLED,
+)
+profiler = SamplingProfiler()
@@ -1,15 +1,29 @@
 """FastAPI 主应用"""
 
+import asyncio
 import importlib
 import pkgutil
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core.drain import drain
+from app.core.loop_monitor import loop_monitor
 from app.core.logging import logger
+from app.core.langgraph.graph import agent
+from app.core.langgraph.tool_registry import tool_registry
+from app.services.calculator import calculator
 from app.services.database import db
+from app.services.invalidation import invalidation_bus
+from app.services.jobs import job_runner
+from app.services.llm import llm_service
+from app.services.memory_index import memory_index
+from app.services.replica import replica_router
+from app.services.usage import usage_ledger
+from app.utils.responses import FastJSONResponse
+from app.utils.singleflight import single_flight_stats
 import app.api as api_package
 
 
@@ -25,11 +39,51 @@ async def lifespan(app: FastAPI):
 
     # 创建数据库表
     db.create_tables()
+    # 清理过期的幂等键
+    db.delete_expired_idempotency_keys()
+    # 长期记忆索引维护
+    memory_index.start()
+    # Ollama 后端健康检查
+    llm_service.start()
+    # 计算工具进程池
+    calculator.start()
+    # 后台任务池
+    job_runner.start()
+    # token 用量批量写入
+    usage_ledger.start()
+    # 跨 worker 缓存失效监听
+    invalidation_bus.start()
+    # 只读副本复制延迟检查
+    replica_router.start()
+    # 事件循环阻塞监控
+    loop_monitor.start()
+    # SIGTERM 时先进入排空模式
+    drain.install_signal_handler()
 
     yield
 
-    # 关闭时
+    # 关闭时：uvicorn 已停止接收连接，等待进行中的流（最多到排空期限）
     logger.info("application_shutting_down")
+    drain.begin()
+    await drain.wait()
+    await job_runner.stop(timeout=drain.remaining())
+    # 写入后台工作，再关闭它们依赖的连接池
+    try:
+        await asyncio.wait_for(agent.drain(), timeout=settings.DRAIN_FLUSH_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("drain_flush_timeout", timeout_s=settings.DRAIN_FLUSH_TIMEOUT)
+    await usage_ledger.stop()
+    await agent.close()
+    await memory_index.stop()
+    await llm_service.stop()
+    await tool_registry.aclose()
+    calculator.close()
+    await invalidation_bus.stop()
+    await replica_router.stop()
+    await loop_monitor.stop()
+    db.dispose()
+    logger.info("single_flight_stats", flights=single_flight_stats())
+    logger.info("drain_completed", **drain.summary())
 
 
 # 创建 FastAPI 应用
@@ -38,6 +92,7 @@ app = FastAPI(
     version=settings.VERSION,
     description="FastAPI LangGraph AI Agent with Ollama",
     lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 # CORS 中间件
@@ -61,6 +116,16 @@ async def health():
     }
 
 
+# 就绪检查：排空时返回 503，负载均衡器据此摘除实例
+@app.get("/ready")
+async def ready(response: Response):
+    """就绪检查端点"""
+    if drain.draining:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "draining", "active_streams": drain.active}
+    return {"status": "ready", "active_streams": drain.active}
+
+
 # 自动注册路由 - 扫描 app/api/ 下所有模块
 for module_info in pkgutil.iter_modules(api_package.__path__):
     module = importlib.import_module(f"app.api.{module_info.name}")
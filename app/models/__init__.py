@@ -3,5 +3,12 @@
 from app.models.base import BaseModel
 from app.models.user import User
 from app.models.session import Session
+from app.models.idempotency import IdempotencyKey
+from app.models.job import Job, JobEvent
+from app.models.message_index import MessageIndex
+from app.models.usage import TokenUsage
 
-__all__ = ["BaseModel", "User", "Session"]
\ No newline at end of file
+__all__ = [
+    "BaseModel", "User", "Session", "IdempotencyKey", "Job", "JobEvent", "MessageIndex",
+    "TokenUsage",
+]
\ No newline at end of file
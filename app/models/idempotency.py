@@ -0,0 +1,26 @@
+"""幂等键模型"""
+
+from datetime import datetime
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Column, Text, UniqueConstraint
+from sqlmodel import Field
+
+from app.models.base import BaseModel
+
+
+class IdempotencyKey(BaseModel, table=True):
+    """聊天请求幂等键表"""
+    __tablename__ = "idempotency_key"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+
+    user_id: UUID = Field(foreign_key="user.id", index=True)
+    key: str = Field(max_length=255)
+    # 请求指纹，用于识别同一个 key 被复用到不同请求
+    request_hash: str = Field(max_length=64)
+    session_id: str = Field(max_length=64)
+    # pending / completed
+    status: str = Field(default="pending", max_length=16)
+    response: Optional[str] = Field(default=None, sa_column=Column(Text))
+    expires_at: datetime = Field(index=True)
@@ -0,0 +1,42 @@
+"""后台任务模型"""
+
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Column, Text, UniqueConstraint
+from sqlmodel import Field
+
+from app.models.base import BaseModel
+
+
+class Job(BaseModel, table=True):
+    """后台任务表（任何 worker 都能查询状态）"""
+    __tablename__ = "job"
+
+    user_id: UUID = Field(foreign_key="user.id", index=True)
+    kind: str = Field(max_length=32)
+    # queued / running / succeeded / failed
+    status: str = Field(default="queued", max_length=16)
+    session_id: Optional[str] = Field(default=None, max_length=64)
+    payload: str = Field(default="{}", sa_column=Column(Text))
+    result: Optional[str] = Field(default=None, sa_column=Column(Text))
+    error: Optional[str] = Field(default=None, sa_column=Column(Text))
+    # 执行任务的进程（主机名:pid）
+    worker: Optional[str] = Field(default=None, max_length=128)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # 心跳时间，用于识别所在进程已退出的任务
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime = Field(index=True)
+
+
+class JobEvent(BaseModel, table=True):
+    """任务进度事件"""
+    __tablename__ = "job_event"
+    __table_args__ = (UniqueConstraint("job_id", "seq", name="uq_job_event_seq"),)
+
+    job_id: UUID = Field(foreign_key="job.id", index=True)
+    seq: int
+    type: str = Field(max_length=32)
+    data: str = Field(default="null", sa_column=Column(Text))
@@ -0,0 +1,21 @@
+"""消息检索索引模型"""
+
+from uuid import UUID
+
+from sqlalchemy import Column, Text, UniqueConstraint
+from sqlmodel import Field
+
+from app.models.base import BaseModel
+
+
+class MessageIndex(BaseModel, table=True):
+    """对话消息索引表（content 上另建 pg_trgm GIN 索引，见 DatabaseService.create_tables）"""
+    __tablename__ = "message_index"
+    __table_args__ = (UniqueConstraint("session_id", "seq", name="uq_message_index_session_seq"),)
+
+    user_id: UUID = Field(index=True)
+    session_id: str = Field(max_length=64)
+    # 消息在 thread 中的位置
+    seq: int
+    role: str = Field(max_length=16)
+    content: str = Field(sa_column=Column(Text, nullable=False))
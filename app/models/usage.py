@@ -0,0 +1,23 @@
+"""Token 用量模型"""
+
+from datetime import date, datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field
+
+from app.models.base import BaseModel
+
+
+class TokenUsage(BaseModel, table=True):
+    """按用户、按天（UTC）累计的 token 用量，由 UsageLedger 批量 upsert"""
+    __tablename__ = "token_usage"
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_token_usage_user_day"),)
+
+    user_id: UUID = Field(foreign_key="user.id", index=True)
+    day: date
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # LLM 调用次数
+    requests: int = 0
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -10,10 +10,16 @@ from app.schemas.chat import (
     ChatRequest,
     ChatResponse,
     HistoryResponse,
+    PurgeRequest,
+    PurgeResponse,
+    SearchHitItem,
+    SearchResponse,
     SessionItem,
     SessionsResponse,
 )
 from app.schemas.graph import GraphState, Message
+from app.schemas.job import JobSubmitResponse, JobStatusResponse
+from app.schemas.usage import UsagePeriod, UsageResponse
 
 __all__ = [
     # Auth
@@ -25,9 +31,19 @@ __all__ = [
     "ChatRequest",
     "ChatResponse",
     "HistoryResponse",
+    "PurgeRequest",
+    "PurgeResponse",
+    "SearchHitItem",
+    "SearchResponse",
     "SessionItem",
     "SessionsResponse",
     # Graph
     "GraphState",
     "Message",
+    # Job
+    "JobSubmitResponse",
+    "JobStatusResponse",
+    # Usage
+    "UsagePeriod",
+    "UsageResponse",
 ]
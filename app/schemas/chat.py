@@ -1,6 +1,7 @@
 """聊天相关 Schema"""
 
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -32,3 +33,34 @@ class SessionItem(BaseModel):
 class SessionsResponse(BaseModel):
     """会话列表响应"""
     sessions: list[SessionItem]
+
+
+class PurgeRequest(BaseModel):
+    """批量清除会话请求"""
+    session_ids: Optional[List[str]] = None
+    # 清除用户的全部会话（忽略 session_ids）
+    all: bool = False
+    # 同时删除用户的长期记忆
+    memories: bool = False
+
+
+class PurgeResponse(BaseModel):
+    """批量清除响应：同步执行时返回 purged，转为后台任务时返回 job_id"""
+    purged: Optional[int] = None
+    job_id: Optional[str] = None
+
+
+class SearchHitItem(BaseModel):
+    """检索命中项"""
+    session_id: str
+    role: str
+    snippet: str
+    score: float
+    created_at: datetime
+
+
+class SearchResponse(BaseModel):
+    """消息检索响应"""
+    query: str
+    results: List[SearchHitItem]
+    has_more: bool
@@ -0,0 +1,26 @@
+"""后台任务相关 Schema"""
+
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+
+class JobSubmitResponse(BaseModel):
+    """任务提交响应"""
+    job_id: str
+    status: str
+    session_id: Optional[str] = None
+
+
+class JobStatusResponse(BaseModel):
+    """任务状态响应"""
+    job_id: str
+    kind: str
+    status: str
+    session_id: Optional[str] = None
+    result: Any = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,17 @@
+"""用量相关 Schema"""
+
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class UsagePeriod(BaseModel):
+    """一个周期内的用量（limit 为空表示不限制）"""
+    used: int
+    limit: Optional[int] = None
+
+
+class UsageResponse(BaseModel):
+    """当前用户的 token 用量（UTC 自然日 / 自然月）"""
+    daily: UsagePeriod
+    monthly: UsagePeriod
@@ -0,0 +1,352 @@
+"""算术表达式求值服务
+
+- 基于 AST 求值，只支持数字、四则运算、整除、取模、乘方和正负号
+- 限制表达式长度、运算次数、指数大小和结果位数，拒绝 9**9**9 这类表达式
+- 支持 float / decimal / fraction 三种精度模式
+- 在独立的进程池中执行并设置硬超时，超时后终止工作进程，不阻塞事件循环
+- 相同表达式的结果做 LRU 缓存
+"""
+
+import ast
+import asyncio
+import math
+import multiprocessing
+from dataclasses import dataclass
+from decimal import Decimal, DivisionByZero, InvalidOperation, localcontext
+from fractions import Fraction
+from multiprocessing.pool import Pool
+from typing import Optional
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.utils.cache import LRUCache
+
+MODES = ("float", "decimal", "fraction")
+
+# 新建进程池时等待工作进程启动的上限，这段时间不计入求值超时
+POOL_STARTUP_TIMEOUT = 10.0
+
+# 模型常用的非 Python 写法
+_REPLACEMENTS = {"^": "**", "×": "*", "÷": "/", "（": "(", "）": ")", "，": ""}
+
+_BINARY_OPS = {
+    ast.Add: lambda a, b: a + b,
+    ast.Sub: lambda a, b: a - b,
+    ast.Mult: lambda a, b: a * b,
+    ast.Div: lambda a, b: a / b,
+    ast.FloorDiv: lambda a, b: a // b,
+    ast.Mod: lambda a, b: a % b,
+    ast.Pow: lambda a, b: a ** b,
+}
+
+
+class CalculatorError(ValueError):
+    """表达式不合法或超出限制"""
+
+
+@dataclass(frozen=True)
+class CalculatorLimits:
+    """求值限制"""
+    max_length: int = 256
+    max_operations: int = 64
+    max_exponent: int = 1000
+    max_digits: int = 1000
+
+
+def normalize(expression: str) -> str:
+    """统一写法，作为缓存键"""
+    for old, new in _REPLACEMENTS.items():
+        expression = expression.replace(old, new)
+    return " ".join(expression.split())
+
+
+def _digits(value) -> float:
+    """数值的十进制位数（估算）"""
+    if isinstance(value, Fraction):
+        return max(_digits(value.numerator), _digits(value.denominator))
+    if isinstance(value, int):
+        return value.bit_length() * 0.30103 + 1
+    if isinstance(value, Decimal):
+        return max(0, value.adjusted()) + 1 if value.is_finite() else 0
+    return 0 if not math.isfinite(value) or value == 0 else max(0.0, math.log10(abs(value))) + 1
+
+
+class _Evaluator:
+    def __init__(self, mode: str, precision: int, limits: CalculatorLimits):
+        if mode not in MODES:
+            raise CalculatorError(f"不支持的精度模式: {mode}")
+        self.mode = mode
+        self.precision = precision
+        self.limits = limits
+        self.operations = 0
+
+    def number(self, value):
+        if self.mode == "decimal":
+            return Decimal(repr(value))
+        if self.mode == "fraction":
+            return Fraction(repr(value)) if isinstance(value, float) else Fraction(value)
+        return value
+
+    def check_pow(self, base, exponent) -> None:
+        # 统一按 float 比较大小（Decimal 不能与 float 相乘）；超大整数转 float 会溢出，直接按上限处理
+        try:
+            size = abs(float(exponent))
+        except OverflowError:
+            size = math.inf
+        if size > self.limits.max_exponent:
+            raise CalculatorError(f"指数过大（上限 {self.limits.max_exponent}）")
+        # 各模式给出相同的错误（decimal 模式下 0 的负数次幂得到 Infinity，负数的非整数次幂抛 InvalidOperation）
+        if base == 0 and exponent < 0:
+            raise ZeroDivisionError()
+        if base < 0 and exponent != int(exponent):
+            raise CalculatorError("结果不是实数")
+        if base != 0 and abs(base) != 1:
+            if isinstance(base, Fraction):
+                magnitude = max(math.log10(abs(base.numerator)), math.log10(base.denominator))
+            else:
+                magnitude = abs(math.log10(abs(base)))
+            if size * magnitude > self.limits.max_digits:
+                raise CalculatorError(f"结果位数过多（上限 {self.limits.max_digits} 位）")
+
+    def check_result(self, value) -> None:
+        if _digits(value) > self.limits.max_digits:
+            raise CalculatorError(f"结果位数过多（上限 {self.limits.max_digits} 位）")
+
+    def visit(self, node):
+        if isinstance(node, ast.Expression):
+            return self.visit(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            # 1e400 之类的字面量在解析时就已是 inf，decimal 模式下会变成 Infinity
+            if isinstance(node.value, float) and not math.isfinite(node.value):
+                raise CalculatorError("结果溢出")
+            self.check_result(node.value)
+            return self.number(node.value)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            value = self.visit(node.operand)
+            return -value if isinstance(node.op, ast.USub) else +value
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            self.operations += 1
+            if self.operations > self.limits.max_operations:
+                raise CalculatorError(f"运算次数过多（上限 {self.limits.max_operations}）")
+            left = self.visit(node.left)
+            right = self.visit(node.right)
+            if isinstance(node.op, ast.Pow):
+                self.check_pow(left, right)
+                if isinstance(left, Fraction) and isinstance(right, Fraction) and right.denominator != 1:
+                    # 分数的非整数次幂无法精确表示，退回浮点
+                    left, right = float(left), float(right)
+            elif isinstance(node.op, ast.Mult):
+                if _digits(left) + _digits(right) > self.limits.max_digits:
+                    raise CalculatorError(f"结果位数过多（上限 {self.limits.max_digits} 位）")
+            elif isinstance(node.op, (ast.Div, ast.FloorDiv, ast.Mod)) and right == 0:
+                # decimal 模式下 7 % 0、0 / 0 抛 InvalidOperation，统一为与其他模式相同的错误
+                raise ZeroDivisionError()
+            result = _BINARY_OPS[type(node.op)](left, right)
+            if isinstance(result, complex):
+                raise CalculatorError("结果不是实数")
+            if isinstance(result, Decimal) and not result.is_finite():
+                raise CalculatorError("结果溢出")
+            self.check_result(result)
+            return result
+        raise CalculatorError(f"不支持的语法: {type(node).__name__}")
+
+
+def evaluate(
+    expression: str,
+    mode: str = "float",
+    precision: int = 28,
+    limits: CalculatorLimits = CalculatorLimits(),
+) -> str:
+    """求值并返回格式化结果
+
+    Raises:
+        CalculatorError: 表达式不合法或超出限制
+    """
+    expression = normalize(expression)
+    if not expression:
+        raise CalculatorError("表达式为空")
+    if len(expression) > limits.max_length:
+        raise CalculatorError(f"表达式过长（上限 {limits.max_length} 个字符）")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as e:
+        raise CalculatorError(f"表达式语法错误: {e}") from None
+
+    evaluator = _Evaluator(mode, precision, limits)
+    try:
+        with localcontext() as ctx:
+            ctx.prec = precision
+            result = evaluator.visit(tree)
+            if isinstance(result, Decimal):
+                result = result.normalize()
+    except CalculatorError:
+        raise
+    except (ZeroDivisionError, DivisionByZero):
+        raise CalculatorError("除数不能为零") from None
+    except OverflowError:
+        raise CalculatorError("结果溢出") from None
+    except (InvalidOperation, RecursionError, ValueError) as e:
+        raise CalculatorError(f"计算错误: {e}") from None
+
+    if isinstance(result, Fraction) and result.denominator != 1:
+        return f"{result} ≈ {float(result):.{min(precision, 15)}g}"
+    if isinstance(result, float) and not math.isfinite(result):
+        raise CalculatorError("结果溢出")
+    if isinstance(result, int) and _digits(result) > 4000:
+        # 超出 int 转字符串的位数限制，改用科学计数法
+        with localcontext() as ctx:
+            ctx.prec = precision
+            return f"{+Decimal(result):e}"
+    return str(result)
+
+
+def _evaluate_in_worker(expression: str, mode: str, precision: int, limits: CalculatorLimits):
+    """进程池任务：把异常转成返回值，避免跨进程传递异常类型"""
+    try:
+        return True, evaluate(expression, mode, precision, limits)
+    except CalculatorError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, f"计算错误: {e}"
+
+
+def _warmup() -> None:
+    return None
+
+
+class CalculatorService:
+    """在进程池中带超时地求值"""
+
+    def __init__(
+        self,
+        mode: str = "float",
+        precision: int = 28,
+        timeout: float = 1.0,
+        workers: int = 2,
+        cache_size: int = 1024,
+        limits: CalculatorLimits = CalculatorLimits(),
+    ):
+        self.mode = mode
+        self.precision = precision
+        self.timeout = timeout
+        self.workers = workers
+        self.limits = limits
+        self._cache: LRUCache[tuple] = LRUCache(max_size=cache_size)
+        self._pool: Optional[Pool] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._pending: set = set()
+        self.timeouts = 0
+
+    def _get_pool(self) -> Pool:
+        if self._pool is None:
+            loop = asyncio.get_running_loop()
+            # spawn：不继承父进程的线程和连接
+            self._pool = multiprocessing.get_context("spawn").Pool(self.workers)
+            # 第一个空任务完成即说明工作进程已就绪
+            self._ready = ready = loop.create_future()
+            self._pool.apply_async(
+                _warmup,
+                callback=lambda _: loop.call_soon_threadsafe(
+                    lambda: ready.done() or ready.set_result(None)
+                ),
+            )
+        return self._pool
+
+    def _reset_pool(self) -> None:
+        """终止卡住的工作进程，同一进程池上的其他任务一并失败"""
+        if self._pool is not None:
+            # terminate 会等待内部线程退出，放到线程池里执行
+            asyncio.get_running_loop().run_in_executor(None, self._pool.terminate)
+            self._pool = None
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(None)
+        for future in self._pending:
+            if not future.done():
+                # 被牵连中断的任务不缓存结果
+                future.set_result((None, "计算被中断，请重试"))
+        self._pending.clear()
+
+    async def calculate(self, expression: str, mode: Optional[str] = None) -> str:
+        """求值
+
+        Raises:
+            CalculatorError: 表达式不合法、超出限制或超时
+        """
+        mode = mode or self.mode
+        key = (normalize(expression), mode, self.precision)
+        cached = self._cache.get(key)
+        if cached is None:
+            cached = await self._run(expression, mode)
+            if cached[0] is not None:
+                self._cache.set(key, cached)
+
+        ok, value = cached
+        if not ok:
+            raise CalculatorError(value)
+        return value
+
+    async def _run(self, expression: str, mode: str) -> tuple:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(result):
+            if not future.done():
+                future.set_result(result)
+
+        def fail(error):
+            if not future.done():
+                future.set_exception(error)
+
+        while True:
+            pool, ready = self._get_pool(), self._ready
+            try:
+                await asyncio.wait_for(asyncio.shield(ready), POOL_STARTUP_TIMEOUT)
+            except asyncio.TimeoutError:
+                return None, "计算服务启动超时，请重试"
+            # 等待期间进程池可能因其他任务超时被重建
+            if pool is self._pool:
+                break
+
+        self._pending.add(future)
+        pool.apply_async(
+            _evaluate_in_worker,
+            (expression, mode, self.precision, self.limits),
+            callback=lambda result: loop.call_soon_threadsafe(settle, result),
+            error_callback=lambda error: loop.call_soon_threadsafe(fail, error),
+        )
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning("calculator_timeout", expression=expression[:100], timeout=self.timeout)
+            self._reset_pool()
+            return False, f"计算超时（{self.timeout} 秒）"
+        finally:
+            self._pending.discard(future)
+
+    def start(self) -> None:
+        """预先启动进程池，避免首次调用等待进程启动"""
+        self._get_pool()
+
+    def close(self) -> None:
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+# 创建全局实例
+calculator = CalculatorService(
+    mode=settings.CALCULATOR_MODE,
+    precision=settings.CALCULATOR_PRECISION,
+    timeout=settings.CALCULATOR_TIMEOUT,
+    workers=settings.CALCULATOR_WORKERS,
+    cache_size=settings.CALCULATOR_CACHE_SIZE,
+    limits=CalculatorLimits(
+        max_length=settings.CALCULATOR_MAX_LENGTH,
+        max_operations=settings.CALCULATOR_MAX_OPERATIONS,
+        max_exponent=settings.CALCULATOR_MAX_EXPONENT,
+        max_digits=settings.CALCULATOR_MAX_DIGITS,
+    ),
+)
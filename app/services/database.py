@@ -1,16 +1,26 @@
 """数据库服务"""
 
-from typing import Optional, List
-from uuid import UUID
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional, List, Tuple, TypeVar
+from uuid import UUID, uuid4
 from contextlib import contextmanager
 
-from sqlmodel import SQLModel, Session, create_engine, select
+from sqlmodel import SQLModel, Session, create_engine, select, delete, update
+from sqlalchemy import case, func, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
 from sqlalchemy.pool import QueuePool
 
 from app.core.config import settings
 from app.core.logging import logger
 from app.models.user import User
 from app.models.session import Session as ChatSession
+from app.models.idempotency import IdempotencyKey
+from app.models.job import Job, JobEvent
+from app.models.usage import TokenUsage
+from app.services.replica import replica_router
+
+T = TypeVar("T")
 
 
 class DatabaseService:
@@ -18,6 +28,15 @@ class DatabaseService:
 
     def __init__(self):
         self._engine = None
+        self._replica_engine = None
+        # 数据变更回调 (topic, *keys)，由 InvalidationBus 设置，用于跨 worker 失效缓存
+        self.on_change: Optional[Callable[..., None]] = None
+
+    def _changed(self, topic: str, *keys) -> None:
+        # 写入后短时间内这些 key 读主库（其他 worker 通过失效事件固定）
+        replica_router.pin(*keys)
+        if self.on_change is not None:
+            self.on_change(topic, *keys)
 
     @property
     def engine(self):
@@ -39,11 +58,59 @@ class DatabaseService:
             )
         return self._engine
 
+    @property
+    def replica_engine(self):
+        """只读副本引擎（配置了 POSTGRES_REPLICA_URL 时）"""
+        if self._replica_engine is None:
+            self._replica_engine = create_engine(
+                settings.POSTGRES_REPLICA_URL,
+                poolclass=QueuePool,
+                pool_size=settings.POSTGRES_POOL_SIZE,
+                max_overflow=settings.POSTGRES_MAX_OVERFLOW,
+                pool_timeout=5,
+                pool_recycle=1800,
+                echo=settings.DEBUG,
+            )
+            logger.info("database_replica_engine_created")
+        return self._replica_engine
+
+    def dispose(self) -> None:
+        """关闭主库与副本的连接池"""
+        if self._engine is not None:
+            self._engine.dispose()
+        if self._replica_engine is not None:
+            self._replica_engine.dispose()
+
+    def _read(self, key: Optional[UUID], query: Callable[[Session], T]) -> T:
+        """只读查询：副本可用且 key 没有固定到主库时走副本，副本出错时回退主库"""
+        if replica_router.use_replica(key):
+            try:
+                with Session(self.replica_engine, expire_on_commit=False) as session:
+                    return query(session)
+            except OperationalError as e:
+                replica_router.mark_unhealthy(str(e))
+        with Session(self.engine, expire_on_commit=False) as session:
+            return query(session)
+
     def create_tables(self):
         """创建所有表"""
         SQLModel.metadata.create_all(self.engine)
+        self._create_search_index()
         logger.info("database_tables_created")
 
+    def _create_search_index(self) -> None:
+        """消息检索的 pg_trgm GIN 索引（CJK 需要数据库使用 UTF-8 的 LC_CTYPE）"""
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_message_index_content_trgm "
+                    "ON message_index USING gin (content gin_trgm_ops)"
+                ))
+        except SQLAlchemyError as e:
+            # 没有创建扩展的权限时 MessageIndexer 改用不依赖 pg_trgm 的查询（ILIKE 扫描，按时间排序）
+            logger.warning("message_search_index_unavailable", error=str(e))
+
     @contextmanager
     def get_session(self):
         """获取数据库会话"""
@@ -66,7 +133,9 @@ class DatabaseService:
             session.commit()
             session.refresh(user)
             logger.info("user_created", user_id=str(user.id), email=email)
-            return user
+        # 刚注册的用户随后的读取走主库
+        self._changed("user", user.id)
+        return user
 
     def get_user_by_email(self, email: str) -> Optional[User]:
         """通过邮箱获取用户"""
@@ -76,8 +145,14 @@ class DatabaseService:
 
     def get_user_by_id(self, user_id: UUID) -> Optional[User]:
         """通过 ID 获取用户"""
-        with Session(self.engine, expire_on_commit=False) as session:
-            return session.get(User, user_id)
+        return self._read(user_id, lambda session: session.get(User, user_id))
+
+    def update_user(self, user_id: UUID, **fields) -> None:
+        """更新用户字段（如 is_active），并失效各 worker 缓存的用户记录"""
+        with Session(self.engine) as session:
+            session.exec(update(User).where(User.id == user_id).values(**fields))
+            session.commit()
+        self._changed("user", user_id)
 
     # ============ 会话操作 ============
 
@@ -89,17 +164,26 @@ class DatabaseService:
             session.commit()
             session.refresh(chat_session)
             logger.info("chat_session_created", session_id=str(chat_session.id))
-            return chat_session
+        self._changed("sessions", user_id)
+        return chat_session
 
     def get_user_sessions(self, user_id: UUID) -> List[ChatSession]:
         """获取用户的所有会话（按创建时间倒序）"""
-        with Session(self.engine, expire_on_commit=False) as session:
-            statement = (
-                select(ChatSession)
-                .where(ChatSession.user_id == user_id)
-                .order_by(ChatSession.created_at.desc())
-            )
-            return list(session.exec(statement).all())
+        statement = (
+            select(ChatSession)
+            .where(ChatSession.user_id == user_id)
+            .order_by(ChatSession.created_at.desc())
+        )
+        return self._read(user_id, lambda session: list(session.exec(statement).all()))
+
+    def list_user_sessions(self, user_id: UUID) -> List[Tuple[UUID, Optional[str]]]:
+        """获取用户的会话 (id, title)（按创建时间倒序），只查询需要的列"""
+        statement = (
+            select(ChatSession.id, ChatSession.title)
+            .where(ChatSession.user_id == user_id)
+            .order_by(ChatSession.created_at.desc())
+        )
+        return self._read(user_id, lambda session: [tuple(row) for row in session.exec(statement).all()])
 
     def delete_chat_session(self, session_id: UUID) -> None:
         """删除聊天会话"""
@@ -109,6 +193,245 @@ class DatabaseService:
                 session.delete(chat_session)
                 session.commit()
                 logger.info("chat_session_deleted", session_id=str(session_id))
+                self._changed("sessions", chat_session.user_id)
+
+    # ============ 幂等键操作 ============
+
+    def claim_idempotency_key(
+        self,
+        user_id: UUID,
+        key: str,
+        request_hash: str,
+        session_id: str,
+        pending_ttl: float,
+    ) -> Tuple[IdempotencyKey, bool]:
+        """占用幂等键
+
+        Returns:
+            (记录, 是否由本次请求新建)。已存在且未过期时返回已有记录。
+        """
+        now = datetime.now(timezone.utc)
+        with Session(self.engine, expire_on_commit=False) as session:
+            # 过期的记录（包括崩溃后遗留的 pending）可以被接管
+            session.exec(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id)
+                .where(IdempotencyKey.key == key)
+                .where(IdempotencyKey.expires_at < now)
+            )
+            record = IdempotencyKey(
+                user_id=user_id,
+                key=key,
+                request_hash=request_hash,
+                session_id=session_id,
+                expires_at=now + timedelta(seconds=pending_ttl),
+            )
+            session.add(record)
+            try:
+                session.commit()
+                return record, True
+            except IntegrityError:
+                session.rollback()
+
+        existing = self.get_idempotency_key(user_id, key)
+        if existing is None:
+            # 并发请求刚好删除了记录，重新占用
+            return self.claim_idempotency_key(user_id, key, request_hash, session_id, pending_ttl)
+        return existing, False
+
+    def get_idempotency_key(self, user_id: UUID, key: str) -> Optional[IdempotencyKey]:
+        """获取幂等键记录"""
+        with Session(self.engine, expire_on_commit=False) as session:
+            statement = (
+                select(IdempotencyKey)
+                .where(IdempotencyKey.user_id == user_id)
+                .where(IdempotencyKey.key == key)
+            )
+            return session.exec(statement).first()
+
+    def complete_idempotency_key(self, record_id: UUID, response: str, ttl: float) -> None:
+        """记录请求结果，在 TTL 内用于回放"""
+        with Session(self.engine) as session:
+            record = session.get(IdempotencyKey, record_id)
+            if record:
+                record.status = "completed"
+                record.response = response
+                record.expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+                session.add(record)
+                session.commit()
+
+    def release_idempotency_key(self, record_id: UUID) -> None:
+        """请求失败时释放幂等键，允许客户端重试"""
+        with Session(self.engine) as session:
+            session.exec(delete(IdempotencyKey).where(IdempotencyKey.id == record_id))
+            session.commit()
+
+    def delete_expired_idempotency_keys(self) -> int:
+        """清理过期的幂等键"""
+        with Session(self.engine) as session:
+            result = session.exec(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.expires_at < datetime.now(timezone.utc)
+                )
+            )
+            session.commit()
+            return result.rowcount
+
+    # ============ 后台任务操作 ============
+
+    def create_job(
+        self,
+        user_id: UUID,
+        kind: str,
+        payload: str,
+        ttl: float,
+        session_id: Optional[str] = None,
+    ) -> Job:
+        """创建排队中的任务"""
+        with Session(self.engine, expire_on_commit=False) as session:
+            job = Job(
+                user_id=user_id,
+                kind=kind,
+                payload=payload,
+                session_id=session_id,
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl),
+            )
+            session.add(job)
+            session.commit()
+            return job
+
+    def get_job(self, job_id: UUID) -> Optional[Job]:
+        """获取任务（已过期的视为不存在）"""
+        with Session(self.engine, expire_on_commit=False) as session:
+            job = session.get(Job, job_id)
+            if job is None or job.expires_at < datetime.now(timezone.utc):
+                return None
+            return job
+
+    def update_job(self, job_id: UUID, **fields) -> None:
+        """更新任务字段（同时刷新心跳）"""
+        fields.setdefault("updated_at", datetime.now(timezone.utc))
+        with Session(self.engine) as session:
+            session.exec(update(Job).where(Job.id == job_id).values(**fields))
+            session.commit()
+
+    def touch_jobs(self, job_ids: Iterable[UUID], ttl: float) -> None:
+        """刷新进行中任务的心跳，并顺延过期时间"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        now = datetime.now(timezone.utc)
+        with Session(self.engine) as session:
+            session.exec(
+                update(Job)
+                .where(Job.id.in_(job_ids))
+                .values(updated_at=now, expires_at=now + timedelta(seconds=ttl))
+            )
+            session.commit()
+
+    def fail_stale_jobs(self, stale_after: float) -> int:
+        """把心跳超时的任务标记为失败（所在进程已退出）"""
+        now = datetime.now(timezone.utc)
+        with Session(self.engine) as session:
+            result = session.exec(
+                update(Job)
+                .where(Job.status.in_(("queued", "running")))
+                .where(Job.updated_at < now - timedelta(seconds=stale_after))
+                .values(status="failed", error="任务所在进程已退出", finished_at=now, updated_at=now)
+            )
+            session.commit()
+            return result.rowcount
+
+    def add_job_events(self, job_id: UUID, events: List[Tuple[int, str, str]]) -> None:
+        """批量写入任务事件 (seq, type, data)"""
+        with Session(self.engine) as session:
+            session.add_all(
+                JobEvent(job_id=job_id, seq=seq, type=event_type, data=data)
+                for seq, event_type, data in events
+            )
+            session.commit()
+
+    def get_job_events(self, job_id: UUID, after_seq: int = 0) -> List[JobEvent]:
+        """获取序号大于 after_seq 的事件"""
+        with Session(self.engine, expire_on_commit=False) as session:
+            statement = (
+                select(JobEvent)
+                .where(JobEvent.job_id == job_id)
+                .where(JobEvent.seq > after_seq)
+                .order_by(JobEvent.seq)
+            )
+            return list(session.exec(statement).all())
+
+    def delete_expired_jobs(self) -> int:
+        """清理过期的任务及其事件"""
+        expired = select(Job.id).where(Job.expires_at < datetime.now(timezone.utc))
+        with Session(self.engine) as session:
+            session.exec(delete(JobEvent).where(JobEvent.job_id.in_(expired)))
+            result = session.exec(delete(Job).where(Job.id.in_(expired)))
+            session.commit()
+            return result.rowcount
+
+
+    # ============ Token 用量 ============
+
+    def add_token_usage(self, rows: List[Tuple[UUID, date, int, int, int]]) -> None:
+        """批量累加用量 (user_id, day, prompt_tokens, completion_tokens, requests)，一条 upsert 语句"""
+        if not rows:
+            return
+        now = datetime.now(timezone.utc)
+        statement = insert(TokenUsage).values([
+            {
+                "id": uuid4(),
+                "created_at": now,
+                "updated_at": now,
+                "user_id": user_id,
+                "day": day,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "requests": requests,
+            }
+            for user_id, day, prompt_tokens, completion_tokens, requests in rows
+        ])
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            constraint="uq_token_usage_user_day",
+            set_={
+                "prompt_tokens": TokenUsage.prompt_tokens + excluded.prompt_tokens,
+                "completion_tokens": TokenUsage.completion_tokens + excluded.completion_tokens,
+                "requests": TokenUsage.requests + excluded.requests,
+                "updated_at": excluded.updated_at,
+            },
+        )
+        with Session(self.engine) as session:
+            session.exec(statement)
+            session.commit()
+
+    def get_token_totals(
+        self,
+        user_ids: Iterable[UUID],
+        day: date,
+    ) -> Dict[UUID, Tuple[int, int]]:
+        """用户在 day 当天与当月的 token 总量 {user_id: (当天, 当月)}，一条查询"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        tokens = TokenUsage.prompt_tokens + TokenUsage.completion_tokens
+        statement = (
+            select(
+                TokenUsage.user_id,
+                func.coalesce(func.sum(case((TokenUsage.day == day, tokens), else_=0)), 0),
+                func.coalesce(func.sum(tokens), 0),
+            )
+            .where(TokenUsage.user_id.in_(user_ids))
+            .where(TokenUsage.day >= day.replace(day=1))
+            .where(TokenUsage.day <= day)
+            .group_by(TokenUsage.user_id)
+        )
+        with Session(self.engine) as session:
+            totals = {user_id: (0, 0) for user_id in user_ids}
+            for user_id, day_total, month_total in session.exec(statement).all():
+                totals[user_id] = (int(day_total), int(month_total))
+            return totals
 
 
 # 创建全局数据库服务实例
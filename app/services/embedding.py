@@ -0,0 +1,144 @@
+"""嵌入请求微批处理
+
+mem0 每次检索/写入记忆都会单独请求一次 Ollama embedding。
+EmbeddingBatcher 在几毫秒内收集并发请求的文本，合并为一次 /api/embed 调用，
+再把向量分发回各个等待的协程。
+"""
+
+import asyncio
+from typing import Dict, List, Literal, Optional, Tuple
+
+import httpx
+from mem0.configs.embeddings.base import BaseEmbedderConfig
+from mem0.embeddings.base import EmbeddingBase
+
+from app.core.logging import logger
+
+
+class EmbeddingBatcher:
+    """合并并发的嵌入请求"""
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        timeout: float = 30.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._timeout = timeout
+        self._client = client
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+        # 统计
+        self.requests = 0
+        self.batches = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self._timeout)
+        return self._client
+
+    async def embed(self, text: str) -> List[float]:
+        """嵌入单条文本"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        """嵌入多条文本（与其他请求一起合批）"""
+        return list(await asyncio.gather(*(self.embed(text) for text in texts)))
+
+    def _flush(self) -> None:
+        """把当前收集到的请求作为一个批次发出"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """发送一次批量嵌入请求并分发结果"""
+        # 相同文本只嵌入一次
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        texts = list(unique)
+
+        try:
+            response = await self._get_client().post(
+                f"{self.base_url}/api/embed",
+                json={"model": self.model, "input": texts},
+            )
+            response.raise_for_status()
+            embeddings = response.json().get("embeddings") or []
+            if len(embeddings) != len(texts):
+                raise ValueError(
+                    f"Ollama 返回 {len(embeddings)} 个向量，期望 {len(texts)} 个"
+                )
+        except Exception as e:
+            logger.error("embedding_batch_failed", size=len(batch), error=str(e))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        logger.debug("embedding_batch_sent", size=len(batch), unique=len(texts))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(embeddings[unique[text]])
+
+    async def aclose(self) -> None:
+        """发送剩余请求并关闭 HTTP 客户端"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class BatchingEmbedder(EmbeddingBase):
+    """供 mem0 使用的嵌入器，请求经 EmbeddingBatcher 合批
+
+    mem0 的 AsyncMemory 在线程池中同步调用 embed()，
+    这里把请求投递回事件循环上的批处理器并等待结果。
+    """
+
+    def __init__(self, batcher: EmbeddingBatcher, loop: asyncio.AbstractEventLoop):
+        super().__init__(BaseEmbedderConfig(model=batcher.model))
+        self.batcher = batcher
+        self._loop = loop
+
+    def embed(self, text, memory_action: Optional[Literal["add", "search", "update"]] = None):
+        """嵌入单条文本"""
+        future = asyncio.run_coroutine_threadsafe(self.batcher.embed(text), self._loop)
+        return future.result()
+
+    def embed_batch(self, texts, memory_action="add"):
+        """嵌入多条文本"""
+        if not texts:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self.batcher.embed_many(list(texts)), self._loop)
+        return future.result()
@@ -0,0 +1,143 @@
+"""聊天请求幂等服务
+
+客户端通过 Idempotency-Key 请求头重试 /chat 或 /chat/stream 时，
+重复请求直接回放第一次请求的结果（或订阅进行中的流），不会再触发一次生成。
+"""
+
+import asyncio
+import hashlib
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.idempotency import IdempotencyKey
+from app.services.database import db
+
+
+class IdempotencyConflictError(Exception):
+    """同一个幂等键被用于不同的请求内容"""
+
+
+class InflightStream:
+    """进行中的流式回复，供同一 worker 上的重复请求从头回放"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str) -> None:
+        """追加一个分片"""
+        self.chunks.append(chunk)
+        self._changed.set()
+
+    def finish(self) -> None:
+        """标记流结束"""
+        self.done = True
+        self._changed.set()
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """从第一个分片开始回放，直到流结束"""
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                return
+            self._changed.clear()
+            # 清除后再检查一次，避免错过 clear 之前的 publish
+            if index < len(self.chunks) or self.done:
+                continue
+            await self._changed.wait()
+
+
+class IdempotencyService:
+    """幂等键的占用、等待与回放"""
+
+    def __init__(self):
+        self._streams: Dict[Tuple[UUID, str], InflightStream] = {}
+
+    @staticmethod
+    def fingerprint(message: str, session_id: Optional[str]) -> str:
+        """请求指纹（不包含服务端生成的 session_id）"""
+        raw = f"{session_id or ''}\n{message}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    def claim(
+        self,
+        user_id: UUID,
+        key: str,
+        request_hash: str,
+        session_id: str,
+    ) -> Tuple[IdempotencyKey, bool]:
+        """占用幂等键
+
+        Returns:
+            (记录, 是否为首次请求)
+
+        Raises:
+            IdempotencyConflictError: 同一个 key 对应了不同的请求内容
+        """
+        record, created = db.claim_idempotency_key(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            session_id=session_id,
+            pending_ttl=settings.IDEMPOTENCY_PENDING_TTL,
+        )
+        if not created:
+            if record.request_hash != request_hash:
+                raise IdempotencyConflictError(key)
+            logger.info(
+                "idempotent_request_duplicate",
+                user_id=str(user_id),
+                key=key,
+                status=record.status,
+            )
+        return record, created
+
+    def complete(self, record: IdempotencyKey, response: str) -> None:
+        """保存首次请求的结果"""
+        db.complete_idempotency_key(record.id, response, settings.IDEMPOTENCY_TTL)
+
+    def release(self, record: IdempotencyKey) -> None:
+        """首次请求失败，释放 key 让重试可以重新执行"""
+        db.release_idempotency_key(record.id)
+
+    async def wait_for_result(self, user_id: UUID, key: str) -> Optional[IdempotencyKey]:
+        """等待其他请求（可能在其他 worker 上）完成
+
+        Returns:
+            已完成的记录；超时或首次请求失败时返回 None
+        """
+        deadline = asyncio.get_running_loop().time() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        delay = 0.2
+        while True:
+            record = db.get_idempotency_key(user_id, key)
+            if record is None or record.status == "completed":
+                return record
+            if asyncio.get_running_loop().time() + delay > deadline:
+                return None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def open_stream(self, user_id: UUID, key: str) -> InflightStream:
+        """登记进行中的流"""
+        stream = self._streams[(user_id, key)] = InflightStream()
+        return stream
+
+    def close_stream(self, user_id: UUID, key: str) -> None:
+        """流结束后移除登记"""
+        stream = self._streams.pop((user_id, key), None)
+        if stream is not None:
+            stream.finish()
+
+    def get_stream(self, user_id: UUID, key: str) -> Optional[InflightStream]:
+        """获取本 worker 上进行中的流"""
+        return self._streams.get((user_id, key))
+
+
+# 创建全局幂等服务实例
+idempotency = IdempotencyService()
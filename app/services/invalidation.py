@@ -0,0 +1,236 @@
+"""跨 worker 缓存失效
+
+多个 uvicorn worker 各自持有进程内缓存，数据变更后通过 Postgres 的 LISTEN/NOTIFY 通知其他 worker：
+- publish 先在本进程内失效，再在数据库连接上执行 pg_notify
+- 每个 worker 一条 LISTEN 连接，收到事件后分发给订阅该 topic 的缓存 / 处理函数（跳过自己发出的事件）
+- 监听连接断开期间可能漏掉事件：断开和重连时清空已注册的缓存，
+  断开期间写入的条目只保留 fallback_ttl 秒（退化为 TTL 过期）
+
+事件为紧凑 JSON：{"o": 来源 worker, "t": topic, "k": [key, ...], "s": 发送时间(ms)}，
+k 为空表示清空该 topic。
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Sequence, TypeVar
+
+import orjson
+import psycopg
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.database import db
+from app.services.replica import replica_router
+from app.utils.cache import LRUCache
+
+V = TypeVar("V")
+
+# NOTIFY 的载荷上限为 8000 字节，超过时按 key 拆分
+MAX_PAYLOAD_BYTES = 7000
+
+# keys 为 None 表示清空
+Handler = Callable[[Optional[List[str]]], None]
+
+
+class CoherentCache(LRUCache[V]):
+    """接收失效事件的 LRU 缓存（键即事件中的 key 字符串）
+
+    监听正常时条目按 ttl 过期（兜底）；监听断开期间写入的条目只保留 fallback_ttl 秒。
+    """
+
+    def __init__(self, bus: "InvalidationBus", max_size: int, ttl: float, fallback_ttl: float):
+        super().__init__(max_size=max_size, ttl=ttl)
+        self._bus = bus
+        self.fallback_ttl = fallback_ttl
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        if ttl is None and self._bus.enabled and not self._bus.listening:
+            ttl = self.fallback_ttl
+        super().set(key, value, ttl)
+
+    def invalidate(self, keys: Optional[List[str]]) -> None:
+        if keys is None:
+            self.clear()
+            return
+        for key in keys:
+            self.pop(key)
+
+
+class InvalidationBus:
+    """基于 LISTEN/NOTIFY 的失效事件总线"""
+
+    def __init__(
+        self,
+        channel: str = "cache_invalidation",
+        fallback_ttl: float = 5.0,
+        heartbeat_interval: float = 30.0,
+        enabled: bool = True,
+    ):
+        self.channel = channel
+        self.fallback_ttl = fallback_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.enabled = enabled
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self.listening = False
+        self.received = 0
+        self.published = 0
+        # 最近收到事件的传播延迟（毫秒，跨主机时包含时钟偏差）
+        self.lags_ms: Deque[float] = deque(maxlen=1000)
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._caches: List[CoherentCache] = []
+        self._task: Optional[asyncio.Task] = None
+
+    # ============ 订阅 ============
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        """注册处理函数，handler(keys)；keys 为 None 表示清空"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def cache(self, topic: str, max_size: int = 1024, ttl: float = 300.0) -> CoherentCache:
+        """创建一个按 topic 失效的缓存"""
+        cache: CoherentCache = CoherentCache(self, max_size, ttl, self.fallback_ttl)
+        self._caches.append(cache)
+        self.subscribe(topic, cache.invalidate)
+        return cache
+
+    def _dispatch(self, topic: str, keys: Optional[List[str]]) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(keys)
+            except Exception as e:
+                logger.error("invalidation_handler_failed", topic=topic, error=str(e))
+
+    def _clear_all(self) -> None:
+        for cache in self._caches:
+            cache.clear()
+
+    # ============ 发布 ============
+
+    def _payloads(self, topic: str, keys: Sequence[str]) -> List[str]:
+        sent_at = int(time.time() * 1000)
+
+        def encode(chunk: List[str]) -> str:
+            return orjson.dumps({"o": self.origin, "t": topic, "k": chunk, "s": sent_at}).decode()
+
+        if not keys:
+            return [encode([])]
+        payloads, chunk, size = [], [], 0
+        for key in keys:
+            if chunk and size + len(key) + 3 > MAX_PAYLOAD_BYTES:
+                payloads.append(encode(chunk))
+                chunk, size = [], 0
+            chunk.append(key)
+            size += len(key) + 3
+        payloads.append(encode(chunk))
+        return payloads
+
+    def publish(self, topic: str, *keys: str) -> None:
+        """失效本进程的缓存并通知其他 worker；不传 key 表示清空该 topic"""
+        keys = [str(key) for key in keys]
+        self._dispatch(topic, keys or None)
+        self._notify(topic, keys)
+
+    async def publish_async(self, topic: str, *keys: str) -> None:
+        """同 publish，本进程内立即失效，pg_notify 放到线程池中执行，不阻塞事件循环"""
+        keys = [str(key) for key in keys]
+        self._dispatch(topic, keys or None)
+        if self.enabled:
+            await asyncio.to_thread(self._notify, topic, keys)
+
+    def _notify(self, topic: str, keys: List[str]) -> None:
+        if not self.enabled:
+            return
+        try:
+            with db.engine.connect() as conn:
+                for payload in self._payloads(topic, keys):
+                    conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                 {"channel": self.channel, "payload": payload})
+                conn.commit()
+            self.published += 1
+        except Exception as e:
+            # 其他 worker 的缓存会在 TTL 后过期
+            logger.error("invalidation_publish_failed", topic=topic, error=str(e))
+
+    # ============ 监听 ============
+
+    def _on_notify(self, payload: str) -> None:
+        try:
+            event = orjson.loads(payload)
+        except orjson.JSONDecodeError:
+            logger.warning("invalidation_payload_invalid", payload=payload[:200])
+            return
+        if event.get("o") == self.origin:
+            return
+        self.received += 1
+        if "s" in event:
+            self.lags_ms.append(time.time() * 1000 - event["s"])
+        self._dispatch(event["t"], event.get("k") or None)
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    settings.database_url, autocommit=True, connect_timeout=10
+                ) as conn:
+                    await conn.execute(f"LISTEN {self.channel}")
+                    # 连上之前的事件可能已经漏掉
+                    self._clear_all()
+                    self.listening = True
+                    delay = 1.0
+                    logger.info("invalidation_listener_connected", channel=self.channel)
+                    while True:
+                        async for notify in conn.notifies(timeout=self.heartbeat_interval):
+                            self._on_notify(notify.payload)
+                        # 一段时间没有事件时确认连接仍然可用
+                        await conn.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("invalidation_listener_disconnected", error=str(e), retry_in=delay)
+            finally:
+                if self.listening:
+                    self.listening = False
+                    self._clear_all()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def stats(self) -> dict:
+        lags = sorted(self.lags_ms)
+        return {
+            "listening": self.listening,
+            "published": self.published,
+            "received": self.received,
+            "lag_p50_ms": round(statistics.median(lags), 2) if lags else None,
+            "lag_p99_ms": round(lags[int(len(lags) * 0.99)], 2) if lags else None,
+        }
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# 创建全局实例
+invalidation_bus = InvalidationBus(
+    channel=settings.INVALIDATION_CHANNEL,
+    fallback_ttl=settings.INVALIDATION_FALLBACK_TTL,
+    enabled=settings.INVALIDATION_ENABLED,
+)
+# 数据库服务在写入用户、会话后发布失效事件
+db.on_change = invalidation_bus.publish
+# 写入（包括其他 worker 的写入和对话轮次）后相关用户 / 会话短时间内读主库
+for _topic in ("user", "sessions", "thread", "turn"):
+    invalidation_bus.subscribe(_topic, replica_router.pin_keys)
@@ -0,0 +1,316 @@
+"""后台任务服务
+
+请求只负责提交任务并立即返回任务 ID，生成在进程内的有界 worker 池中完成：
+- 任务状态、结果和进度事件写入数据库，任何 worker 都能回答查询
+- 每个任务类型通过 register 注册一个处理函数，返回值作为结果（JSON）保存
+- 结果在 JOB_RESULT_TTL 后过期清理；心跳超时的任务（所在进程已退出）标记为失败
+- 数据库访问是同步的，都放到线程池中执行，不阻塞事件循环
+"""
+
+import asyncio
+import json
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.models.job import Job, JobEvent
+from app.services.database import db
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobQueueFullError(Exception):
+    """本 worker 的任务队列已满"""
+
+
+class UnknownJobKindError(ValueError):
+    """没有注册对应的处理函数"""
+
+
+class JobContext:
+    """处理函数用来上报进度事件
+
+    事件先缓存在内存中，由 JobRunner 按 JOB_EVENT_FLUSH_INTERVAL 批量写入；
+    连续的 delta（文本片段）合并为一条。
+    """
+
+    def __init__(self, job: Job):
+        self.job = job
+        self._seq = 0
+        self._buffer: List[Tuple[int, str, Any]] = []
+        # 进行中的写入；发起写入的 flusher 被取消时线程中的写入仍会继续
+        self._writing: Optional[asyncio.Future] = None
+
+    def emit(self, event_type: str, data: Any = None) -> None:
+        if event_type == "delta" and self._buffer and self._buffer[-1][1] == "delta":
+            seq, _, text = self._buffer[-1]
+            self._buffer[-1] = (seq, "delta", text + data)
+            return
+        self._seq += 1
+        self._buffer.append((self._seq, event_type, data))
+
+    async def flush(self) -> bool:
+        """写入缓存的事件，返回是否有新事件"""
+        if self._writing is not None:
+            # 等上一批提交后再写，订阅者按 seq 读取，不能让后一批先于前一批提交
+            await asyncio.wait([self._writing])
+        if not self._buffer:
+            return False
+        events, self._buffer = self._buffer, []
+        self._writing = asyncio.ensure_future(asyncio.to_thread(
+            db.add_job_events,
+            self.job.id,
+            [(seq, event_type, json.dumps(data, ensure_ascii=False, default=str))
+             for seq, event_type, data in events],
+        ))
+        await asyncio.shield(self._writing)
+        return True
+
+
+JobHandler = Callable[[Job, JobContext], Awaitable[Any]]
+
+
+class JobRunner:
+    """进程内有界任务池"""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        queue_size: int = 100,
+        timeout: float = 900.0,
+        result_ttl: float = 3600.0,
+        flush_interval: float = 0.5,
+        heartbeat_interval: float = 15.0,
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.flush_interval = flush_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # 本进程排队或执行中的任务，用于心跳
+        self._active: Set[UUID] = set()
+        # 本进程执行中任务的新事件通知，订阅者无需等到下一次轮询
+        self._wakeups: Dict[UUID, asyncio.Event] = {}
+        # 本进程正在执行的任务
+        self._running: Set[UUID] = set()
+        # 排空中：不再接收、也不再开始新任务
+        self._closing = False
+        # 正在写入数据库、尚未入队的提交，占用队列容量
+        self._submitting = 0
+
+    def register(self, kind: str) -> Callable[[JobHandler], JobHandler]:
+        """注册任务处理函数（装饰器）"""
+
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[kind] = handler
+            return handler
+
+        return decorator
+
+    # ============ 提交与查询 ============
+
+    async def submit(
+        self,
+        user_id: UUID,
+        kind: str,
+        payload: Optional[dict] = None,
+        session_id: Optional[str] = None,
+    ) -> Job:
+        """提交任务
+
+        Raises:
+            UnknownJobKindError: 任务类型未注册
+            JobQueueFullError: 本 worker 队列已满
+        """
+        if kind not in self._handlers:
+            raise UnknownJobKindError(kind)
+        queue = self._queue
+        if queue is None or self._closing or queue.qsize() + self._submitting >= self.queue_size:
+            raise JobQueueFullError(kind)
+
+        self._submitting += 1
+        try:
+            job = await asyncio.to_thread(
+                db.create_job,
+                user_id=user_id,
+                kind=kind,
+                payload=json.dumps(payload or {}, ensure_ascii=False),
+                ttl=self.result_ttl,
+                session_id=session_id,
+            )
+        finally:
+            self._submitting -= 1
+        if self._queue is not queue or self._closing:
+            # 写入期间开始排空
+            await asyncio.to_thread(db.update_job, job.id, status="failed", error="服务关闭，任务中断")
+            raise JobQueueFullError(kind)
+        self._active.add(job.id)
+        queue.put_nowait(job)
+        logger.info("job_submitted", job_id=str(job.id), kind=kind, queued=self._queue.qsize())
+        return job
+
+    async def get(self, job_id: UUID, user_id: UUID) -> Optional[Job]:
+        """获取用户自己的任务"""
+        job = await asyncio.to_thread(db.get_job, job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def events(self, job_id: UUID, after_seq: int = 0) -> AsyncGenerator[JobEvent, None]:
+        """按顺序产出任务事件，直到任务结束"""
+        delay = self.flush_interval
+        while True:
+            # 在读取之前清除通知，读取期间写入的事件会再次唤醒
+            wakeup = self._wakeups.get(job_id)
+            if wakeup is not None:
+                wakeup.clear()
+            # 先读状态再读事件：任务结束前写入的事件一定能在这次读取中拿到
+            job = await asyncio.to_thread(db.get_job, job_id)
+            for event in await asyncio.to_thread(db.get_job_events, job_id, after_seq):
+                after_seq = event.seq
+                yield event
+            if job is None or job.status in TERMINAL_STATUSES:
+                return
+
+            if wakeup is not None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # 任务在其他 worker 上执行（或尚未开始），轮询
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2.0)
+
+    # ============ 执行 ============
+
+    async def _worker(self) -> None:
+        while not self._closing:
+            job = await self._queue.get()
+            if self._closing:
+                break
+            self._running.add(job.id)
+            try:
+                await self._execute(job)
+            finally:
+                self._running.discard(job.id)
+                self._active.discard(job.id)
+
+    async def _execute(self, job: Job) -> None:
+        handler = self._handlers[job.kind]
+        context = JobContext(job)
+        wakeup = self._wakeups[job.id] = asyncio.Event()
+        started_at = datetime.now(timezone.utc)
+        await asyncio.to_thread(
+            db.update_job, job.id, status="running", worker=self.worker_id, started_at=started_at
+        )
+
+        async def flusher():
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                if await context.flush():
+                    wakeup.set()
+
+        flush_task = asyncio.create_task(flusher())
+        fields: Dict[str, Any]
+        try:
+            result = await asyncio.wait_for(handler(job, context), self.timeout)
+            fields = {"status": "succeeded", "result": json.dumps(result, ensure_ascii=False, default=str)}
+        except asyncio.TimeoutError:
+            fields = {"status": "failed", "error": f"任务超时（{self.timeout} 秒）"}
+        except asyncio.CancelledError:
+            fields = {"status": "failed", "error": "服务关闭，任务中断"}
+            raise
+        except Exception as e:
+            logger.error("job_failed", job_id=str(job.id), kind=job.kind, error=str(e))
+            fields = {"status": "failed", "error": str(e)}
+        finally:
+            flush_task.cancel()
+            await context.flush()
+            finished_at = datetime.now(timezone.utc)
+            await asyncio.to_thread(
+                db.update_job,
+                job.id,
+                finished_at=finished_at,
+                expires_at=finished_at + timedelta(seconds=self.result_ttl),
+                **fields,
+            )
+            logger.info(
+                "job_finished",
+                job_id=str(job.id),
+                kind=job.kind,
+                status=fields["status"],
+                duration_ms=round((finished_at - started_at).total_seconds() * 1000, 1),
+            )
+            wakeup.set()
+            self._wakeups.pop(job.id, None)
+
+    def _maintain_once(self, active: List[UUID]) -> None:
+        db.touch_jobs(active, self.result_ttl)
+        stale = db.fail_stale_jobs(self.heartbeat_interval * 4)
+        expired = db.delete_expired_jobs()
+        if stale or expired:
+            logger.info("jobs_maintained", stale=stale, expired=expired)
+
+    async def _maintain(self) -> None:
+        """心跳、识别已退出进程的任务、清理过期结果"""
+        while True:
+            try:
+                # 传入快照：_active 在事件循环中被修改
+                await asyncio.to_thread(self._maintain_once, list(self._active))
+            except Exception as e:
+                logger.error("job_maintenance_failed", error=str(e))
+            await asyncio.sleep(self.heartbeat_interval)
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+        logger.info("job_runner_started", workers=self.workers, worker_id=self.worker_id)
+
+    async def stop(self, timeout: float = 0.0) -> None:
+        """停止 worker
+
+        先停止接收和开始新任务，等待执行中的任务最多 timeout 秒；
+        之后仍在执行的和排队中的任务标记为失败。
+        """
+        self._closing = True
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self._running and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.1)
+        if self._running:
+            logger.warning("jobs_interrupted", running=len(self._running))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job_id in self._active:
+            await asyncio.to_thread(db.update_job, job_id, status="failed", error="服务关闭，任务中断")
+        self._active.clear()
+        self._running.clear()
+        self._tasks = []
+        self._queue = None
+        self._closing = False
+
+
+# 创建全局实例
+job_runner = JobRunner(
+    workers=settings.JOB_WORKERS,
+    queue_size=settings.JOB_QUEUE_SIZE,
+    timeout=settings.JOB_TIMEOUT,
+    result_ttl=settings.JOB_RESULT_TTL,
+    flush_interval=settings.JOB_EVENT_FLUSH_INTERVAL,
+    heartbeat_interval=settings.JOB_HEARTBEAT_INTERVAL,
+)
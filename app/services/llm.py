@@ -1,55 +1,118 @@
 """Ollama LLM 服务"""
 
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
 
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import BaseMessage
 from langchain_ollama import ChatOllama
+from langgraph.constants import TAG_NOSTREAM
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.core.config import settings
 from app.core.logging import logger
+from app.services.ollama_pool import OllamaBackendPool
+from app.services.usage import usage_ledger
+
+
+def token_counts(response: BaseMessage) -> Tuple[int, int]:
+    """从响应中取 (prompt_tokens, completion_tokens)（Ollama 的 prompt_eval_count / eval_count）"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    metadata = getattr(response, "response_metadata", None) or {}
+    return metadata.get("prompt_eval_count") or 0, metadata.get("eval_count") or 0
 
 
 class LLMService:
-    """LLM 服务类 - 封装 Ollama 模型调用"""
+    """LLM 服务类 - 封装 Ollama 模型调用
+
+    支持多个 Ollama 后端：同一会话（thread_id）的请求固定到同一个后端，
+    以复用 Ollama 的 prompt 缓存；后端不可用时自动切换。
+    """
 
     def __init__(self):
-        self._llm: Optional[BaseChatModel] = None
         self._model_name = settings.DEFAULT_LLM_MODEL
+        self._tools: List = []
+        # (base_url, model, temperature, num_predict) -> LLM 实例（已绑定工具）
+        self._llms: Dict[Tuple[str, str, float, int], BaseChatModel] = {}
+        self.pool = OllamaBackendPool(
+            settings.OLLAMA_BASE_URLS,
+            max_failures=settings.OLLAMA_MAX_FAILURES,
+            max_skew=settings.OLLAMA_AFFINITY_MAX_SKEW,
+            health_check_interval=settings.OLLAMA_HEALTH_CHECK_INTERVAL,
+        )
         self._initialize()
 
     def _initialize(self):
         """初始化 LLM"""
         try:
-            self._llm = ChatOllama(
-                model=self._model_name,
-                base_url=settings.OLLAMA_BASE_URL,
-                temperature=settings.DEFAULT_LLM_TEMPERATURE,
-                num_predict=settings.MAX_TOKENS,
-            )
+            for backend in self.pool.backends:
+                self._get_llm(backend.url)
             logger.info(
                 "ollama_llm_initialized",
                 model=self._model_name,
-                base_url=settings.OLLAMA_BASE_URL,
+                base_urls=[backend.url for backend in self.pool.backends],
             )
         except Exception as e:
             logger.error("ollama_llm_initialization_failed", error=str(e))
             raise
 
+    def _get_llm(
+        self,
+        base_url: str,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> BaseChatModel:
+        """获取（并缓存）指定后端与参数的 LLM 实例"""
+        key = (
+            base_url,
+            model or self._model_name,
+            settings.DEFAULT_LLM_TEMPERATURE if temperature is None else temperature,
+            max_tokens or settings.MAX_TOKENS,
+        )
+        llm = self._llms.get(key)
+        if llm is None:
+            llm = ChatOllama(
+                model=key[1],
+                base_url=base_url,
+                temperature=key[2],
+                num_predict=key[3],
+            )
+            if self._tools:
+                llm = llm.bind_tools(self._tools)
+            self._llms[key] = llm
+        return llm
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10),
         reraise=True,
     )
-    async def _call_with_retry(self, messages: List[BaseMessage]) -> BaseMessage:
-        """带重试的 LLM 调用"""
-        return await self._llm.ainvoke(messages)
+    async def _call_with_retry(
+        self,
+        messages: List[BaseMessage],
+        thread_id: Optional[str] = None,
+        stream: bool = True,
+        **llm_kwargs,
+    ) -> BaseMessage:
+        """带重试的 LLM 调用（每次重试重新选择后端）"""
+        # 带 nostream 标签的调用不进入 LangGraph 的 messages 流
+        config = None if stream else {"tags": [TAG_NOSTREAM]}
+        async with self.pool.acquire(thread_id) as backend:
+            llm = self._get_llm(backend.url, **llm_kwargs)
+            response = await llm.ainvoke(messages, config=config)
+        logger.debug("ollama_call_success", message_count=len(messages), backend=backend.url)
+        return response
 
     async def call(
         self,
         messages: List[BaseMessage],
         model: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        user_id: Optional[UUID] = None,
+        stream: bool = True,
         **kwargs,
     ) -> BaseMessage:
         """调用 LLM
@@ -57,41 +120,50 @@ class LLMService:
         Args:
             messages: 消息列表
             model: 可选的模型名称
-            **kwargs: 其他参数
+            thread_id: 会话 ID，用于把同一会话固定到同一个后端
+            user_id: 用户 ID，用于记录 token 用量
+            stream: 为 False 时 token 不输出到图的流式结果（回复可能被丢弃时使用）
+            **kwargs: 其他参数（temperature / max_tokens）
 
         Returns:
             LLM 响应消息
         """
-        # 如果指定了不同的模型，创建新实例
-        if model and model != self._model_name:
-            llm = ChatOllama(
+        try:
+            response = await self._call_with_retry(
+                messages,
+                thread_id=thread_id,
+                stream=stream,
                 model=model,
-                base_url=settings.OLLAMA_BASE_URL,
-                temperature=kwargs.get("temperature", settings.DEFAULT_LLM_TEMPERATURE),
-                num_predict=kwargs.get("max_tokens", settings.MAX_TOKENS),
+                temperature=kwargs.get("temperature"),
+                max_tokens=kwargs.get("max_tokens"),
             )
-            return await llm.ainvoke(messages)
-
-        # 使用默认 LLM
-        try:
-            response = await self._call_with_retry(messages)
-            logger.debug("ollama_call_success", message_count=len(messages))
-            return response
         except Exception as e:
             logger.error("ollama_call_failed", error=str(e))
             raise
+        if user_id is not None:
+            usage_ledger.record(user_id, *token_counts(response))
+        return response
 
     def get_llm(self) -> BaseChatModel:
-        """获取 LLM 实例"""
-        return self._llm
+        """获取 LLM 实例（第一个后端）"""
+        return self._get_llm(self.pool.backends[0].url)
 
     def bind_tools(self, tools: List) -> "LLMService":
         """绑定工具到 LLM"""
-        if self._llm and tools:
-            self._llm = self._llm.bind_tools(tools)
+        if tools:
+            self._tools = list(tools)
+            self._llms.clear()
             logger.debug("tools_bound_to_llm", count=len(tools))
         return self
 
+    def start(self) -> None:
+        """启动后端健康检查"""
+        self.pool.start()
+
+    async def stop(self) -> None:
+        """停止后端健康检查"""
+        await self.pool.stop()
+
 
 # 创建全局 LLM 服务实例
 llm_service = LLMService()
\ No newline at end of file
@@ -0,0 +1,328 @@
+"""长期记忆向量集合的索引管理与压缩
+
+- 为 mem0 的 pgvector 集合创建并调优 HNSW / IVFFlat 向量索引和 user_id 表达式索引
+- 为 mem0 提供带检索参数（ef_search / probes）的连接池
+- 周期性地按用户合并近似重复的记忆
+"""
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from psycopg import AsyncConnection, Connection, sql
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+from app.core.config import settings
+from app.core.logging import logger
+
+# 维护任务的 advisory lock，保证多个 worker 中同一时间只有一个在执行
+MAINTENANCE_LOCK_KEY = 0x4148_0031
+
+
+class MemoryIndexManager:
+    """长期记忆集合维护"""
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self._pool: Optional[AsyncConnectionPool] = None
+        self._search_pool: Optional[ConnectionPool] = None
+        # 数据库是否支持 hnsw.iterative_scan（首次建立检索连接时检测）
+        self._iterative_scan: Optional[bool] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def _table(self) -> sql.Identifier:
+        return sql.Identifier(self.collection_name)
+
+    def _index_name(self, suffix: str) -> sql.Identifier:
+        return sql.Identifier(f"{self.collection_name}_{suffix}")
+
+    # ============ 检索参数 ============
+
+    def _supports_iterative_scan(self, conn: Connection) -> bool:
+        """pgvector 0.8 起才有 hnsw.iterative_scan（结果按进程缓存）"""
+        if self._iterative_scan is None:
+            row = conn.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'").fetchone()
+            try:
+                version = tuple(int(part) for part in row[0].split(".")[:2]) if row else (0, 0)
+            except ValueError:
+                version = (0, 0)
+            self._iterative_scan = version >= (0, 8)
+            if not self._iterative_scan:
+                logger.warning(
+                    "memory_iterative_scan_unsupported",
+                    pgvector_version=row[0] if row else None,
+                    setting=settings.MEMORY_HNSW_ITERATIVE_SCAN,
+                )
+        return self._iterative_scan
+
+    def _configure_search_session(self, conn: Connection) -> None:
+        """为 mem0 的每个新连接设置检索参数"""
+        conn.execute(f"SET hnsw.ef_search = {int(settings.MEMORY_HNSW_EF_SEARCH)}")
+        conn.execute(f"SET ivfflat.probes = {int(settings.MEMORY_IVFFLAT_PROBES)}")
+        if settings.MEMORY_HNSW_ITERATIVE_SCAN and self._supports_iterative_scan(conn):
+            # 带 user_id 过滤时继续扫描，避免返回结果不足 top_k
+            conn.execute(
+                sql.SQL("SET hnsw.iterative_scan = {}").format(
+                    sql.Literal(settings.MEMORY_HNSW_ITERATIVE_SCAN)
+                )
+            )
+        conn.commit()
+
+    def get_search_pool(self) -> ConnectionPool:
+        """mem0 使用的同步连接池"""
+        if self._search_pool is None:
+            self._search_pool = ConnectionPool(
+                conninfo=settings.database_url,
+                min_size=1,
+                max_size=settings.MEMORY_SEARCH_POOL_SIZE,
+                configure=self._configure_search_session,
+                open=False,
+            )
+            self._search_pool.open(wait=False)
+        return self._search_pool
+
+    # ============ 索引管理 ============
+
+    async def _get_pool(self) -> AsyncConnectionPool:
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(
+                settings.database_url,
+                open=False,
+                max_size=2,
+                kwargs={"autocommit": True, "connect_timeout": 10},
+            )
+            await self._pool.open()
+        return self._pool
+
+    async def _table_exists(self, conn: AsyncConnection) -> bool:
+        cursor = await conn.execute("SELECT to_regclass(%s)", (self.collection_name,))
+        row = await cursor.fetchone()
+        return row[0] is not None
+
+    async def _get_index_def(self, conn: AsyncConnection, name: str) -> Optional[str]:
+        cursor = await conn.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname = %s",
+            (self.collection_name, name),
+        )
+        row = await cursor.fetchone()
+        return row[0] if row else None
+
+    def _vector_index_sql(self, name: str, row_count: int) -> sql.Composed:
+        """按配置生成向量索引 DDL"""
+        if settings.MEMORY_INDEX_TYPE == "ivfflat":
+            # pgvector 建议 lists ≈ rows / 1000（百万行以上取 sqrt(rows)）
+            lists = settings.MEMORY_IVFFLAT_LISTS or max(
+                10, row_count // 1000 if row_count <= 1_000_000 else int(row_count ** 0.5)
+            )
+            options = sql.SQL("USING ivfflat (vector vector_cosine_ops) WITH (lists = {})").format(
+                sql.Literal(lists)
+            )
+        else:
+            options = sql.SQL(
+                "USING hnsw (vector vector_cosine_ops) WITH (m = {}, ef_construction = {})"
+            ).format(
+                sql.Literal(settings.MEMORY_HNSW_M),
+                sql.Literal(settings.MEMORY_HNSW_EF_CONSTRUCTION),
+            )
+        return sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} {}").format(
+            sql.Identifier(name), self._table, options
+        )
+
+    async def ensure_indexes(self) -> bool:
+        """创建或按配置重建索引
+
+        Returns:
+            集合表不存在（mem0 尚未写入过）时返回 False
+        """
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            if not await self._table_exists(conn):
+                return False
+
+            # user_id 过滤索引
+            await conn.execute(
+                sql.SQL(
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ((payload->>'user_id'))"
+                ).format(self._index_name("user_id_idx"), self._table)
+            )
+
+            cursor = await conn.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                (self.collection_name,),
+            )
+            row_count = max(0, (await cursor.fetchone())[0])
+
+            name = f"{self.collection_name}_vector_idx"
+            wanted = self._vector_index_sql(name, row_count)
+            current = await self._get_index_def(conn, name)
+            if current is not None and not self._index_matches(current):
+                # 参数变化：先并发建新索引再替换，期间检索不中断
+                tmp_name = f"{name}_rebuild"
+                await conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                    sql.Identifier(tmp_name)))
+                await conn.execute(self._vector_index_sql(tmp_name, row_count))
+                await conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                    sql.Identifier(name)))
+                await conn.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                    sql.Identifier(tmp_name), sql.Identifier(name)))
+                logger.info("memory_vector_index_rebuilt", index=name, definition=current)
+            else:
+                await conn.execute(wanted)
+
+            # 旧版本配置下 mem0 建表时自带的无参数 HNSW 索引与上面的索引重复，删除以减少写入开销
+            # （现在 mem0 配置了 hnsw=False，不会再创建）
+            await conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(
+                self._index_name("hnsw_idx")))
+
+        logger.info(
+            "memory_indexes_ensured",
+            collection=self.collection_name,
+            index_type=settings.MEMORY_INDEX_TYPE,
+            rows=row_count,
+        )
+        return True
+
+    @staticmethod
+    def _index_matches(indexdef: str) -> bool:
+        """现有索引定义是否与配置一致"""
+        indexdef = indexdef.lower()
+        if settings.MEMORY_INDEX_TYPE == "ivfflat":
+            if "using ivfflat" not in indexdef:
+                return False
+            return not settings.MEMORY_IVFFLAT_LISTS or f"lists='{settings.MEMORY_IVFFLAT_LISTS}'" in indexdef
+        return (
+            "using hnsw" in indexdef
+            and f"m='{settings.MEMORY_HNSW_M}'" in indexdef
+            and f"ef_construction='{settings.MEMORY_HNSW_EF_CONSTRUCTION}'" in indexdef
+        )
+
+    # ============ 去重合并 ============
+
+    async def compact_user(self, conn: AsyncConnection, user_id: str) -> int:
+        """合并单个用户的近似重复记忆
+
+        余弦距离低于 MEMORY_DEDUP_DISTANCE 的记忆归为一组，
+        每组保留文本最长（信息最多）的一条，其余删除。
+
+        Returns:
+            删除的记忆条数
+        """
+        cursor = await conn.execute(
+            sql.SQL("""
+                SELECT a.id::text, b.id::text
+                FROM {table} a
+                JOIN {table} b
+                  ON b.payload->>'user_id' = a.payload->>'user_id' AND a.id < b.id
+                WHERE a.payload->>'user_id' = %s
+                  AND (a.vector <=> b.vector) < %s
+            """).format(table=self._table),
+            (user_id, settings.MEMORY_DEDUP_DISTANCE),
+        )
+        pairs = await cursor.fetchall()
+        if not pairs:
+            return 0
+
+        # 并查集聚类
+        parent: Dict[str, str] = {}
+
+        def find(x: str) -> str:
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for a, b in pairs:
+            parent[find(a)] = find(b)
+
+        cursor = await conn.execute(
+            sql.SQL("""
+                SELECT id::text, length(coalesce(payload->>'data', '')),
+                       coalesce(payload->>'updated_at', payload->>'created_at', '')
+                FROM {} WHERE id = ANY(%s::uuid[])
+            """).format(self._table),
+            (list(parent),),
+        )
+        groups: Dict[str, List[Tuple[str, int, str]]] = {}
+        for memory_id, length, updated_at in await cursor.fetchall():
+            groups.setdefault(find(memory_id), []).append((memory_id, length, updated_at))
+
+        to_delete = []
+        for members in groups.values():
+            members.sort(key=lambda m: (m[1], m[2]), reverse=True)
+            to_delete.extend(m[0] for m in members[1:])
+
+        if to_delete:
+            await conn.execute(
+                sql.SQL("DELETE FROM {} WHERE id = ANY(%s::uuid[])").format(self._table),
+                (to_delete,),
+            )
+        logger.info("memory_user_compacted", user_id=user_id, removed=len(to_delete))
+        return len(to_delete)
+
+    async def compact_all(self) -> int:
+        """对所有有多条记忆的用户执行去重"""
+        pool = await self._get_pool()
+        removed = 0
+        async with pool.connection() as conn:
+            if not await self._table_exists(conn):
+                return 0
+            cursor = await conn.execute(
+                sql.SQL("""
+                    SELECT payload->>'user_id' FROM {}
+                    WHERE payload->>'user_id' IS NOT NULL
+                    GROUP BY 1 HAVING count(*) > 1
+                """).format(self._table)
+            )
+            user_ids = [row[0] for row in await cursor.fetchall()]
+            for user_id in user_ids:
+                removed += await self.compact_user(conn, user_id)
+                # 让出事件循环，避免长时间占用
+                await asyncio.sleep(0)
+        return removed
+
+    # ============ 周期任务 ============
+
+    async def run_maintenance(self) -> None:
+        """执行一轮维护（多个 worker 中只有一个会真正执行）"""
+        pool = await self._get_pool()
+        async with pool.connection() as conn:
+            cursor = await conn.execute("SELECT pg_try_advisory_lock(%s)", (MAINTENANCE_LOCK_KEY,))
+            if not (await cursor.fetchone())[0]:
+                return
+            try:
+                if await self.ensure_indexes():
+                    removed = await self.compact_all()
+                    logger.info("memory_maintenance_completed", removed=removed)
+            finally:
+                await conn.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_KEY,))
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_maintenance()
+            except Exception as e:
+                logger.error("memory_maintenance_failed", error=str(e))
+            await asyncio.sleep(settings.MEMORY_MAINTENANCE_INTERVAL)
+
+    def start(self) -> None:
+        """启动周期维护任务"""
+        if self._task is None and settings.MEMORY_MAINTENANCE_INTERVAL > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """停止维护任务并关闭连接池"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+        if self._search_pool is not None:
+            self._search_pool.close()
+            self._search_pool = None
+
+
+# 创建全局实例
+memory_index = MemoryIndexManager(settings.LONG_TERM_MEMORY_COLLECTION_NAME)
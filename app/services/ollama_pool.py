@@ -0,0 +1,189 @@
+"""多 Ollama 后端的负载均衡
+
+- 带 thread_id 的请求通过一致性哈希固定到同一个后端，复用 Ollama 的 KV / prompt 缓存
+- 亲和后端过载或没有 thread_id 时，选择进行中请求最少的后端
+- 后台健康检查；后端下线后其会话顺延到哈希环上的下一个健康后端，恢复后自动迁回
+- 最后一个健康的后端不会被摘除（只有一个后端时，Ollama 重启后请求自动恢复）
+"""
+
+import asyncio
+import bisect
+import hashlib
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from app.core.logging import logger
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class NoHealthyBackendError(Exception):
+    """没有可用的 Ollama 后端"""
+
+
+class OllamaBackend:
+    """单个 Ollama 后端的状态"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        self.requests = 0
+
+    def __repr__(self) -> str:
+        return f"OllamaBackend({self.url}, healthy={self.healthy}, outstanding={self.outstanding})"
+
+
+class OllamaBackendPool:
+    """Ollama 后端池"""
+
+    def __init__(
+        self,
+        urls: List[str],
+        virtual_nodes: int = 64,
+        max_failures: int = 2,
+        max_skew: int = 4,
+        health_check_interval: float = 10.0,
+        health_check_timeout: float = 2.0,
+    ):
+        """
+        Args:
+            urls: 后端地址列表
+            virtual_nodes: 每个后端在哈希环上的虚拟节点数
+            max_failures: 连续失败多少次后标记为不健康
+            max_skew: 亲和后端的进行中请求数比最空闲后端多出该值时，改走最空闲后端
+        """
+        if not urls:
+            raise ValueError("至少需要一个 Ollama 后端")
+        self.backends = [OllamaBackend(url) for url in urls]
+        self.max_failures = max_failures
+        self.max_skew = max_skew
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._task: Optional[asyncio.Task] = None
+
+        # 哈希环
+        ring = sorted(
+            (_hash(f"{backend.url}#{i}"), index)
+            for index, backend in enumerate(self.backends)
+            for i in range(virtual_nodes)
+        )
+        self._ring_hashes = [h for h, _ in ring]
+        self._ring_backends = [index for _, index in ring]
+
+    def _healthy(self) -> List[OllamaBackend]:
+        healthy = [backend for backend in self.backends if backend.healthy]
+        if not healthy:
+            raise NoHealthyBackendError("没有可用的 Ollama 后端")
+        return healthy
+
+    def _affinity_backend(self, key: str) -> OllamaBackend:
+        """沿哈希环顺时针找到第一个健康后端"""
+        start = bisect.bisect(self._ring_hashes, _hash(key))
+        size = len(self._ring_hashes)
+        for offset in range(size):
+            backend = self.backends[self._ring_backends[(start + offset) % size]]
+            if backend.healthy:
+                return backend
+        raise NoHealthyBackendError("没有可用的 Ollama 后端")
+
+    def _least_outstanding(self, candidates: List[OllamaBackend]) -> OllamaBackend:
+        fewest = min(backend.outstanding for backend in candidates)
+        return random.choice([b for b in candidates if b.outstanding == fewest])
+
+    def pick(self, affinity_key: Optional[str] = None) -> OllamaBackend:
+        """选择后端"""
+        healthy = self._healthy()
+        least = self._least_outstanding(healthy)
+        if affinity_key is None:
+            return least
+
+        backend = self._affinity_backend(affinity_key)
+        if backend.outstanding - least.outstanding > self.max_skew:
+            logger.debug(
+                "ollama_affinity_overflow",
+                preferred=backend.url,
+                chosen=least.url,
+                outstanding=backend.outstanding,
+            )
+            return least
+        return backend
+
+    @asynccontextmanager
+    async def acquire(self, affinity_key: Optional[str] = None) -> AsyncIterator[OllamaBackend]:
+        """选择后端并在请求期间计入进行中请求数
+
+        请求抛出异常时记一次失败，连续失败达到阈值后标记为不健康。
+        """
+        backend = self.pick(affinity_key)
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield backend
+        except (httpx.TransportError, ConnectionError) as e:
+            self.mark_failure(backend, e)
+            raise
+        else:
+            backend.failures = 0
+        finally:
+            backend.outstanding -= 1
+
+    def _mark_down(self, backend: OllamaBackend, error: object) -> None:
+        """标记为不健康；不摘除最后一个健康的后端（摘除后只会让所有请求立即失败，直到探测恢复）"""
+        if not backend.healthy:
+            return
+        if not any(other.healthy for other in self.backends if other is not backend):
+            if backend.failures == self.max_failures:
+                logger.warning("ollama_last_backend_failing", url=backend.url, error=str(error))
+            return
+        backend.healthy = False
+        logger.warning("ollama_backend_down", url=backend.url, error=str(error))
+
+    def mark_failure(self, backend: OllamaBackend, error: Exception) -> None:
+        """记录一次失败"""
+        backend.failures += 1
+        if backend.failures >= self.max_failures:
+            self._mark_down(backend, error)
+
+    async def check_health(self) -> None:
+        """探测所有后端"""
+        async with httpx.AsyncClient(timeout=self.health_check_timeout) as client:
+            results = await asyncio.gather(
+                *(client.get(f"{backend.url}/api/tags") for backend in self.backends),
+                return_exceptions=True,
+            )
+        for backend, result in zip(self.backends, results):
+            ok = not isinstance(result, Exception) and result.status_code == 200
+            if ok:
+                if not backend.healthy:
+                    logger.info("ollama_backend_up", url=backend.url)
+                backend.healthy = True
+                backend.failures = 0
+            else:
+                self._mark_down(backend, result)
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error("ollama_health_check_failed", error=str(e))
+            await asyncio.sleep(self.health_check_interval)
+
+    def start(self) -> None:
+        """启动后台健康检查"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        """停止健康检查"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,142 @@
+"""只读副本路由
+
+配置 POSTGRES_REPLICA_URL 后，纯读取（用户查询、会话列表、会话历史的检查点读取）可以走只读副本：
+- 后台每 REPLICA_LAG_CHECK_INTERVAL 秒在副本上查询复制延迟，超过 REPLICA_MAX_LAG 或连接失败时全部回退主库
+- 写入后的短时间内（REPLICA_PIN_SECONDS）相关 key（用户 ID、会话 ID）固定读主库，保证读到自己的写入；
+  写入事件经 InvalidationBus 广播，其他 worker 同样固定
+- 副本查询出错时标记为不可用并回退主库，等下一次延迟检查恢复
+"""
+
+import asyncio
+import time
+from typing import Dict, Hashable, List, Optional
+
+import psycopg
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.utils.cache import LRUCache
+
+# 复制延迟（秒）；不在恢复模式（不是副本）或已回放到最新时为 0
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class ReplicaRouter:
+    """决定一次只读查询走副本还是主库"""
+
+    def __init__(
+        self,
+        url: str = "",
+        max_lag: float = 5.0,
+        pin_seconds: float = 5.0,
+        check_interval: float = 2.0,
+        max_pins: int = 100_000,
+    ):
+        self.url = url
+        self.enabled = bool(url)
+        self.max_lag = max_lag
+        self.pin_seconds = pin_seconds
+        self.check_interval = check_interval
+        # 启动后第一次延迟检查通过前不使用副本
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self._pins: LRUCache[bool] = LRUCache(max_size=max_pins, ttl=pin_seconds)
+        self._pin_all_until = 0.0
+        self.reads: Dict[str, int] = {"replica": 0, "primary": 0, "fallback": 0}
+        self._task: Optional[asyncio.Task] = None
+
+    # ============ 路由 ============
+
+    def pin(self, *keys: Hashable) -> None:
+        """写入后 pin_seconds 秒内这些 key 读主库"""
+        for key in keys:
+            self._pins.set(str(key), True)
+
+    def pin_keys(self, keys: Optional[List[str]]) -> None:
+        """InvalidationBus 处理函数；keys 为 None 时全部读主库"""
+        if keys is None:
+            self._pin_all_until = time.monotonic() + self.pin_seconds
+        else:
+            self.pin(*keys)
+
+    def use_replica(self, key: Optional[Hashable] = None) -> bool:
+        """本次读取是否走副本"""
+        if (
+            not self.healthy
+            or time.monotonic() < self._pin_all_until
+            or (key is not None and str(key) in self._pins)
+        ):
+            self.reads["primary"] += 1
+            return False
+        self.reads["replica"] += 1
+        return True
+
+    def mark_unhealthy(self, error: str) -> None:
+        """副本查询失败：回退主库，直到下一次延迟检查通过"""
+        self.reads["fallback"] += 1
+        if self.healthy:
+            self.healthy = False
+            logger.warning("replica_disabled", reason="query_failed", error=error)
+
+    # ============ 延迟检查 ============
+
+    def _update(self, lag: Optional[float], error: Optional[str] = None) -> None:
+        self.lag = lag
+        healthy = lag is not None and lag <= self.max_lag
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("replica_enabled", lag_s=lag)
+            else:
+                logger.warning("replica_disabled", lag_s=lag, max_lag_s=self.max_lag, error=error)
+        self.healthy = healthy
+
+    async def _check_loop(self) -> None:
+        conn: Optional[psycopg.AsyncConnection] = None
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = await psycopg.AsyncConnection.connect(self.url, autocommit=True, connect_timeout=5)
+                cursor = await conn.execute(LAG_SQL)
+                row = await cursor.fetchone()
+                self._update(float(row[0]))
+            except asyncio.CancelledError:
+                if conn is not None:
+                    await conn.close()
+                raise
+            except Exception as e:
+                self._update(None, str(e))
+                if conn is not None:
+                    await conn.close()
+                conn = None
+            await asyncio.sleep(self.check_interval)
+
+    def stats(self) -> dict:
+        return {"healthy": self.healthy, "lag_s": self.lag, **self.reads}
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._check_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            logger.info("replica_reads", **self.reads)
+
+
+# 创建全局实例
+replica_router = ReplicaRouter(
+    url=settings.POSTGRES_REPLICA_URL,
+    max_lag=settings.REPLICA_MAX_LAG,
+    pin_seconds=settings.REPLICA_PIN_SECONDS,
+    check_interval=settings.REPLICA_LAG_CHECK_INTERVAL,
+)
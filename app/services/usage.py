@@ -0,0 +1,218 @@
+"""Token 用量记账与配额
+
+- 每次 LLM 调用后把 Ollama 返回的 prompt / eval token 数累加到进程内计数器（record）
+- 后台按 USAGE_FLUSH_INTERVAL 把计数器用一条 upsert 批量写入 token_usage 表，
+  随后用一条查询刷新本进程活跃用户的当天 / 当月总量（包含其他 worker 写入的部分）
+- 配额检查（check）只读内存：数据库快照 + 本进程尚未写入的增量；
+  用户在本进程第一次出现时才查询一次数据库
+- check 经同步依赖在线程池中执行，刷写也在线程中执行，计数器与快照的读写都持锁；
+  数据库查询不持锁
+
+多个 worker 之间通过数据库快照同步，每个 worker 看到的其他 worker 用量最多滞后约两个刷写周期，
+因此配额可能被超出 worker 数 × 刷写周期内的用量，用于成本控制足够。
+"""
+
+import asyncio
+import calendar
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from app.core.config import settings
+from app.core.logging import logger
+from app.services.database import db
+
+
+class QuotaExceededError(Exception):
+    """用户超出 token 配额"""
+
+    def __init__(self, period: str, limit: int, retry_after: int):
+        self.period = period
+        self.limit = limit
+        self.retry_after = retry_after
+        self.detail = "今日 token 用量已达上限" if period == "daily" else "本月 token 用量已达上限"
+        super().__init__(f"{period} token quota exceeded ({limit})")
+
+
+@dataclass
+class _Totals:
+    """数据库中的用量快照"""
+    day: date
+    day_tokens: int
+    month_tokens: int
+
+
+def _today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _seconds_until(moment: datetime) -> int:
+    return max(1, int((moment - datetime.now(timezone.utc)).total_seconds()))
+
+
+class UsageLedger:
+    """按用户累计 token 用量并执行每日 / 每月配额"""
+
+    def __init__(
+        self,
+        daily_limit: int = 0,
+        monthly_limit: int = 0,
+        flush_interval: float = 5.0,
+        active_ttl: float = 600.0,
+        enabled: bool = True,
+    ):
+        self.daily_limit = daily_limit
+        self.monthly_limit = monthly_limit
+        self.flush_interval = flush_interval
+        self.active_ttl = active_ttl
+        self.enabled = enabled
+        # (user_id, day) -> [prompt_tokens, completion_tokens, requests]，尚未写入数据库
+        self._pending: Dict[Tuple[UUID, date], List[int]] = {}
+        # 正在写入数据库的增量，快照刷新前仍计入用量
+        self._flushing: Dict[Tuple[UUID, date], List[int]] = {}
+        self._totals: Dict[UUID, _Totals] = {}
+        # 用户最近一次调用或检查的时间，超过 active_ttl 不再刷新快照
+        self._last_seen: Dict[UUID, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # ============ 记账 ============
+
+    def record(self, user_id: UUID, prompt_tokens: int, completion_tokens: int) -> None:
+        """累加一次 LLM 调用的用量"""
+        if not self.enabled:
+            return
+        with self._lock:
+            counts = self._pending.setdefault((user_id, _today()), [0, 0, 0])
+            counts[0] += prompt_tokens
+            counts[1] += completion_tokens
+            counts[2] += 1
+            self._last_seen[user_id] = time.monotonic()
+
+    def usage(self, user_id: UUID) -> Tuple[int, int]:
+        """当天与当月（UTC）已用 token 数"""
+        today = _today()
+        with self._lock:
+            self._last_seen[user_id] = time.monotonic()
+            totals = self._totals.get(user_id)
+        if totals is None or totals.day != today:
+            # 本进程第一次见到该用户，或跨天后快照失效
+            try:
+                self._refresh([user_id], today)
+            except Exception as e:
+                # 数据库不可用时不阻塞请求，下一次刷写时再同步
+                logger.error("token_usage_load_failed", user_id=str(user_id), error=str(e))
+                with self._lock:
+                    self._totals[user_id] = _Totals(today, 0, 0)
+
+        with self._lock:
+            totals = self._totals.get(user_id) or _Totals(today, 0, 0)
+            day_used, month_used = totals.day_tokens, totals.month_tokens
+            for pending in (self._pending, self._flushing):
+                for day in (today, today - timedelta(days=1)):
+                    counts = pending.get((user_id, day))
+                    if counts is None:
+                        continue
+                    tokens = counts[0] + counts[1]
+                    if day == today:
+                        day_used += tokens
+                    if day.month == today.month:
+                        month_used += tokens
+        return day_used, month_used
+
+    def check(self, user_id: UUID) -> None:
+        """超出配额时抛出 QuotaExceededError（不访问数据库）"""
+        if not self.enabled or not (self.daily_limit or self.monthly_limit):
+            return
+        day_used, month_used = self.usage(user_id)
+        now = datetime.now(timezone.utc)
+        if self.daily_limit and day_used >= self.daily_limit:
+            tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+            raise QuotaExceededError("daily", self.daily_limit, _seconds_until(tomorrow))
+        if self.monthly_limit and month_used >= self.monthly_limit:
+            days = calendar.monthrange(now.year, now.month)[1]
+            next_month = datetime.combine(
+                now.date().replace(day=1) + timedelta(days=days), datetime.min.time(), timezone.utc
+            )
+            raise QuotaExceededError("monthly", self.monthly_limit, _seconds_until(next_month))
+
+    # ============ 刷写 ============
+
+    def _refresh(self, user_ids: Iterable[UUID], today: date) -> None:
+        rows = db.get_token_totals(user_ids, today)
+        with self._lock:
+            for user_id, (day_tokens, month_tokens) in rows.items():
+                self._totals[user_id] = _Totals(today, day_tokens, month_tokens)
+
+    def flush(self) -> None:
+        """写入未刷写的增量，并刷新活跃用户的快照（同步访问数据库，在线程中调用）"""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flushing = batch
+        try:
+            if batch:
+                try:
+                    db.add_token_usage([
+                        (user_id, day, prompt_tokens, completion_tokens, requests)
+                        for (user_id, day), (prompt_tokens, completion_tokens, requests) in batch.items()
+                    ])
+                except Exception:
+                    # 写入失败时放回，下个周期重试
+                    with self._lock:
+                        for key, counts in batch.items():
+                            pending = self._pending.setdefault(key, [0, 0, 0])
+                            for i, value in enumerate(counts):
+                                pending[i] += value
+                        self._flushing = {}
+                    raise
+
+            cutoff = time.monotonic() - self.active_ttl
+            with self._lock:
+                for user_id in [u for u, seen in self._last_seen.items() if seen < cutoff]:
+                    del self._last_seen[user_id]
+                    self._totals.pop(user_id, None)
+                active = list(self._last_seen)
+            if active:
+                self._refresh(active, _today())
+        finally:
+            with self._lock:
+                self._flushing = {}
+        if batch:
+            logger.debug("token_usage_flushed", rows=len(batch), active_users=len(active))
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.error("token_usage_flush_failed", error=str(e))
+
+    # ============ 生命周期 ============
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """停止后台刷写并写入剩余的增量"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await asyncio.to_thread(self.flush)
+        except Exception as e:
+            logger.error("token_usage_flush_failed", error=str(e))
+
+
+# 创建全局实例
+usage_ledger = UsageLedger(
+    daily_limit=settings.USAGE_DAILY_TOKEN_LIMIT,
+    monthly_limit=settings.USAGE_MONTHLY_TOKEN_LIMIT,
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    enabled=settings.USAGE_ENABLED,
+)
@@ -12,10 +12,28 @@ from app.core.config import settings
 from app.core.logging import logger
 from app.models.user import User
 from app.services.database import db
+from app.services.invalidation import invalidation_bus
+from app.services.usage import QuotaExceededError, usage_ledger
 
 # Bearer Token 安全方案
 security = HTTPBearer()
 
+# 用户记录缓存（用户被修改时经 InvalidationBus 在所有 worker 上失效）
+_user_cache = invalidation_bus.cache(
+    "user", max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL
+)
+
+
+def _get_user(user_id: UUID) -> Optional[User]:
+    """按 ID 获取用户（带缓存）"""
+    key = str(user_id)
+    user = _user_cache.get(key)
+    if user is None:
+        user = db.get_user_by_id(user_id)
+        if user is not None:
+            _user_cache.set(key, user)
+    return user
+
 
 def create_access_token(user_id: UUID) -> str:
     """创建 JWT 访问令牌"""
@@ -60,7 +78,7 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = db.get_user_by_id(user_id)
+    user = _get_user(user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -73,4 +91,39 @@ def get_current_user(
             detail="用户已被禁用",
         )
 
-    return user
\ No newline at end of file
+    return user
+
+
+def get_quota_user(current_user: User = Depends(get_current_user)) -> User:
+    """获取当前用户并检查 token 配额（超出时返回 429）"""
+    try:
+        usage_ledger.check(current_user.id)
+    except QuotaExceededError as e:
+        logger.info("token_quota_exceeded", user_id=str(current_user.id), period=e.period)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return current_user
+
+
+def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    """获取当前用户并要求其在 ADMIN_EMAILS 中"""
+    if current_user.email.lower() not in settings.ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限",
+        )
+    return current_user
+
+
+def authenticate_token(token: str) -> Optional[User]:
+    """校验令牌并返回有效用户（用于 WebSocket 等无法使用依赖注入的场景）"""
+    user_id = verify_token(token)
+    if user_id is None:
+        return None
+    user = _get_user(user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
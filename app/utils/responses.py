@@ -0,0 +1,62 @@
+"""快速 JSON 响应
+
+- FastJSONResponse：用 orjson 序列化，作为应用的默认响应类
+- json_bytes_response：接口自行构造好的 bytes 直接返回，跳过 response_model 的校验与二次序列化；
+  超过 RESPONSE_COMPRESS_MIN_BYTES 时按 Accept-Encoding 做 brotli（已安装时）或 gzip 压缩
+"""
+
+import gzip
+from typing import Any, Optional
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 序列化的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _accepts(accept_encoding: str, encoding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """按客户端支持的编码压缩，返回 (body, Content-Encoding)"""
+    if (
+        not settings.RESPONSE_COMPRESSION
+        or not accept_encoding
+        or len(body) < settings.RESPONSE_COMPRESS_MIN_BYTES
+    ):
+        return body, None
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        return brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY), "br"
+    if _accepts(accept_encoding, "gzip"):
+        return gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def json_bytes_response(
+    body: bytes,
+    accept_encoding: Optional[str] = None,
+    status_code: int = 200,
+) -> Response:
+    """返回已序列化的 JSON"""
+    body, encoding = compress(body, accept_encoding)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,96 @@
+"""并发请求合并（single-flight）
+
+同一 key 的并发调用只执行一次，其余调用等待同一个结果：
+- 实际执行放在独立的 task 中，发起者被取消（客户端断开）不影响其他等待者
+- 可选传入缓存：结果写入缓存，在其 TTL 内直接复用（微 TTL）
+- invalidate 丢弃进行中的执行和缓存结果，之后的调用重新执行；
+  被丢弃的执行完成后不会写入缓存，避免把写入前读到的旧数据放回缓存
+
+只在单个事件循环内使用。
+"""
+
+import asyncio
+from functools import partial
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, TypeVar
+
+from app.utils.cache import LRUCache
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+# 所有实例，用于汇总合并率
+_registry: List["SingleFlight"] = []
+
+
+class SingleFlight(Generic[V]):
+    """按 key 合并并发调用"""
+
+    def __init__(self, name: str, cache: Optional[LRUCache[V]] = None):
+        self.name = name
+        self.cache = cache
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        # 实际执行次数 / 等待进行中执行的次数 / 直接复用缓存结果的次数
+        self.executions = 0
+        self.shared = 0
+        self.reused = 0
+        _registry.append(self)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[V]]) -> V:
+        """执行 fn()，同一 key 的并发调用共享一次执行"""
+        self.calls += 1
+        if self.cache is not None:
+            value = self.cache.get(key, _MISSING)
+            if value is not _MISSING:
+                self.reused += 1
+                return value
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.executions += 1
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(partial(self._finished, key))
+        else:
+            self.shared += 1
+        return await asyncio.shield(flight)
+
+    def _finished(self, key: Hashable, flight: asyncio.Future) -> None:
+        if flight.cancelled():
+            current = False
+        else:
+            # 所有等待者都已取消时也要取出异常，避免 "exception was never retrieved"
+            current = flight.exception() is None
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            if current and self.cache is not None:
+                self.cache.set(key, flight.result())
+
+    def invalidate(self, keys: Optional[List[Hashable]] = None) -> None:
+        """丢弃进行中的执行与缓存结果；keys 为 None 表示全部"""
+        if keys is None:
+            self._flights.clear()
+            if self.cache is not None:
+                self.cache.clear()
+            return
+        for key in keys:
+            self._flights.pop(key, None)
+            if self.cache is not None:
+                self.cache.pop(key)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "executions": self.executions,
+            "shared": self.shared,
+            "reused": self.reused,
+            # 不需要单独执行的调用比例
+            "coalescing_rate": round((self.shared + self.reused) / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+def single_flight_stats() -> List[dict]:
+    """所有 SingleFlight 实例的合并统计"""
+    return [flight.stats() for flight in _registry]
@@ -6,6 +6,13 @@ set -e
 
 APP_DIR="$(dirname "$0")"
 LOG_FILE="$APP_DIR/server.log"
+# 排空期限：进行中的流最多再运行 DRAIN_TIMEOUT 秒，之后写入后台记忆与用量、关闭连接池
+DRAIN_TIMEOUT="${DRAIN_TIMEOUT:-30}"
+DRAIN_FLUSH_TIMEOUT="${DRAIN_FLUSH_TIMEOUT:-15}"
+# uvicorn 等待连接关闭的上限（超过后取消剩余请求）
+GRACEFUL_TIMEOUT=$((DRAIN_TIMEOUT + 5))
+# 超过该时间仍未退出才强制结束
+STOP_TIMEOUT=$((GRACEFUL_TIMEOUT + DRAIN_FLUSH_TIMEOUT + 10))
 
 echo "🚀 开始部署 AgentHub..."
 cd "$APP_DIR"
@@ -21,21 +28,29 @@ PYTHON_PID=$(pgrep -f "uvicorn app.main:app" || echo "")
 if [ ! -z "$PYTHON_PID" ]; then
     echo "⚠️  停止旧进程 (PID: $PYTHON_PID)..."
     kill -TERM $PYTHON_PID 2>/dev/null || true
-    sleep 3
-    kill -KILL $PYTHON_PID 2>/dev/null || true
-    echo "✅ 已停止"
+    echo "⏳ 等待排空（最长 ${STOP_TIMEOUT}s）..."
+    for _ in $(seq "$STOP_TIMEOUT"); do
+        pgrep -f "uvicorn app.main:app" > /dev/null || break
+        sleep 1
+    done
+    if pgrep -f "uvicorn app.main:app" > /dev/null; then
+        echo "⚠️  排空超时，强制结束"
+        kill -KILL $PYTHON_PID 2>/dev/null || true
+    fi
+    echo "✅ 已停止（截断的流数见日志中的 drain_completed）"
 fi
 
 # 3. 启动程序（使用 screen）
 echo "🚀 启动程序..."
-screen -dmS agenthub bash -c "uv run uvicorn app.main:app --host 0.0.0.0 --port 8000 2>&1 | tee $LOG_FILE"
+# 应用日志为 JSON，由后台线程写入 logs/app-<pid>.log；这里只保留启动输出和崩溃信息
+screen -dmS agenthub bash -c "LOG_ASYNC=true LOG_FORMAT=json DRAIN_TIMEOUT=$DRAIN_TIMEOUT DRAIN_FLUSH_TIMEOUT=$DRAIN_FLUSH_TIMEOUT uv run uvicorn app.main:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown $GRACEFUL_TIMEOUT >> $LOG_FILE 2>&1"
 
 sleep 3
 
 if screen -list | grep -q "agenthub"; then
     echo "🎉 部署完成！"
     echo "📝 进入会话: screen -r agenthub"
-    echo "📝 日志文件: tail -f $LOG_FILE"
+    echo "📝 日志文件: tail -f $LOG_FILE logs/app-*.log"
     echo "🔗 地址: http://localhost:8000"
 else
     echo "❌ 启动失败，查看日志: tail -f $LOG_FILE"
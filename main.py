@@ -1,5 +1,168 @@
-def main():
-    print("Hello from agenthub!")
+"""离线批量评测
+
+绕过 HTTP 层直接驱动 LangGraphAgent，批量跑 JSONL 中的提示词：
+
+    python main.py prompts.jsonl -o results.jsonl -c 8 --ephemeral
+
+- 输入每行一个 JSON：{"id": "...", "prompt": "..."}（也接受 "message"；没有 id 时使用行号）
+- 结果按完成顺序逐行写入输出文件：{"id", "response", "latency_ms"} 或 {"id", "error", "latency_ms"}
+- 成功的 id 追加到检查点文件（默认 <输出>.done），中断后重新运行会跳过这些 id；失败的会重跑
+- --ephemeral 使用不带检查点的图，每条提示词独立、不写数据库
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="批量运行评测提示词")
+    parser.add_argument("input", type=Path, help="输入 JSONL 文件")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="输出 JSONL 文件（追加写入）")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="并发数（默认 4）")
+    parser.add_argument("--checkpoint", type=Path, help="已完成 id 文件（默认 <输出>.done）")
+    parser.add_argument("--ephemeral", action="store_true", help="不持久化对话状态")
+    parser.add_argument("--limit", type=int, help="最多运行多少条")
+    return parser.parse_args(argv)
+
+
+def load_completed(path: Path) -> Set[str]:
+    """读取检查点中已完成的 id"""
+    if not path.exists():
+        return set()
+    with path.open(encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def read_prompts(path: Path, completed: Set[str]) -> Tuple[List[Tuple[str, str]], int]:
+    """读取待运行的提示词，返回 ([(id, prompt)], 跳过数)"""
+    prompts = []
+    skipped = 0
+    with path.open(encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompt_id = str(record.get("id", line_no))
+            if prompt_id in completed:
+                skipped += 1
+                continue
+            prompts.append((prompt_id, record.get("prompt") or record["message"]))
+    return prompts, skipped
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+class BatchRunner:
+    """有界并发地运行提示词，结果和检查点在每条完成时写入"""
+
+    def __init__(self, output: Path, checkpoint: Path, concurrency: int, ephemeral: bool):
+        self.output = output
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.ephemeral = ephemeral
+        self.latencies: List[float] = []
+        self.failed = 0
+
+    async def run_one(self, agent, prompt_id: str, prompt: str) -> dict:
+        # 持久化模式下每条提示词使用独立的 thread，重跑时从头开始
+        session_id = str(uuid.uuid4())
+        start = time.perf_counter()
+        try:
+            response = await agent.chat(prompt, session_id, ephemeral=self.ephemeral)
+            result = {"id": prompt_id, "response": response}
+        except Exception as e:
+            result = {"id": prompt_id, "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def run(self, agent, prompts: List[Tuple[str, str]]) -> None:
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in prompts:
+            queue.put_nowait(item)
+
+        with self.output.open("a", encoding="utf-8") as out, \
+                self.checkpoint.open("a", encoding="utf-8") as done:
+
+            async def worker():
+                while not queue.empty():
+                    prompt_id, prompt = queue.get_nowait()
+                    result = await self.run_one(agent, prompt_id, prompt)
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    out.flush()
+                    if "error" in result:
+                        self.failed += 1
+                    else:
+                        self.latencies.append(result["latency_ms"])
+                        # 结果写入后再记录检查点：崩溃时最多重复一条，不会丢失
+                        done.write(prompt_id + "\n")
+                        done.flush()
+                    finished = len(self.latencies) + self.failed
+                    if finished % 50 == 0:
+                        print(f"已完成 {finished}/{len(prompts)}", file=sys.stderr)
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    def report(self, total: int, skipped: int, elapsed: float) -> str:
+        latencies = self.latencies
+        succeeded = len(latencies)
+        lines = [
+            f"提示词 {total} 条：成功 {succeeded}，失败 {self.failed}，跳过（已完成）{skipped}",
+            f"耗时 {elapsed:.1f}s，吞吐 {(succeeded + self.failed) / elapsed if elapsed else 0:.2f} 条/s",
+        ]
+        if latencies:
+            lines.append(
+                "延迟 ms: "
+                f"平均 {sum(latencies) / succeeded:.0f}  "
+                f"p50 {percentile(latencies, 0.5):.0f}  "
+                f"p90 {percentile(latencies, 0.9):.0f}  "
+                f"p99 {percentile(latencies, 0.99):.0f}  "
+                f"最大 {max(latencies):.0f}"
+            )
+        return "\n".join(lines)
+
+
+async def run_batch(args: argparse.Namespace) -> None:
+    # 导入应用模块会初始化配置和日志，放在参数解析之后
+    from app.core.langgraph.graph import agent
+    from app.core.langgraph.tool_registry import tool_registry
+    from app.services.calculator import calculator
+    from app.services.llm import llm_service
+
+    checkpoint = args.checkpoint or args.output.with_name(args.output.name + ".done")
+    completed = load_completed(checkpoint)
+    prompts, skipped = read_prompts(args.input, completed)
+    if args.limit is not None:
+        prompts = prompts[: args.limit]
+
+    runner = BatchRunner(args.output, checkpoint, args.concurrency, args.ephemeral)
+    llm_service.start()
+    calculator.start()
+    start = time.perf_counter()
+    try:
+        await runner.run(agent, prompts)
+    finally:
+        elapsed = time.perf_counter() - start
+        await agent.close()
+        await llm_service.stop()
+        await tool_registry.aclose()
+        calculator.close()
+        print(runner.report(len(prompts) + skipped, skipped, elapsed), file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    asyncio.run(run_batch(args))
 
 
 if __name__ == "__main__":
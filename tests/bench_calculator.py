@@ -0,0 +1,203 @@
+"""计算工具的模糊测试与基准测试
+
+1. 病态表达式：每个都必须在超时内返回（结果或 CalculatorError），且事件循环不被阻塞
+2. 随机表达式模糊测试：与 Python eval 的结果对比（eval 只在安全范围内运行）
+3. 精度模式：乘方、除零、超出浮点范围的字面量在 float / decimal / fraction 下给出结果或相同的错误
+4. 吞吐：首次求值与命中缓存的耗时
+
+运行: python -m tests.bench_calculator [随机表达式数量]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+from app.services.calculator import (
+    CalculatorError,
+    CalculatorLimits,
+    CalculatorService,
+    evaluate,
+)
+
+PATHOLOGICAL = [
+    "9**9**9",
+    "9^9^9",
+    "10**10**10",
+    "(2**64)**(2**64)",
+    "2**1000000",
+    "7**99999999",
+    "-(2**100000)",
+    "99999999999999999999**999",
+    "(10**999)*(10**999)",
+    "1" * 5000,
+    "(" * 300 + "1" + ")" * 300,
+    "+".join(["1"] * 200),
+    "-" * 200 + "1",
+    "1e308*10",
+    "2.0**5000",
+    "1/0",
+    "10 % 0",
+    "(-8)**0.5",
+    "__import__('os').system('true')",
+    "[1]*10**9",
+    "'a'*10**9",
+    "(lambda: 1)()",
+    "1 if 1 else 2",
+    "1 < 2",
+    "~1",
+    "1 << 100000",
+    "",
+]
+
+OPERATORS = ["+", "-", "*", "/", "//", "%", "**"]
+
+
+def random_expression(rng: random.Random, depth: int = 0) -> str:
+    if depth > 3 or rng.random() < 0.3:
+        number = rng.choice([
+            str(rng.randint(0, 1000)),
+            f"{rng.uniform(0, 100):.3f}",
+            str(rng.randint(0, 10 ** rng.randint(1, 30))),
+        ])
+        return number if rng.random() < 0.8 else f"-{number}"
+    op = rng.choice(OPERATORS)
+    left = random_expression(rng, depth + 1)
+    right = random_expression(rng, depth + 1)
+    if op == "**":
+        right = str(rng.randint(-3, 12)) if rng.random() < 0.9 else right
+    return f"({left} {op} {right})"
+
+
+def reference(expression: str):
+    """只在不会爆炸的情况下用 eval 计算参考值"""
+    if "**" in expression and len(expression) > 120:
+        return None
+    try:
+        return eval(expression, {"__builtins__": {}})
+    except Exception:
+        return None
+
+
+async def measure_lag(stop: asyncio.Event) -> float:
+    """事件循环最大停顿（秒）"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.005)
+        worst = max(worst, time.perf_counter() - start - 0.005)
+    return worst
+
+
+async def pathological(service: CalculatorService) -> None:
+    print("== 病态表达式 ==")
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_lag(stop))
+    for expression in PATHOLOGICAL:
+        start = time.perf_counter()
+        try:
+            result = await service.calculate(expression)
+            outcome = f"= {result[:40]}"
+        except CalculatorError as e:
+            outcome = f"拒绝: {e}"
+        elapsed = (time.perf_counter() - start) * 1000
+        assert elapsed < service.timeout * 1000 + 500, expression
+        print(f"  {expression[:32]:<34} {elapsed:>7.1f} ms  {outcome}")
+    stop.set()
+    lag = await lag_task
+    print(f"事件循环最大停顿 {lag * 1000:.1f} ms，超时 {service.timeouts} 次")
+
+
+def fuzz(count: int) -> None:
+    print(f"== 模糊测试 {count} 个随机表达式 ==")
+    rng = random.Random(42)
+    limits = CalculatorLimits()
+    compared = rejected = mismatched = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        expression = random_expression(rng)
+        try:
+            result = evaluate(expression, limits=limits)
+        except CalculatorError:
+            rejected += 1
+            continue
+        expected = reference(expression)
+        if expected is None or isinstance(expected, complex):
+            continue
+        compared += 1
+        if str(expected) != result:
+            mismatched += 1
+            print(f"  不一致: {expression} -> {result} (eval: {expected})")
+    elapsed = time.perf_counter() - start
+    print(f"  对比 {compared} 个，拒绝 {rejected} 个，不一致 {mismatched} 个，{elapsed:.2f}s")
+    assert mismatched == 0
+
+    for mode in ("decimal", "fraction"):
+        print(f"  {mode}: 0.1 + 0.2 = {evaluate('0.1 + 0.2', mode=mode)}, 1/3 = {evaluate('1/3', mode=mode)}")
+
+
+# (表达式, 各模式的预期：数值前缀或错误信息)
+MODE_CASES = [
+    ("2**0.5", {"float": "1.41421356", "decimal": "1.41421356", "fraction": "1.41421356"}),
+    ("(-8)**(1/3)", "结果不是实数"),
+    ("(-1)**0.5", "结果不是实数"),
+    ("0**-1", "除数不能为零"),
+    ("0.0**-2", "除数不能为零"),
+    ("(-2)**-3", {"float": "-0.125", "decimal": "-0.125", "fraction": "-1/8"}),
+    ("10**(10**20)", "指数过大"),
+    ("7%0", "除数不能为零"),
+    ("7.5%0.0", "除数不能为零"),
+    ("0/0", "除数不能为零"),
+    ("1e400", "结果溢出"),
+    ("-1e400 + 1", "结果溢出"),
+]
+
+
+def mode_cases() -> None:
+    print("== 精度模式下的边界情况 ==")
+    for expression, expected in MODE_CASES:
+        for mode in ("float", "decimal", "fraction"):
+            try:
+                outcome = evaluate(expression, mode=mode)
+            except CalculatorError as e:
+                outcome = str(e)
+            want = expected[mode] if isinstance(expected, dict) else expected
+            assert outcome.startswith(want), (expression, mode, outcome)
+        print(f"  {expression:<14} {want if not isinstance(expected, dict) else '各模式结果一致'}")
+
+
+async def throughput(service: CalculatorService) -> None:
+    print("== 吞吐 ==")
+    expressions = [f"({i} + 17) * 3 / 7" for i in range(500)]
+    start = time.perf_counter()
+    await asyncio.gather(*(service.calculate(e) for e in expressions))
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    await asyncio.gather(*(service.calculate(e) for e in expressions))
+    warm = time.perf_counter() - start
+    print(f"  首次 {len(expressions) / cold:>9.0f} 次/s   缓存命中 {len(expressions) / warm:>9.0f} 次/s")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    # 几乎不限制位数，只靠硬超时兜底：验证超时后进程池被终止并恢复
+    service = CalculatorService(timeout=0.5, limits=CalculatorLimits(max_digits=10 ** 9, max_exponent=10 ** 9))
+    service.start()
+    await service.calculate("1 + 1")
+    await pathological(service)
+    print()
+    # 默认限制
+    service = CalculatorService()
+    service.start()
+    await service.calculate("1 + 1")
+    await pathological(service)
+    print()
+    fuzz(count)
+    print()
+    mode_cases()
+    print()
+    await throughput(CalculatorService())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
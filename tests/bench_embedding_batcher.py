@@ -0,0 +1,97 @@
+"""嵌入微批基准测试
+
+启动一个模拟 Ollama /api/embed 的本地服务（同一模型的请求串行处理，
+每个请求有固定开销 + 每条文本的计算开销），对比逐条请求与微批请求的吞吐。
+
+运行: python -m tests.bench_embedding_batcher
+"""
+
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+from app.services.embedding import EmbeddingBatcher
+
+HOST = "127.0.0.1"
+PORT = 18434
+BASE_URL = f"http://{HOST}:{PORT}"
+
+# 模拟的模型开销（秒）
+REQUEST_OVERHEAD = 0.008
+PER_TEXT_COST = 0.0005
+DIMS = 768
+
+TOTAL_TEXTS = 1000
+CONCURRENCY = 64
+
+fake_app = FastAPI()
+model_lock = asyncio.Lock()
+stats = {"requests": 0}
+
+
+@fake_app.post("/api/embed")
+async def embed(payload: dict):
+    texts = payload["input"]
+    if isinstance(texts, str):
+        texts = [texts]
+    stats["requests"] += 1
+    # Ollama 对同一模型的请求串行调度
+    async with model_lock:
+        await asyncio.sleep(REQUEST_OVERHEAD + PER_TEXT_COST * len(texts))
+    return {
+        "model": payload["model"],
+        "embeddings": [[random.random() for _ in range(DIMS)] for _ in texts],
+    }
+
+
+async def run(name: str, embed_one) -> None:
+    texts = [f"用户记忆片段 {i}" for i in range(TOTAL_TEXTS)]
+    queue = asyncio.Queue()
+    for text in texts:
+        queue.put_nowait(text)
+
+    async def worker():
+        while not queue.empty():
+            await embed_one(queue.get_nowait())
+
+    stats["requests"] = 0
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:<10} {TOTAL_TEXTS / elapsed:>10.1f} embeddings/s  "
+        f"{stats['requests']:>5} HTTP 请求  {elapsed:.2f}s"
+    )
+
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = uvicorn.Server(uvicorn.Config(fake_app, host=HOST, port=PORT, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def single(text):
+            response = await client.post(
+                f"{BASE_URL}/api/embed", json={"model": "nomic-embed-text", "input": text}
+            )
+            return response.json()["embeddings"][0]
+
+        await run("逐条请求", single)
+
+        batcher = EmbeddingBatcher(BASE_URL, "nomic-embed-text", max_batch_size=32, max_wait_ms=5)
+        await run("微批请求", batcher.embed)
+        await batcher.aclose()
+
+    server.should_exit = True
+    await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+"""对话导出内存基准测试
+
+需要配置好的 Postgres。创建一个临时用户和 N 个会话（每个会话 MESSAGES_PER_SESSION 条消息，
+直接写检查点，不调用 LLM），然后在独立的子进程中导出到 /dev/null，比较峰值 RSS：
+  - baseline：只导入 agent 并建立连接
+  - stream：ConversationExporter 流式导出
+  - materialized：逐个会话调用 get_history_rows，全部放进一个列表后再序列化（旧做法）
+
+运行: python -m tests.bench_export [会话数]
+"""
+
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+import orjson
+from langchain_core.messages import AIMessage, HumanMessage
+from sqlmodel import delete
+
+MESSAGES_PER_SESSION = 20
+CONCURRENCY = 8
+
+
+async def setup(sessions: int) -> str:
+    from app.core.langgraph.graph import agent
+    from app.services.database import db
+
+    user = db.create_user(f"bench-{uuid.uuid4().hex[:8]}@example.com", "x")
+    graph = await agent.create_graph()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def create(i: int) -> None:
+        session_id = str(uuid.uuid4())
+        db.create_chat_session(user.id, session_id, title=f"会话 {i}")
+        messages = []
+        for j in range(MESSAGES_PER_SESSION // 2):
+            messages.append(HumanMessage(content=f"第 {j} 个问题：帮我解释一下 Python 的异步编程是怎么工作的？"))
+            messages.append(AIMessage(content="异步编程通过事件循环调度协程，在等待 IO 时切换到其他任务。" * 4))
+        async with semaphore:
+            await graph.aupdate_state(
+                {"configurable": {"thread_id": session_id}}, {"messages": messages}, as_node="chat"
+            )
+
+    start = time.perf_counter()
+    await asyncio.gather(*(create(i) for i in range(sessions)))
+    print(f"写入 {sessions} 个会话：{time.perf_counter() - start:.1f}s")
+    await agent.close()
+    return str(user.id)
+
+
+async def child(mode: str, user_id: str) -> None:
+    from app.core.langgraph.graph import agent
+    from app.services.database import db
+
+    start = time.perf_counter()
+    lines = 0
+    with open("/dev/null", "wb") as out:
+        if mode == "baseline":
+            await agent.create_graph()
+        elif mode == "stream":
+            async for line in agent.exporter.export(user_id, include_memories=True):
+                out.write(line)
+                lines += 1
+        else:
+            sessions = db.get_user_sessions(uuid.UUID(user_id))
+            export = [
+                {"id": str(s.id), "title": s.title, "messages": await agent.get_history_rows(str(s.id))}
+                for s in sessions
+            ]
+            out.write(orjson.dumps(export))
+            lines = len(export)
+    await agent.close()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(orjson.dumps({"lines": lines, "peak_mb": peak_mb, "seconds": time.perf_counter() - start}).decode())
+
+
+def measure(mode: str, user_id: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "tests.bench_export", "--child", mode, user_id],
+        capture_output=True, text=True, check=True,
+    )
+    return orjson.loads(result.stdout.strip().splitlines()[-1])
+
+
+def cleanup(user_id: str) -> None:
+    from app.core.langgraph.graph import agent
+    from app.models.user import User
+    from app.services.database import db
+
+    async def purge():
+        await agent.purger.purge_in_chunks(user_id)
+        await agent.close()
+
+    asyncio.run(purge())
+    with db.get_session() as session:
+        session.exec(delete(User).where(User.id == uuid.UUID(user_id)))
+        session.commit()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        asyncio.run(child(sys.argv[2], sys.argv[3]))
+        return
+
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    user_id = asyncio.run(setup(sessions))
+    try:
+        for mode in ("baseline", "stream", "materialized"):
+            result = measure(mode, user_id)
+            print(f"  {mode}: 峰值 RSS {result['peak_mb']:.0f} MB，{result['lines']} 行，{result['seconds']:.1f}s")
+    finally:
+        cleanup(user_id)
+
+
+if __name__ == "__main__":
+    main()
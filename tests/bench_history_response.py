@@ -0,0 +1,125 @@
+"""历史接口序列化基准测试
+
+对 1000 条消息的会话历史，对比两条序列化路径（不连数据库，直接从检查点里的消息对象开始）：
+
+- 旧路径：BaseMessage → Message 对象 → model_dump → HistoryResponse → FastAPI response_model 校验与序列化
+- 新路径：BaseMessage → dict → orjson bytes（可选 gzip / brotli）
+
+并通过 TestClient 端到端请求两个等价的接口，统计每秒请求数与响应大小。
+
+运行: python -m tests.bench_history_response [消息数]
+"""
+
+import sys
+import time
+
+import orjson
+from fastapi import FastAPI, Header
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.schemas import HistoryResponse, Message
+from app.utils.responses import FastJSONResponse, compress, json_bytes_response
+
+ROUNDS = 200
+
+
+def build_thread(count: int) -> list:
+    """构造一段会话：用户提问、偶尔的工具调用、助手回答"""
+    messages = []
+    for i in range(count):
+        if i % 2 == 0:
+            messages.append(HumanMessage(content=f"第 {i} 个问题：帮我解释一下 Python 的异步编程和事件循环是怎么工作的？"))
+        else:
+            if i % 10 == 1:
+                messages.append(ToolMessage(content="2026-10-19 12:00:00", name="get_current_time", tool_call_id=str(i)))
+            messages.append(AIMessage(content=f"回答 {i}：" + "异步编程通过事件循环调度协程，在等待 IO 时切换到其他任务。" * 4))
+    return messages
+
+
+def legacy_messages(thread: list) -> list:
+    """旧版 get_history"""
+    result = []
+    for msg in thread:
+        if isinstance(msg, HumanMessage):
+            result.append(Message(role="user", content=msg.content))
+        elif isinstance(msg, AIMessage) and msg.content:
+            result.append(Message(role="assistant", content=msg.content))
+    return result
+
+
+def fast_rows(thread: list) -> list:
+    """新版 get_history_rows"""
+    rows = []
+    for msg in thread:
+        if isinstance(msg, HumanMessage):
+            rows.append({"role": "user", "content": msg.content})
+        elif isinstance(msg, AIMessage) and msg.content:
+            rows.append({"role": "assistant", "content": msg.content})
+    return rows
+
+
+def build_app(thread: list) -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+    @app.get("/legacy", response_model=HistoryResponse, response_class=JSONResponse)
+    async def legacy():
+        messages = legacy_messages(thread)
+        return HistoryResponse(session_id="s", messages=[m.model_dump() for m in messages])
+
+    @app.get("/fast", response_model=HistoryResponse)
+    async def fast(accept_encoding: str = Header(None)):
+        body = orjson.dumps({"session_id": "s", "messages": fast_rows(thread)})
+        return json_bytes_response(body, accept_encoding)
+
+    return app
+
+
+def timed(func, rounds: int = ROUNDS) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    thread = build_thread(count)
+    print(f"== 序列化 {count} 条消息（每次 ms，{ROUNDS} 次平均）==")
+
+    def legacy_pipeline():
+        # 接口返回 HistoryResponse 后，FastAPI 按 response_model 再校验一次并用标准库 json 序列化
+        response = HistoryResponse(session_id="s", messages=[m.model_dump() for m in legacy_messages(thread)])
+        return JSONResponse(HistoryResponse.model_validate(response).model_dump(mode="json"))
+
+    legacy_ms = timed(legacy_pipeline)
+    fast_ms = timed(lambda: orjson.dumps({"session_id": "s", "messages": fast_rows(thread)}))
+    body = orjson.dumps({"session_id": "s", "messages": fast_rows(thread)})
+    print(f"  旧路径 {legacy_ms:>7.2f}")
+    print(f"  新路径 {fast_ms:>7.2f}")
+    for encoding in ("gzip", "br"):
+        compressed, used = compress(body, encoding)
+        if used is None:
+            print(f"  {encoding:<5} 不可用（未安装或已关闭）")
+            continue
+        ms = timed(lambda encoding=encoding: compress(body, encoding), rounds=50)
+        print(f"  {encoding:<5} 压缩 {ms:>7.2f} ms   {len(body) / 1024:.0f} KB → {len(compressed) / 1024:.0f} KB")
+
+    print("== 端到端（TestClient）==")
+    client = TestClient(build_app(thread))
+    assert client.get("/legacy").json() == client.get("/fast").json()
+    for path, headers in (
+        ("/legacy", {"Accept-Encoding": "identity"}),
+        ("/fast", {"Accept-Encoding": "identity"}),
+        ("/fast", {"Accept-Encoding": "gzip"}),
+    ):
+        response = client.get(path, headers=headers)
+        # TestClient 会自动解压，按服务端实际发送的字节计算大小
+        size = int(response.headers.get("content-length", len(response.content)))
+        ms = timed(lambda path=path, headers=headers: client.get(path, headers=headers), rounds=100)
+        print(f"  {path:<8} {headers['Accept-Encoding']:<9} {1000 / ms:>7.0f} 次/s   {ms:>6.2f} ms   {size / 1024:>5.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
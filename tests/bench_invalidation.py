@@ -0,0 +1,99 @@
+"""跨 worker 缓存失效传播延迟基准测试
+
+需要配置好的 Postgres。启动 N 个监听进程（模拟 uvicorn worker），各自持有一个 InvalidationBus
+和一个缓存；主进程持续发布 M 个失效事件，统计：
+  - 发布延迟（publish 中 pg_notify + commit 的耗时）
+  - 传播延迟（发布到其他进程中对应缓存条目被删除，同一主机，无时钟偏差）
+  - 每个监听进程收到的事件数（应等于 M）
+
+运行: python -m tests.bench_invalidation [进程数] [事件数]
+"""
+
+import asyncio
+import multiprocessing
+import statistics
+import sys
+import time
+
+from app.services.database import db
+from app.services.invalidation import InvalidationBus
+
+CHANNEL = "bench_invalidation"
+# 发布间隔：避免把 NOTIFY 队列打满，测的是延迟而不是吞吐
+PUBLISH_INTERVAL = 0.005
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def listener(events: int, ready, results) -> None:
+    # 不复用父进程的连接
+    db.engine.dispose(close=False)
+
+    async def run():
+        bus = InvalidationBus(channel=CHANNEL)
+        cache = bus.cache("bench", max_size=events * 2)
+        bus.start()
+        while not bus.listening:
+            await asyncio.sleep(0.05)
+        # 连上之后才填充缓存（连接时会清空）
+        for i in range(events):
+            cache.set(str(i), i)
+        ready.release()
+
+        deadline = time.monotonic() + 30 + events * PUBLISH_INTERVAL * 2
+        while bus.received < events and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await bus.stop()
+        results.append({"received": bus.received, "left": len(cache), "lags": list(bus.lags_ms)})
+
+    asyncio.run(run())
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    publisher = InvalidationBus(channel=CHANNEL)
+
+    with multiprocessing.Manager() as manager:
+        ready, results = manager.Semaphore(0), manager.list()
+        procs = [
+            multiprocessing.Process(target=listener, args=(events, ready, results))
+            for _ in range(processes)
+        ]
+        for proc in procs:
+            proc.start()
+        for _ in procs:
+            ready.acquire()
+
+        publish_ms = []
+        for i in range(events):
+            start = time.perf_counter()
+            publisher.publish("bench", str(i))
+            publish_ms.append((time.perf_counter() - start) * 1000)
+            time.sleep(PUBLISH_INTERVAL)
+        for proc in procs:
+            proc.join()
+        results = list(results)
+
+    lags = [lag for result in results for lag in result["lags"]]
+    print(f"{processes} 个监听进程，{events} 个事件")
+    print(
+        f"  发布延迟: p50 {statistics.median(publish_ms):.2f} ms，"
+        f"p99 {percentile(publish_ms, 0.99):.2f} ms"
+    )
+    if lags:
+        print(
+            f"  传播延迟: p50 {statistics.median(lags):.2f} ms，"
+            f"p99 {percentile(lags, 0.99):.2f} ms，最大 {max(lags):.2f} ms"
+        )
+    print(
+        f"  收到事件: {[result['received'] for result in results]}，"
+        f"未失效的缓存条目: {[result['left'] for result in results]}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""日志管线基准测试
+
+在独立子进程中分别以 console / json / 异步队列三种模式记录相同的日志，
+对比每次 logger 调用在调用线程（即事件循环）上的耗时，并展示采样与队列满时的丢弃计数。
+
+运行: python -m tests.bench_logging
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+CALLS = 20000
+
+CHILD = f"""
+import sys, time
+from app.core.logging import logger, log_writer, get_log_stats
+
+start = time.perf_counter()
+for i in range({CALLS}):
+    logger.info("chat_message_sent", session_id="s1", user_id=1, i=i)
+    logger.debug("chat_node_completed", has_tool_calls=False)
+elapsed = time.perf_counter() - start
+print(f"{{elapsed / {CALLS * 2} * 1e6:.1f}}", file=sys.stderr)
+if log_writer is not None:
+    log_writer.close()
+    print(get_log_stats(), file=sys.stderr)
+"""
+
+MODES = {
+    "console": {"LOG_FORMAT": "console"},
+    "json": {"LOG_FORMAT": "json"},
+    "queue": {"LOG_ASYNC": "true", "LOG_SAMPLE_RATES": "chat_node_completed=0.01"},
+    "queue(满)": {"LOG_ASYNC": "true", "LOG_QUEUE_SIZE": "100"},
+}
+
+
+def main():
+    for name, env in MODES.items():
+        with tempfile.TemporaryDirectory() as log_dir:
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD],
+                env={**os.environ, "LOG_DIR": log_dir, "LOG_LEVEL": "DEBUG", **env},
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True,
+                check=True,
+            )
+            lines = result.stderr.strip().splitlines()
+            stats = lines[1] if len(lines) > 1 else ""
+            print(f"{name:<10} {lines[0]:>6} us/次  {stats}")
+
+
+if __name__ == "__main__":
+    main()
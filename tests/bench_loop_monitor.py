@@ -0,0 +1,92 @@
+"""事件循环监控基准测试（不连数据库）
+
+1. 空闲开销：事件循环上跑大量短协程（模拟流式输出的小片段），对比开启 / 关闭 LoopMonitor 的吞吐
+2. 阻塞检测：在事件循环中同步 sleep（模拟同步数据库调用、bcrypt），检查是否记录了 event_loop_blocked 与调用栈
+3. 采样分析：采样期间事件循环反复执行一个 CPU 密集函数，检查 collapsed 输出中该函数的占比
+
+运行: python -m tests.bench_loop_monitor
+"""
+
+import asyncio
+import hashlib
+import threading
+import time
+
+from app.core.loop_monitor import LoopMonitor, SamplingProfiler
+
+TASKS = 200_000
+ROUNDS = 3
+
+
+async def churn() -> float:
+    """TASKS 次 sleep(0) 切换的耗时"""
+    start = time.perf_counter()
+    for _ in range(TASKS):
+        await asyncio.sleep(0)
+    return time.perf_counter() - start
+
+
+async def bench_overhead() -> None:
+    results = {}
+    for label, enabled in (("关闭", False), ("开启", True)):
+        monitor = LoopMonitor(interval=0.1, threshold=0.2, enabled=enabled)
+        monitor.start()
+        best = min([await churn() for _ in range(ROUNDS)])
+        await monitor.stop()
+        results[label] = best
+        print(f"  监控{label}: {TASKS / best / 1000:.0f}k 次切换/秒")
+    print(f"  开销: {(results['开启'] / results['关闭'] - 1) * 100:+.2f}%")
+
+
+def blocking_call(seconds: float) -> None:
+    """模拟阻塞事件循环的同步调用"""
+    time.sleep(seconds)
+
+
+async def bench_detection() -> None:
+    monitor = LoopMonitor(interval=0.05, threshold=0.1)
+    monitor.start()
+    await asyncio.sleep(0.2)
+    for seconds in (0.05, 0.3, 0.6):
+        blocking_call(seconds)
+        await asyncio.sleep(0.2)
+    await monitor.stop()
+    # 0.05s 的阻塞低于阈值，预期记录 2 次
+    print(f"  阻塞 0.05s / 0.3s / 0.6s：记录 {monitor.stalls} 次（预期 2），{monitor.stats()}")
+
+
+def hot_function() -> None:
+    data = b"x" * 4096
+    for _ in range(200):
+        data = hashlib.sha256(data).digest() * 128
+
+
+async def bench_profile() -> None:
+    profiler = SamplingProfiler()
+    loop_thread = threading.get_ident()
+    task = asyncio.create_task(asyncio.to_thread(profiler.profile, 2.0, 0.005, loop_thread))
+    while not task.done():
+        hot_function()
+        await asyncio.sleep(0)
+    collapsed = task.result()
+    total = hot = 0
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        total += int(count)
+        if "hot_function" in stack:
+            hot += int(count)
+    print(f"  采样 {total} 次，{len(collapsed.splitlines())} 个不同调用栈，hot_function 占 {hot / total:.0%}")
+    print("  最多的调用栈: " + collapsed.splitlines()[0][-120:])
+
+
+async def main():
+    print("空闲开销")
+    await bench_overhead()
+    print("阻塞检测")
+    await bench_detection()
+    print("采样分析")
+    await bench_profile()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
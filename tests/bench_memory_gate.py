@@ -0,0 +1,89 @@
+"""记忆提取过滤门回放测试
+
+回放一份对话日志，统计 off / gate / batch 三种模式下 mem0 提取（LLM 调用）的次数。
+
+运行:
+    python -m tests.bench_memory_gate                 # 使用内置样例
+    python -m tests.bench_memory_gate turns.jsonl     # 每行 {"session_id", "user", "assistant"}
+"""
+
+import asyncio
+import json
+import sys
+from collections import Counter
+
+from app.core.langgraph.memory_gate import MemoryGate
+
+SAMPLE_LOG = [
+    ("s1", "你好", "你好！有什么可以帮你？"),
+    ("s1", "我叫李雷，是一名后端工程师", "你好李雷，很高兴认识你。"),
+    ("s1", "现在几点了", "现在是 2025年01月01日 10:00:00"),
+    ("s1", "谢谢", "不客气！"),
+    ("s2", "123 * 456", "123 * 456 = 56088"),
+    ("s2", "(3 + 5) / 2", "(3 + 5) / 2 = 4.0"),
+    ("s2", "好的", "还有其他问题吗？"),
+    ("s3", "帮我写一首关于秋天的诗", "秋风起，落叶黄……"),
+    ("s3", "我喜欢更短一点的，五言绝句吧", "好的：秋山落日红……"),
+    ("s3", "嗯嗯", "还需要修改吗？"),
+    ("s3", "不用了，拜拜", "再见！"),
+    ("s4", "我住在杭州，最近打算周末去爬山", "杭州附近可以去北高峰。"),
+    ("s4", "北高峰要走多久？", "大约一个半小时。"),
+    ("s4", "记住我膝盖不太好", "好的，我记住了。"),
+    ("s4", "ok", "祝你玩得开心！"),
+    ("s5", "Python 里 list 和 tuple 有什么区别？", "list 可变，tuple 不可变……"),
+    ("s5", "那 set 呢？", "set 是无序且元素唯一的集合……"),
+    ("s5", "帮我计算一下 2 的 10 次方", "2 ** 10 = 1024"),
+    ("s5", "多谢", "不客气。"),
+    ("s6", "我女儿今年上小学一年级", "恭喜！"),
+    ("s6", "有什么适合她的课外书？", "推荐《小猪唏哩呼噜》……"),
+    ("s6", "我平时习惯晚上十点后才有空陪她读书", "可以安排睡前阅读二十分钟。"),
+    ("s6", "晚安", "晚安！"),
+    ("s7", "hi", "Hello!"),
+    ("s7", "what time is it", "It is 10:00."),
+    ("s7", "thanks", "You're welcome."),
+]
+
+
+def load_log(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                yield item["session_id"], item["user"], item["assistant"]
+
+
+async def replay(mode: str, turns) -> tuple[int, Counter]:
+    calls = 0
+
+    async def extractor(user_id, messages):
+        nonlocal calls
+        calls += 1
+
+    gate = MemoryGate(extractor, mode=mode, batch_idle_seconds=3600)
+    reasons = Counter()
+    for session_id, user, assistant in turns:
+        if mode != "off":
+            reasons[gate.classify(user, assistant).reason] += 1
+        await gate.submit(
+            "u1",
+            session_id,
+            [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}],
+        )
+    await gate.flush_all()
+    return calls, reasons
+
+
+async def main():
+    turns = list(load_log(sys.argv[1])) if len(sys.argv) > 1 else SAMPLE_LOG
+    baseline, _ = await replay("off", turns)
+    print(f"回放轮次: {len(turns)}")
+    print(f"{'off':<6} 提取调用 {baseline:>5}")
+    for mode in ("gate", "batch"):
+        calls, reasons = await replay(mode, turns)
+        reduction = 1 - calls / baseline if baseline else 0
+        print(f"{mode:<6} 提取调用 {calls:>5}  减少 {reduction:.0%}")
+    print("过滤原因分布:", dict(reasons))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""长期记忆检索延迟基准测试
+
+在配置的 Postgres（需要 pgvector 扩展）中创建临时集合，写入 N 行随机向量
+（每个用户约 100 条记忆），对比以下情况下按 user_id 过滤的 top-k 检索延迟：
+  - 无索引
+  - user_id 表达式索引
+  - user_id 索引 + HNSW 向量索引（使用 MemoryIndexManager 的配置）
+
+运行: python -m tests.bench_memory_search 10000 100000 1000000
+"""
+
+import random
+import statistics
+import sys
+import time
+import uuid
+
+import psycopg
+from psycopg import sql
+
+from app.core.config import settings
+
+DIMS = 768
+MEMORIES_PER_USER = 100
+QUERIES = 200
+TOP_K = settings.MEMORY_SEARCH_TOP_K
+
+
+def random_vector() -> str:
+    return "[" + ",".join(f"{random.random():.4f}" for _ in range(DIMS)) + "]"
+
+
+def populate(conn: psycopg.Connection, table: sql.Identifier, rows: int) -> list[str]:
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+    conn.execute(
+        sql.SQL("CREATE TABLE {} (id UUID PRIMARY KEY, vector vector({}), payload JSONB)").format(
+            table, sql.Literal(DIMS)
+        )
+    )
+    users = [str(uuid.uuid4()) for _ in range(max(1, rows // MEMORIES_PER_USER))]
+    with conn.cursor() as cur:
+        with cur.copy(sql.SQL("COPY {} (id, vector, payload) FROM STDIN").format(table)) as copy:
+            for i in range(rows):
+                payload = f'{{"user_id": "{users[i % len(users)]}", "data": "memory {i}"}}'
+                copy.write_row((uuid.uuid4(), random_vector(), payload))
+    conn.execute(sql.SQL("ANALYZE {}").format(table))
+    return users
+
+
+def measure(conn: psycopg.Connection, table: sql.Identifier, users: list[str]) -> tuple[float, float]:
+    query = sql.SQL("""
+        SELECT id, vector <=> %s::vector AS distance
+        FROM {} WHERE payload->>'user_id' = %s
+        ORDER BY distance LIMIT %s
+    """).format(table)
+    latencies = []
+    for _ in range(QUERIES):
+        start = time.perf_counter()
+        conn.execute(query, (random_vector(), random.choice(users), TOP_K)).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    with psycopg.connect(settings.database_url, autocommit=True) as conn:
+        conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        conn.execute(f"SET hnsw.ef_search = {settings.MEMORY_HNSW_EF_SEARCH}")
+        if settings.MEMORY_HNSW_ITERATIVE_SCAN:
+            conn.execute(
+                sql.SQL("SET hnsw.iterative_scan = {}").format(
+                    sql.Literal(settings.MEMORY_HNSW_ITERATIVE_SCAN)
+                )
+            )
+
+        for rows in sizes:
+            table = sql.Identifier(f"bench_memory_{rows}")
+            print(f"写入 {rows} 行 ...", flush=True)
+            users = populate(conn, table, rows)
+
+            p50, p95 = measure(conn, table, users)
+            print(f"{rows:>9} 无索引           p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+
+            conn.execute(
+                sql.SQL("CREATE INDEX ON {} ((payload->>'user_id'))").format(table)
+            )
+            p50, p95 = measure(conn, table, users)
+            print(f"{rows:>9} user_id 索引     p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+
+            conn.execute(
+                sql.SQL(
+                    "CREATE INDEX ON {} USING hnsw (vector vector_cosine_ops) "
+                    "WITH (m = {}, ef_construction = {})"
+                ).format(
+                    table,
+                    sql.Literal(settings.MEMORY_HNSW_M),
+                    sql.Literal(settings.MEMORY_HNSW_EF_CONSTRUCTION),
+                )
+            )
+            conn.execute(sql.SQL("ANALYZE {}").format(table))
+            p50, p95 = measure(conn, table, users)
+            print(f"{rows:>9} user_id + HNSW   p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+
+            conn.execute(sql.SQL("DROP TABLE {}").format(table))
+
+
+if __name__ == "__main__":
+    main()
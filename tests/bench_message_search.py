@@ -0,0 +1,112 @@
+"""消息检索延迟基准测试
+
+在配置的 Postgres（需要 pg_trgm 扩展，数据库 LC_CTYPE 为 UTF-8）中创建临时表，
+写入 N 条中文消息（每个用户约 MESSAGES_PER_USER 条），用 MessageIndexer 的检索 SQL 对比：
+  - 仅 (user_id) 索引：扫描该用户的全部消息做 ILIKE
+  - (user_id) 索引 + content 上的 pg_trgm GIN 索引
+
+关键词分三类：常见词（命中多）、罕见词（命中少）、两字词（无法使用三元组索引）。
+
+运行: python -m tests.bench_message_search 100000 1000000
+"""
+
+import random
+import statistics
+import sys
+import time
+import uuid
+
+import psycopg
+from psycopg import sql
+
+from app.core.config import settings
+from app.core.langgraph.message_index import SEARCH_SQL, SNIPPET_BEFORE, SNIPPET_LENGTH, _like_pattern
+
+MESSAGES_PER_USER = 2000
+QUERIES = 200
+LIMIT = 20
+
+COMMON = ["异步编程", "数据库", "机器学习", "事件循环", "天气预报", "旅行计划", "学习计划", "健康饮食"]
+RARE = ["量子退火", "敦煌壁画", "拓扑绝缘体", "古典吉他", "火山地貌", "围棋定式"]
+SHORT = ["天气", "学习"]
+FILLER = "请帮我详细解释一下相关的概念、常见问题以及实际使用中需要注意的地方，最好能给出例子。"
+
+
+def random_message(i: int) -> str:
+    words = random.sample(COMMON, 2)
+    if i % 500 == 0:
+        words.append(random.choice(RARE))
+    return f"第 {i} 条：关于{'、'.join(words)}，{FILLER}"
+
+
+def populate(conn: psycopg.Connection, table: sql.Identifier, rows: int) -> list[str]:
+    conn.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(table))
+    conn.execute(
+        sql.SQL("""
+            CREATE TABLE {} (
+                id UUID PRIMARY KEY, user_id UUID NOT NULL, session_id VARCHAR(64) NOT NULL,
+                seq INTEGER NOT NULL, role VARCHAR(16) NOT NULL, content TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """).format(table)
+    )
+    users = [str(uuid.uuid4()) for _ in range(max(1, rows // MESSAGES_PER_USER))]
+    with conn.cursor() as cur:
+        with cur.copy(
+            sql.SQL("COPY {} (id, user_id, session_id, seq, role, content) FROM STDIN").format(table)
+        ) as copy:
+            for i in range(rows):
+                user = users[i % len(users)]
+                copy.write_row((
+                    uuid.uuid4(), user, f"{user[:8]}-{i // 20 % 100}", i,
+                    "user" if i % 2 == 0 else "assistant", random_message(i),
+                ))
+    conn.execute(sql.SQL("CREATE INDEX ON {} (user_id)").format(table))
+    conn.execute(sql.SQL("ANALYZE {}").format(table))
+    return users
+
+
+def measure(conn: psycopg.Connection, table: str, users: list[str], words: list[str]) -> tuple[float, float]:
+    query = SEARCH_SQL.replace("FROM message_index", f"FROM {table}")
+    latencies = []
+    for _ in range(QUERIES):
+        word = random.choice(words)
+        params = {
+            "q": word, "pattern": _like_pattern(word), "user_id": random.choice(users),
+            "before": SNIPPET_BEFORE, "length": SNIPPET_LENGTH, "limit": LIMIT + 1, "offset": 0,
+        }
+        start = time.perf_counter()
+        conn.execute(query, params).fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]
+    with psycopg.connect(settings.database_url, autocommit=True) as conn:
+        conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+        for rows in sizes:
+            name = f"bench_message_index_{rows}"
+            table = sql.Identifier(name)
+            print(f"写入 {rows} 行 ...", flush=True)
+            users = populate(conn, table, rows)
+
+            for label in ("仅 user_id 索引", "+ pg_trgm GIN"):
+                if label.startswith("+"):
+                    start = time.perf_counter()
+                    conn.execute(
+                        sql.SQL("CREATE INDEX ON {} USING gin (content gin_trgm_ops)").format(table)
+                    )
+                    conn.execute(sql.SQL("ANALYZE {}").format(table))
+                    print(f"  建 GIN 索引 {time.perf_counter() - start:.1f}s")
+                for kind, words in (("常见词", COMMON), ("罕见词", RARE), ("两字词", SHORT)):
+                    p50, p95 = measure(conn, name, users, words)
+                    print(f"  {label:<16} {kind}  p50 {p50:>7.2f} ms  p95 {p95:>7.2f} ms")
+
+            conn.execute(sql.SQL("DROP TABLE {}").format(table))
+
+
+if __name__ == "__main__":
+    main()
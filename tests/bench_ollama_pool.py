@@ -0,0 +1,150 @@
+"""多 Ollama 后端路由测试
+
+启动 3 个模拟 Ollama 的本地服务，验证：
+1. 同一会话的连续轮次落在同一个后端
+2. 某个后端下线后，只有它上面的会话被迁走；恢复后迁回
+3. 无会话 ID 的并发请求按进行中请求数均衡
+
+运行: python -m tests.bench_ollama_pool
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import HumanMessage
+
+from app.services.llm import LLMService
+from app.services.ollama_pool import OllamaBackendPool
+
+HOST = "127.0.0.1"
+PORTS = [18501, 18502, 18503]
+SESSIONS = 30
+TURNS = 5
+# 同时进行的会话数；过高时亲和后端会因进行中请求过多而溢出到其他后端
+CONCURRENT_SESSIONS = 6
+GENERATION_DELAY = 0.02
+
+
+def fake_ollama(name: str) -> FastAPI:
+    fake_app = FastAPI()
+
+    @fake_app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": "qwen:7b"}]}
+
+    @fake_app.post("/api/chat")
+    async def chat(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(GENERATION_DELAY)
+
+        def body():
+            yield json.dumps({
+                "model": payload["model"],
+                "created_at": "2025-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": name},
+                "done": False,
+            }) + "\n"
+            yield json.dumps({
+                "model": payload["model"],
+                "created_at": "2025-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": 10,
+                "eval_count": 1,
+            }) + "\n"
+
+        return StreamingResponse(body(), media_type="application/x-ndjson")
+
+    return fake_app
+
+
+async def start_server(port: int) -> tuple[uvicorn.Server, asyncio.Task]:
+    server = uvicorn.Server(uvicorn.Config(
+        fake_ollama(f"backend-{port}"), host=HOST, port=port, log_level="warning"
+    ))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def stop_server(server: uvicorn.Server, task: asyncio.Task) -> None:
+    server.should_exit = True
+    await task
+
+
+async def route_sessions(service: LLMService) -> dict:
+    """每个会话顺序跑 TURNS 轮，返回 会话 -> 后端集合"""
+    placement = {}
+    semaphore = asyncio.Semaphore(CONCURRENT_SESSIONS)
+
+    async def session(i: int):
+        thread_id = f"session-{i}"
+        served = set()
+        async with semaphore:
+            for _ in range(TURNS):
+                response = await service.call([HumanMessage(content="你好")], thread_id=thread_id)
+                served.add(response.content)
+        placement[thread_id] = served
+
+    await asyncio.gather(*(session(i) for i in range(SESSIONS)))
+    return placement
+
+
+def summarize(title: str, placement: dict) -> None:
+    sticky = sum(1 for served in placement.values() if len(served) == 1)
+    spread = Counter(next(iter(served)) for served in placement.values() if len(served) == 1)
+    print(f"{title}: {sticky}/{len(placement)} 个会话始终落在同一后端  分布 {dict(sorted(spread.items()))}")
+
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    servers = {port: await start_server(port) for port in PORTS}
+
+    service = LLMService()
+    service.pool = OllamaBackendPool([f"http://{HOST}:{port}" for port in PORTS])
+    service._llms.clear()
+
+    # 1. 会话粘性
+    before = await route_sessions(service)
+    summarize("全部在线", before)
+
+    # 2. 下线一个后端
+    down = f"backend-{PORTS[1]}"
+    await stop_server(*servers.pop(PORTS[1]))
+    await service.pool.check_health()
+    during = await route_sessions(service)
+    summarize(f"{down} 下线", during)
+    moved = [s for s in before if before[s] != during[s]]
+    wrongly_moved = [s for s in moved if before[s] != {down}]
+    print(f"  迁移会话 {len(moved)} 个，其中原本不在 {down} 上的 {len(wrongly_moved)} 个")
+
+    # 3. 恢复
+    servers[PORTS[1]] = await start_server(PORTS[1])
+    await service.pool.check_health()
+    after = await route_sessions(service)
+    summarize(f"{down} 恢复", after)
+    returned = sum(1 for s in before if before[s] == after[s])
+    print(f"  回到原后端的会话 {returned}/{len(before)}")
+
+    # 4. 无会话 ID 的并发请求
+    start = time.perf_counter()
+    responses = await asyncio.gather(
+        *(service.call([HumanMessage(content="你好")]) for _ in range(90))
+    )
+    elapsed = time.perf_counter() - start
+    print(f"无亲和并发请求 90 个: {dict(sorted(Counter(r.content for r in responses).items()))}  {elapsed:.2f}s")
+
+    for server, task in servers.values():
+        await stop_server(server, task)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
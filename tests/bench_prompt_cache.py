@@ -0,0 +1,139 @@
+"""提示词前缀缓存基准测试
+
+模拟一段 30 轮对话（每轮检索到的记忆都不同），对比两种提示词布局下
+Ollama 每轮需要重新 prefill 的 token 数（prompt_eval_count）与耗时（prompt_eval_duration）：
+
+- 旧布局：记忆拼在首条系统消息里
+- 新布局：静态系统提示词 + 历史 + 最新用户消息 + 记忆消息（build_prompt_messages）
+
+默认启动一个模拟 Ollama 的本地服务：按字符计 token，保留上一次请求的提示词，
+只对与之不同的后缀计 prompt_eval_count，近似 Ollama 的前缀 KV 缓存复用。
+
+运行:
+    python -m tests.bench_prompt_cache
+    python -m tests.bench_prompt_cache http://localhost:11434 qwen2.5:3b   # 使用真实 Ollama
+"""
+
+import asyncio
+import json
+import logging
+import sys
+from typing import Callable, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_ollama import ChatOllama
+
+from app.core.langgraph.graph import MEMORY_PROMPT, SYSTEM_PROMPT, build_prompt_messages
+
+HOST = "127.0.0.1"
+PORT = 18435
+TURNS = 30
+# 模拟的 prefill 速度（纳秒 / token）
+PREFILL_NS_PER_TOKEN = 200_000
+
+FACTS = [
+    "用户叫李雷，是一名后端工程师",
+    "用户住在杭州",
+    "用户喜欢爬山，但膝盖不太好",
+    "用户的女儿今年上小学一年级",
+    "用户习惯晚上十点后陪女儿读书",
+    "用户正在学习 Rust",
+    "用户不喝咖啡",
+]
+
+fake_app = FastAPI()
+# 每个模型一个缓存槽位，保存上一次的提示词
+kv_cache: dict = {}
+
+
+def render(messages: List[dict]) -> str:
+    return "".join(f"<|{m['role']}|>{m.get('content', '')}<|end|>" for m in messages)
+
+
+@fake_app.post("/api/chat")
+async def chat(request: Request):
+    payload = await request.json()
+    prompt = render(payload["messages"])
+    cached = kv_cache.get(payload["model"], "")
+    common = 0
+    for a, b in zip(prompt, cached):
+        if a != b:
+            break
+        common += 1
+    kv_cache[payload["model"]] = prompt
+    evaluated = len(prompt) - common
+
+    def body():
+        yield json.dumps({
+            "model": payload["model"],
+            "created_at": "2025-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": "好的，我记住了。"},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": evaluated,
+            "prompt_eval_duration": evaluated * PREFILL_NS_PER_TOKEN,
+            "eval_count": 8,
+        }) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+def legacy_layout(messages: List[BaseMessage], long_term_memory: str) -> List[BaseMessage]:
+    """旧布局：记忆嵌入首条系统消息"""
+    system_prompt = SYSTEM_PROMPT + "\n" + MEMORY_PROMPT.format(
+        long_term_memory=long_term_memory or "暂无记忆"
+    )
+    return [SystemMessage(content=system_prompt)] + list(messages)
+
+
+def memories_for(turn: int) -> str:
+    """模拟每轮不同的检索结果"""
+    picked = [FACTS[(turn * 3 + k) % len(FACTS)] for k in range(turn % 3 + 1)]
+    return "用户相关信息：\n" + "\n".join(f"- {fact}" for fact in picked)
+
+
+async def run(name: str, llm: ChatOllama, layout: Callable) -> None:
+    history: List[BaseMessage] = []
+    counts, durations = [], []
+    for turn in range(TURNS):
+        history.append(HumanMessage(content=f"第 {turn + 1} 个问题：请结合我的情况给点建议，越具体越好。"))
+        response = await llm.ainvoke(layout(history, memories_for(turn)))
+        history.append(AIMessage(content=response.content))
+        counts.append(response.response_metadata.get("prompt_eval_count", 0))
+        durations.append(response.response_metadata.get("prompt_eval_duration", 0) / 1e6)
+
+    print(f"{name}")
+    print("  每轮 prompt_eval_count:", counts)
+    print(
+        f"  合计 {sum(counts)} tokens / {sum(durations):.0f} ms，"
+        f"后 10 轮平均 {sum(counts[-10:]) / 10:.0f} tokens / {sum(durations[-10:]) / 10:.1f} ms"
+    )
+
+
+async def main():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = None
+    if len(sys.argv) > 2:
+        base_url, model = sys.argv[1], sys.argv[2]
+    else:
+        base_url, model = f"http://{HOST}:{PORT}", "fake"
+        server = uvicorn.Server(uvicorn.Config(fake_app, host=HOST, port=PORT, log_level="warning"))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+    llm = ChatOllama(model=model, base_url=base_url, num_predict=64)
+    await run("旧布局（记忆在首条系统消息）", llm, legacy_layout)
+    kv_cache.clear()
+    await run("新布局（记忆紧跟最新用户消息）", llm, build_prompt_messages)
+
+    if server is not None:
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
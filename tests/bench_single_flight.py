@@ -0,0 +1,73 @@
+"""并发请求合并基准测试
+
+模拟前端在聚焦、切换标签页、重连时对同一接口的突发请求（不连数据库）：
+USERS 个用户，每个用户每隔一段时间同时发出 BURST 个相同请求，每次读取耗时 READ_MS。
+对比直接读取与 SingleFlight（只合并并发请求 / 再加微 TTL 复用结果），统计：
+  - 实际读取次数与合并率
+  - 请求延迟 p50 / p99
+
+运行: python -m tests.bench_single_flight [用户数] [每次突发的请求数]
+"""
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+from app.utils.cache import LRUCache
+from app.utils.singleflight import SingleFlight
+
+ROUNDS = 20
+READ_MS = 20
+# 每轮突发之间的间隔，以及同一次突发内请求到达时间的抖动
+ROUND_INTERVAL = 0.2
+JITTER = 0.03
+
+
+async def run(users: int, burst: int, flight: SingleFlight = None) -> tuple:
+    reads = 0
+    latencies = []
+
+    async def read(user: int) -> list:
+        nonlocal reads
+        reads += 1
+        await asyncio.sleep(READ_MS / 1000)
+        return [user]
+
+    async def request(user: int) -> None:
+        await asyncio.sleep(random.uniform(0, JITTER))
+        start = time.perf_counter()
+        if flight is None:
+            await read(user)
+        else:
+            await flight.do(user, lambda: read(user))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    for _ in range(ROUNDS):
+        await asyncio.gather(*(request(user) for user in range(users) for _ in range(burst)))
+        await asyncio.sleep(ROUND_INTERVAL)
+    latencies.sort()
+    return reads, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    burst = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    total = users * burst * ROUNDS
+    print(f"{users} 个用户，每次突发 {burst} 个相同请求，{ROUNDS} 轮，共 {total} 个请求，每次读取 {READ_MS} ms")
+
+    cases = [
+        ("直接读取", None),
+        ("合并并发", SingleFlight("bench")),
+        ("合并 + 1s 复用", SingleFlight("bench_ttl", cache=LRUCache(max_size=users * 2, ttl=1.0))),
+    ]
+    for label, flight in cases:
+        random.seed(0)
+        reads, p50, p99 = asyncio.run(run(users, burst, flight))
+        rate = flight.stats()["coalescing_rate"] if flight is not None else 0.0
+        print(f"  {label}: 读取 {reads} 次，合并率 {rate:.1%}，延迟 p50 {p50:.1f} ms，p99 {p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
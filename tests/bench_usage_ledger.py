@@ -0,0 +1,114 @@
+"""Token 用量记账基准测试
+
+需要配置好的 Postgres（会创建 token_usage 表，并写入一个临时用户）。
+
+1. 配额检查延迟：UsageLedger.check（内存）对比每次调用都查询 token_usage
+2. 多 worker 一致性：启动 N 个进程，各自持有一个 UsageLedger，对同一用户不断 check + record，
+   直到全部被拒绝；统计实际写入的总量超出每日配额多少
+
+运行: python -m tests.bench_usage_ledger [进程数] [刷写周期秒]
+"""
+
+import asyncio
+import multiprocessing
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlmodel import delete
+
+from app.models.usage import TokenUsage
+from app.models.user import User
+from app.services.database import db
+from app.services.usage import QuotaExceededError, UsageLedger
+
+DAILY_LIMIT = 200_000
+CALLS = 2000
+# 模拟一次 LLM 调用的用量与耗时
+PROMPT_TOKENS, COMPLETION_TOKENS = 600, 200
+CALL_SECONDS = 0.02
+
+
+def bench_check(user_id: uuid.UUID) -> None:
+    ledger = UsageLedger(daily_limit=10**12)
+    ledger.check(user_id)  # 首次加载快照
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        ledger.check(user_id)
+    memory_us = (time.perf_counter() - start) / CALLS * 1e6
+
+    today = datetime.now(timezone.utc).date()
+    start = time.perf_counter()
+    for _ in range(CALLS // 10):
+        db.get_token_totals([user_id], today)
+    db_us = (time.perf_counter() - start) / (CALLS // 10) * 1e6
+    print(f"配额检查: 内存 {memory_us:.1f} µs/次，每次查库 {db_us:.0f} µs/次")
+
+
+def worker(user_id: uuid.UUID, flush_interval: float, results) -> None:
+    # 不复用父进程的连接
+    db.engine.dispose(close=False)
+
+    async def run():
+        ledger = UsageLedger(daily_limit=DAILY_LIMIT, flush_interval=flush_interval)
+        ledger.start()
+        allowed = 0
+        while True:
+            try:
+                ledger.check(user_id)
+            except QuotaExceededError:
+                break
+            await asyncio.sleep(CALL_SECONDS)
+            ledger.record(user_id, PROMPT_TOKENS, COMPLETION_TOKENS)
+            allowed += 1
+        await ledger.stop()
+        results.append(allowed)
+
+    asyncio.run(run())
+
+
+def bench_workers(processes: int, flush_interval: float) -> User:
+    user = db.create_user(f"bench-{uuid.uuid4().hex[:8]}@example.com", "x")
+    with multiprocessing.Manager() as manager:
+        results = manager.list()
+        procs = [
+            multiprocessing.Process(target=worker, args=(user.id, flush_interval, results))
+            for _ in range(processes)
+        ]
+        start = time.perf_counter()
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - start
+        calls = list(results)
+
+    used, _ = UsageLedger().usage(user.id)
+    per_call = PROMPT_TOKENS + COMPLETION_TOKENS
+    print(
+        f"{processes} 个 worker，刷写周期 {flush_interval}s：耗时 {elapsed:.1f}s，"
+        f"调用 {sum(calls)} 次（各 worker {calls}，中位数 {statistics.median(calls):.0f}）"
+    )
+    print(
+        f"  配额 {DAILY_LIMIT}，实际写入 {used}，超出 {used - DAILY_LIMIT}"
+        f"（约 {(used - DAILY_LIMIT) / per_call:.0f} 次调用）"
+    )
+    return user
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    flush_interval = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+    db.create_tables()
+    user = bench_workers(processes, flush_interval)
+    bench_check(user.id)
+    with db.get_session() as session:
+        session.exec(delete(TokenUsage).where(TokenUsage.user_id == user.id))
+        session.exec(delete(User).where(User.id == user.id))
+        session.commit()
+
+
+if __name__ == "__main__":
+    main()
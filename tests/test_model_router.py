@@ -0,0 +1,79 @@
+"""测试模型升级时的流式输出（不连 Ollama）
+
+小模型把工具调用写进正文 → 升级到大模型；客户端只应收到大模型的回复，
+不应先收到小模型的半截输出。小模型的回复被接受时仍作为整条消息输出。
+
+运行: python -m pytest tests/test_model_router.py
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from app.core.langgraph.model_router import ModelRouter
+from app.services.llm import LLMService
+
+SMALL_REPLY = '<tool_call> {"name": "calculate", "arguments": {"expression": "1+1"}} </tool_call>'
+LARGE_REPLY = "1 + 1 等于 2。"
+
+
+def build_service(replies: dict) -> LLMService:
+    """LLMService 的调用链，模型换成按名字返回固定回复的假模型"""
+    service = LLMService()
+    backend = SimpleNamespace(url="http://fake")
+
+    @asynccontextmanager
+    async def acquire(_):
+        yield backend
+
+    service.pool = SimpleNamespace(acquire=acquire)
+    service._get_llm = lambda url, model=None, **_: GenericFakeChatModel(
+        messages=iter([AIMessage(content=replies[model])])
+    )
+    return service
+
+
+async def stream_turn(router: ModelRouter, service: LLMService, text: str) -> str:
+    async def chat(state: MessagesState):
+        response = await router.call(
+            state["messages"],
+            lambda model, stream: service.call(state["messages"], model=model, stream=stream),
+        )
+        return {"messages": [response]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("chat", chat)
+    builder.add_edge(START, "chat")
+    builder.add_edge("chat", END)
+    graph = builder.compile()
+
+    streamed = []
+    async for token, _ in graph.astream({"messages": [HumanMessage(content=text)]}, stream_mode="messages"):
+        streamed.append(token.content)
+    return "".join(streamed)
+
+
+def test_escalation_streams_only_accepted_reply():
+    router = ModelRouter(["small", "large"], min_confidence=0.0)
+    service = build_service({"small": SMALL_REPLY, "large": LARGE_REPLY})
+    streamed = asyncio.run(stream_turn(router, service, "1+1"))
+    assert router.escalations == 1
+    assert streamed == LARGE_REPLY
+
+
+def test_accepted_small_reply_is_streamed_once():
+    router = ModelRouter(["small", "large"], min_confidence=0.0)
+    service = build_service({"small": "你好！", "large": LARGE_REPLY})
+    streamed = asyncio.run(stream_turn(router, service, "你好"))
+    assert router.escalations == 0
+    assert streamed == "你好！"
+
+
+if __name__ == "__main__":
+    test_escalation_streams_only_accepted_reply()
+    test_accepted_small_reply_is_streamed_once()
+    print("✅ 升级时只输出被接受的回复")